@@ -0,0 +1,97 @@
+import json
+import os
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+def _env_json(name: str, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return default
+
+# Version history retention (0 disables the byte/age limits)
+VERSION_MAX_COUNT = _env_int("BPMN_VERSION_MAX_COUNT", 50)
+VERSION_MAX_BYTES = _env_int("BPMN_VERSION_MAX_BYTES", 16 * 1024 * 1024)
+VERSION_MAX_AGE_SECONDS = _env_int("BPMN_VERSION_MAX_AGE_SECONDS", 0)
+VERSION_KEYFRAME_INTERVAL = _env_int("BPMN_VERSION_KEYFRAME_INTERVAL", 10)
+# Element indexes of versions kept for diffs, keyed by content hash
+VERSION_INDEX_CACHE_SIZE = _env_int("BPMN_VERSION_INDEX_CACHE_SIZE", 32)
+
+# Per-room history ring buffers (rooms may override)
+LOG_HISTORY_SIZE = _env_int("BPMN_LOG_HISTORY_SIZE", 50)
+CHAT_HISTORY_SIZE = _env_int("BPMN_CHAT_HISTORY_SIZE", 100)
+# e.g. {"town-hall": {"logs": 200, "chat": 1000}}
+ROOM_HISTORY_SIZES = _env_json("BPMN_ROOM_HISTORY_SIZES", {})
+
+# Diagram analysis
+SUMMARY_CACHE_SIZE = _env_int("BPMN_SUMMARY_CACHE_SIZE", 256)
+
+# XML ingestion limits (0 disables a limit); request bodies and socket messages carry
+# JSON-escaped XML, so their limit defaults to twice the XML limit
+MAX_XML_BYTES = _env_int("BPMN_MAX_XML_BYTES", 16 * 1024 * 1024)
+MAX_XML_DEPTH = _env_int("BPMN_MAX_XML_DEPTH", 256)
+MAX_REQUEST_BYTES = _env_int("BPMN_MAX_REQUEST_BYTES", 2 * MAX_XML_BYTES)
+
+# CPU-heavy diagram work: "thread", "process" or "inline" (run on the event loop)
+WORKER_POOL_KIND = os.environ.get("BPMN_WORKER_POOL", "thread")
+WORKER_POOL_SIZE = _env_int("BPMN_WORKER_POOL_SIZE", min(4, os.cpu_count() or 1))
+WORKER_QUEUE_LIMIT = _env_int("BPMN_WORKER_QUEUE_LIMIT", 32)
+# Diagrams of one bulk summary request analyzed at the same time
+BULK_CONCURRENCY = _env_int("BPMN_BULK_CONCURRENCY", WORKER_POOL_SIZE)
+
+# Encoded broadcast payloads kept for reuse, keyed by (room, event, revision)
+BROADCAST_CACHE_SIZE = _env_int("BPMN_BROADCAST_CACHE_SIZE", 128)
+
+# Prometheus /metrics endpoint and per-event timing (off by default; disabled costs nothing)
+METRICS_ENABLED = _env_int("BPMN_METRICS", 0)
+METRICS_LOOP_LAG_INTERVAL_MS = _env_int("BPMN_METRICS_LOOP_LAG_INTERVAL_MS", 250)
+
+# Per-connection outbound queues for slow consumers (0 messages disables them)
+OUTBOUND_MAX_MESSAGES = _env_int("BPMN_OUTBOUND_MAX_MESSAGES", 256)
+OUTBOUND_MAX_BYTES = _env_int("BPMN_OUTBOUND_MAX_BYTES", 8 * 1024 * 1024)
+# Engine.IO packets waiting for the transport before a connection counts as congested
+OUTBOUND_CONGESTION_PACKETS = _env_int("BPMN_OUTBOUND_CONGESTION_PACKETS", 16)
+OUTBOUND_POLL_MS = _env_int("BPMN_OUTBOUND_POLL_MS", 20)
+
+# Presence fan-out
+PRESENCE_TICK_HZ = _env_int("BPMN_PRESENCE_TICK_HZ", 30)
+PRESENCE_DEBOUNCE_MS = _env_int("BPMN_PRESENCE_DEBOUNCE_MS", 100)
+
+# update_diagram bursts from one connection are squashed into one commit (0 ms commits each at once)
+COMMIT_WINDOW_MS = _env_int("BPMN_COMMIT_WINDOW_MS", 100)
+COMMIT_MAX_LATENCY_MS = _env_int("BPMN_COMMIT_MAX_LATENCY_MS", 500)
+
+# Activity log: repeats within a flush window collapse into one entry. Levels per category
+# (edit, presence, sync) are "off", "collapsed" (default) or "all", e.g. {"presence": "off"}
+ACTIVITY_FLUSH_MS = _env_int("BPMN_ACTIVITY_FLUSH_MS", 1000)
+ACTIVITY_LEVELS = _env_json("BPMN_ACTIVITY_LEVELS", {})
+
+# Search index over elements, chat and activity of open rooms (0 = no document limit)
+SEARCH_MAX_DOCUMENTS = _env_int("BPMN_SEARCH_MAX_DOCUMENTS", 500_000)
+SEARCH_REFRESH_MS = _env_int("BPMN_SEARCH_REFRESH_MS", 500)
+
+# Element locks
+LOCK_LEASE_SECONDS = _env_int("BPMN_LOCK_LEASE_SECONDS", 60)
+LOCK_SWEEP_INTERVAL_SECONDS = _env_int("BPMN_LOCK_SWEEP_INTERVAL_SECONDS", 5)
+
+# Persistence: "none", "memory" or "sqlite"
+STORAGE_BACKEND = os.environ.get("BPMN_STORAGE", "none")
+STORAGE_PATH = os.environ.get("BPMN_STORAGE_PATH", "bpmn_state.db")
+STORAGE_FLUSH_INTERVAL_MS = _env_int("BPMN_STORAGE_FLUSH_INTERVAL_MS", 500)
+STORAGE_SNAPSHOT_EVERY_OPS = _env_int("BPMN_STORAGE_SNAPSHOT_EVERY_OPS", 200)
+
+# Cluster mode: "node-a=http://host:8001,node-b=http://host:8002" (empty disables)
+CLUSTER_NODES = os.environ.get("BPMN_CLUSTER_NODES", "")
+CLUSTER_NODE_ID = os.environ.get("BPMN_NODE_ID", "")
+# "memory" (single process) or "tcp://host:port" (python -m app.services.cluster)
+CLUSTER_BUS = os.environ.get("BPMN_CLUSTER_BUS", "memory")
@@ -1,135 +1,367 @@
 import asyncio
 from app.services.user_manager import user_manager
-from app.services.diagram_state import diagram_state
-from app.models import DiagramUpdatePayload, LockPayload, ChatMessagePayload, CursorPositionPayload, EditingPayload
-from app.utils import log_and_broadcast
+from app.services.room_manager import room_manager, DEFAULT_ROOM
+from app.services.diagram_patch import PatchError, apply_patch
+from app.services.workers import worker_pool, WorkerPoolSaturated
+from app.services.xml_ingest import XMLRejected, check_prolog
+from app.services.activity import EDIT, PRESENCE, SYNC
+from app.services.cluster import cluster
+from app.services.metrics import metrics
+from app import config
+from app.models import DiagramUpdatePayload, DiagramPatchPayload, LockPayload, ChatMessagePayload, CursorPositionPayload, EditingPayload, VersionsQueryPayload, VersionPayload, VersionDiffPayload, HistoryQueryPayload
+from app.utils import broadcast_event, broadcast_cache, broadcast_once
 from socketio import AsyncServer
+from socketio.exceptions import ConnectionRefusedError
 
-def get_username_from_request(sid, environ, auth):
-    username = (auth or {}).get("username") or environ.get("HTTP_USERNAME")
-    if not username:
+def _request_value(environ, auth, key, header):
+    value = (auth or {}).get(key) or environ.get(header)
+    if not value:
         from urllib.parse import parse_qs
         qs = parse_qs(environ.get("QUERY_STRING", ""))
-        username = qs.get("username", [None])[0]
+        value = qs.get(key, [None])[0]
+    return value
+
+def get_username_from_request(sid, environ, auth):
+    username = _request_value(environ, auth, "username", "HTTP_USERNAME")
     return username or f"User-{sid[:5]}"
 
-async def send_initial_state(sio, sid):
-    all_users = list(dict.fromkeys(user_manager.online_users.values()))
-    await sio.emit("user_update", all_users, to=sid, namespace="/")
-    await sio.emit("user_update", all_users, namespace="/")
-    
-    if diagram_state.xml:
-        await sio.emit("diagram_update", {"xml": diagram_state.xml}, to=sid, namespace="/")
-    if diagram_state.locks:
-        await sio.emit("locks_update", diagram_state.locks, to=sid, namespace="/")
-    if diagram_state.chat:
-        await sio.emit("chat_history", diagram_state.chat, to=sid, namespace="/")
-    if diagram_state.logs:
-        await sio.emit("activity_log", diagram_state.logs, to=sid, namespace="/")
+def get_room_from_request(environ, auth):
+    room_id = _request_value(environ, auth, "room", "HTTP_ROOM")
+    return room_id or DEFAULT_ROOM
+
+def presence_emitter(sio, room):
+    async def emit(batch):
+        await sio.emit("cursor_batch", batch, room=room.room_id, namespace="/")
+    return emit
+
+def user_delta_emitter(sio, room):
+    # Joins and leaves since the last broadcast, so a join costs O(1) instead of an O(N) list
+    async def emit():
+        delta = room.users.drain_delta()
+        if delta is not None:
+            await sio.emit("users_delta", delta, room=room.room_id, namespace="/")
+    return emit
+
+def activity_emitter(sio, room):
+    async def emit(entries):
+        await sio.emit("activity_log_batch", entries, room=room.room_id, namespace="/")
+    return emit
+
+def diagram_committer(sio, room):
+    # Commits one squashed burst of update_diagram calls and broadcasts it once
+    async def commit(batch):
+        revision, error = await room.commit_diagram(batch.xml, batch.author)
+        if revision is None:
+            await broadcast_event(sio, "diagram_update", encoded_diagram(room).extend({"resync": True}), to=batch.sender)
+            return None, error
+        await broadcast_once(sio, room.room_id, "diagram_update", revision,
+                             lambda: {"xml": batch.xml, "revision": revision}, skip_sid=batch.sender)
+        room.activity.record(EDIT, batch.author, "updated diagram")
+        return revision, None
+    return commit
+
+def encoded_initial_state(room):
+    state = room.state
+    base = broadcast_cache.encode(room.room_id, "initial_state", state.snapshot_version,
+                                  lambda: {**state.initial_state(), "room": room.room_id})
+    return base.extend({"users": room.users.list_users(), "users_version": room.users.version})
+
+def encoded_diagram(room):
+    xml, revision = room.state.document.snapshot()
+    return broadcast_cache.encode(room.room_id, "diagram_update", revision,
+                                  lambda: {"xml": xml, "revision": revision})
+
+async def send_initial_state(sio, sid, room):
+    await broadcast_event(sio, "initial_state", encoded_initial_state(room), to=sid)
+
+async def resync_client(sio, eio_sid):
+    # Replaces whatever a slow client missed with one fresh snapshot
+    sid = sio.manager.sid_from_eio_sid(eio_sid, "/")
+    room = room_manager.get_room(sid) if sid else None
+    if room is not None:
+        await send_initial_state(sio, sid, room)
+
+async def resend_presence(sio, eio_sid):
+    sid = sio.manager.sid_from_eio_sid(eio_sid, "/")
+    room = room_manager.get_room(sid) if sid else None
+    if room is not None:
+        await sio.emit("cursor_batch", room.presence.snapshot(), to=sid, namespace="/")
+
+async def expire_locks(sio, interval: float = None):
+    interval = config.LOCK_SWEEP_INTERVAL_SECONDS if interval is None else interval
+    while True:
+        await asyncio.sleep(interval)
+        for room in list(room_manager.rooms.values()):
+            delta = room.state.lock_manager.expire()
+            if delta:
+                await sio.emit("locks_delta", delta, room=room.room_id, namespace="/")
 
 def register_events(sio: AsyncServer):
     @sio.event(namespace="/")
     async def connect(sid, environ, auth=None):
+        room_id = get_room_from_request(environ, auth)
+        if cluster is not None and not cluster.owns(room_id):
+            raise ConnectionRefusedError({
+                "message": "Room is hosted on another node",
+                "node": cluster.owner(room_id),
+                "redirect": cluster.owner_url(room_id)
+            })
         try:
             username = get_username_from_request(sid, environ, auth)
-            
-            if sid in user_manager.online_users:
-                user_manager.remove_user(sid)
-            
             user_manager.add_user(sid, username)
-            await asyncio.sleep(0.1)
-            await send_initial_state(sio, sid)
-            await log_and_broadcast(sio, f"{username} connected")
+            opened = await room_manager.open(room_id)
+            if not sio.manager.is_connected(sid, "/"):
+                # Disconnected while the room was hydrating; disconnect found nothing to leave
+                user_manager.remove_user(sid)
+                if opened.is_empty() and room_manager.get(room_id) is opened:
+                    room_manager.remove_room(room_id)
+                return
+            room = room_manager.join(sid, room_id, username)
+            room.presence.attach(presence_emitter(sio, room))
+            room.user_updates.attach(user_delta_emitter(sio, room))
+            room.commits.attach(diagram_committer(sio, room))
+            room.activity.attach(activity_emitter(sio, room))
+            await sio.enter_room(sid, room.room_id, namespace="/")
+            await send_initial_state(sio, sid, room)
+            room.user_updates.trigger()
+            room.activity.record(PRESENCE, username, "connected")
         except Exception:
             pass
 
     @sio.event(namespace="/")
     async def disconnect(sid):
-        username = user_manager.remove_user(sid)
-        
-        elements_to_unlock = diagram_state.clear_locks_by_user(username)
-        if elements_to_unlock:
-            await sio.emit("locks_update", diagram_state.locks, namespace="/")
-        
-        all_users = list(dict.fromkeys(user_manager.online_users.values()))
-        await sio.emit("user_update", all_users, namespace="/")
-        await log_and_broadcast(sio, f"{username} disconnected")
-        
-        if len(user_manager.online_users) == 0:
-            diagram_state.reset()
-            await log_and_broadcast(sio, "Diagram reset - all users disconnected")
+        user_manager.remove_user(sid)
+        room, username = room_manager.leave(sid)
+        if room is None:
+            return
+
+        if not room.users.is_online(username):
+            room.presence.remove_user(username)
+            delta = room.state.lock_manager.release_user(username)
+            if delta:
+                await sio.emit("locks_delta", delta, room=room.room_id, namespace="/")
+
+        room.user_updates.trigger()
+        room.activity.record(PRESENCE, username, "disconnected")
+
+        if room.is_empty():
+            # The last editor's squashed updates still land before the room goes away
+            await room.commits.flush()
+        if room.is_empty() and room_manager.get(room.room_id) is room:
+            room_manager.remove_room(room.room_id)
 
     @sio.event(namespace="/")
     async def update_diagram(sid, data):
         try:
+            room = room_manager.get_room(sid)
             payload = DiagramUpdatePayload(**data)
-            user = user_manager.get_username(sid)
-            diagram_state.xml = payload.xml
-            diagram_state.save_version()
-            await sio.emit("diagram_update", {"xml": diagram_state.xml}, skip_sid=sid, namespace="/")
-            await log_and_broadcast(sio, f"{user} updated diagram", skip_sid=sid)
+            try:
+                check_prolog(payload.xml)
+            except XMLRejected as e:
+                return {"ok": False, "error": str(e), "revision": room.state.revision}
+            user = room.users.get_username(sid)
+            # Resolves once the burst this update belongs to is committed
+            revision, error = await room.commits.submit(sid, user, payload.xml)
+            if revision is None:
+                return {"ok": False, "error": error, "revision": room.state.revision}
+            return {"ok": True, "revision": revision}
+        except WorkerPoolSaturated:
+            return {"ok": False, "error": "Server busy", "retry": True, "revision": room.state.revision}
         except Exception:
             pass
 
+    @sio.event(namespace="/")
+    async def patch_diagram(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return {"ok": False, "error": "Not in a room"}
+        try:
+            payload = DiagramPatchPayload(**data)
+        except Exception:
+            return {"ok": False, "error": "Invalid patch"}
+
+        # Squashed full updates still pending land first, so the base revision check sees them
+        await room.commits.flush()
+        state = room.state
+        user = room.users.get_username(sid)
+        added = [item.model_dump() for item in payload.added]
+        changed = [item.model_dump() for item in payload.changed]
+        revision = None
+        error = "Stale revision"
+        if payload.base_revision == state.revision:
+            try:
+                blocked = await room.locked_by_others(user, [item["id"] for item in changed], payload.removed)
+                if blocked:
+                    element_id, holder = next(iter(blocked.items()))
+                    error = f"Element '{element_id}' is locked by {holder}"
+                else:
+                    xml = await worker_pool.run(apply_patch, state.xml, added, changed, payload.removed)
+                    revision = state.commit(xml, user, expected_revision=payload.base_revision, save_version=True,
+                                            patch=(added, changed, payload.removed))
+            except WorkerPoolSaturated:
+                return {"ok": False, "error": "Server busy", "retry": True, "revision": state.revision}
+            except PatchError as e:
+                error = str(e)
+
+        if revision is None:
+            await broadcast_event(sio, "diagram_update", encoded_diagram(room).extend({"resync": True}), to=sid)
+            return {"ok": False, "error": error, "revision": state.revision}
+
+        await sio.emit("diagram_patch", {
+            "username": user,
+            "base_revision": payload.base_revision,
+            "revision": revision,
+            "added": added,
+            "changed": changed,
+            "removed": payload.removed
+        }, room=room.room_id, skip_sid=sid, namespace="/")
+        room.activity.record(EDIT, user, "updated diagram")
+        return {"ok": True, "revision": revision}
+
+    @sio.event(namespace="/")
+    async def ping(sid, data=None):
+        return data
+
     @sio.event(namespace="/")
     async def lock_element(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
         payload = LockPayload(**data)
-        user = user_manager.get_username(sid)
-        diagram_state.lock_element(payload.element_id, user)
-        await sio.emit("element_locked", {"element_id": payload.element_id, "locked_by": user}, skip_sid=sid, namespace="/")
-        await sio.emit("locks_update", diagram_state.locks, skip_sid=sid, namespace="/")
+        user = room.users.get_username(sid)
+        locks = room.state.lock_manager
+        granted, delta = locks.acquire(payload.element_id, user)
+        if delta:
+            await sio.emit("locks_delta", delta, room=room.room_id, namespace="/")
+        return {"ok": granted, "locked_by": locks.holder(payload.element_id), "epoch": locks.epoch}
 
     @sio.event(namespace="/")
     async def unlock_element(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
         payload = LockPayload(**data)
-        user = user_manager.get_username(sid)
-        diagram_state.unlock_element(payload.element_id)
-        await sio.emit("element_unlocked", {"element_id": payload.element_id}, skip_sid=sid, namespace="/")
-        await sio.emit("locks_update", diagram_state.locks, skip_sid=sid, namespace="/")
+        user = room.users.get_username(sid)
+        locks = room.state.lock_manager
+        delta = locks.release(payload.element_id, user)
+        if delta:
+            await sio.emit("locks_delta", delta, room=room.room_id, namespace="/")
+        return {"ok": locks.holder(payload.element_id) is None, "epoch": locks.epoch}
+
+    @sio.event(namespace="/")
+    async def renew_locks(sid):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        renewed = room.state.lock_manager.renew(room.users.get_username(sid))
+        return {"renewed": renewed}
+
+    @sio.event(namespace="/")
+    async def get_locks(sid):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        snapshot = room.state.lock_manager.snapshot()
+        await sio.emit("locks_update", snapshot, to=sid, namespace="/")
+        return snapshot
+
+    @sio.event(namespace="/")
+    async def get_activity_log(sid, data=None):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        if data is None:
+            await sio.emit("activity_log", room.state.logs, to=sid, namespace="/")
+            return
+        query = HistoryQueryPayload(**data)
+        return room.state.logs_after(query.after, query.limit)
+
+    @sio.event(namespace="/")
+    async def get_chat_history(sid, data=None):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        query = HistoryQueryPayload(**(data or {}))
+        return room.state.chat_after(query.after, query.limit)
 
     @sio.event(namespace="/")
-    async def get_activity_log(sid):
-        await sio.emit("activity_log", diagram_state.logs, to=sid, namespace="/")
+    async def get_versions(sid, data=None):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        query = VersionsQueryPayload(**(data or {}))
+        await sio.emit("diagram_versions", room.state.get_versions(query.offset, query.limit), to=sid, namespace="/")
 
     @sio.event(namespace="/")
-    async def get_versions(sid):
-        await sio.emit("diagram_versions", diagram_state.versions, to=sid)
+    async def get_version(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        payload = VersionPayload(**data)
+        try:
+            version = await room.version(payload.version)
+        except WorkerPoolSaturated:
+            version = {"version": payload.version, "error": "Server busy", "retry": True}
+        await sio.emit("diagram_version", version or {"version": payload.version, "error": "Version not found"}, to=sid, namespace="/")
+
+    @sio.event(namespace="/")
+    async def diff_versions(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        payload = VersionDiffPayload(**data)
+        try:
+            diff = await room.version_diff(payload.version, payload.to)
+        except WorkerPoolSaturated:
+            return {"from": payload.version, "to": payload.to, "error": "Server busy", "retry": True}
+        return diff or {"from": payload.version, "to": payload.to, "error": "Version not found"}
 
     @sio.event(namespace="/")
     async def get_users(sid):
-        users = list(dict.fromkeys(user_manager.online_users.values()))
-        await sio.emit("user_update", users, to=sid, namespace="/")
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        await sio.emit("user_update", room.users.list_users(), to=sid, namespace="/")
+        # The ack carries the version clients resume applying users_delta from
+        return {"users": room.users.list_users(), "version": room.users.version}
 
     @sio.event(namespace="/")
     async def sync_diagram(sid):
-        if diagram_state.xml:
-            await sio.emit("diagram_update", {"xml": diagram_state.xml}, namespace="/")
-            user = user_manager.get_username(sid)
-            await log_and_broadcast(sio, f"{user} synced diagram for all users")
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
+        await room.commits.flush()
+        if room.state.xml:
+            await broadcast_event(sio, "diagram_update", encoded_diagram(room), room=room.room_id)
+            user = room.users.get_username(sid)
+            room.activity.record(SYNC, user, "synced diagram for all users")
 
     @sio.event(namespace="/")
     async def send_chat(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
         payload = ChatMessagePayload(**data)
-        user = user_manager.get_username(sid)
-        entry = diagram_state.add_chat_message(user, payload.message)
-        await sio.emit("receive_chat", entry, namespace="/")
+        user = room.users.get_username(sid)
+        entry = room.state.add_chat_message(user, payload.message)
+        await sio.emit("receive_chat", entry, room=room.room_id, namespace="/")
 
     @sio.event(namespace="/")
     async def cursor_move(sid, data):
+        room = room_manager.get_room(sid)
+        if room is None:
+            return
         payload = CursorPositionPayload(**data)
-        await sio.emit("cursor_update", {
-            "username": user_manager.get_username(sid),
-            "x": payload.x,
-            "y": payload.y
-        }, skip_sid=sid, namespace="/")
+        room.presence.update_cursor(room.users.get_username(sid), payload.x, payload.y)
 
     @sio.event(namespace="/")
     async def user_editing(sid, data):
         try:
+            room = room_manager.get_room(sid)
             payload = EditingPayload(**data)
-            await sio.emit("editing_update", {
-                "username": user_manager.get_username(sid),
-                "element_id": payload.element_id
-            }, skip_sid=sid, namespace="/")
+            room.presence.update_editing(room.users.get_username(sid), payload.element_id)
         except Exception:
             pass
+
+    if metrics.enabled:
+        metrics.instrument(sio)
@@ -1,13 +1,51 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
 import socketio
+import xml.etree.ElementTree as ET
 from app.services.user_manager import user_manager
-from app.services.diagram_summary import analyze_bpmn_diagram
-from app.events import register_events
+from app.services.room_manager import room_manager
+from app.services.diagram_summary import analyze_bpmn_diagram_async, analyze_bpmn_stream
+from app.services.bulk_analysis import analyze_bulk
+from app.services.xml_ingest import BodyLimitMiddleware, XMLTooLarge
+from app import config
+from app.services.workers import worker_pool, WorkerPoolSaturated
+from app.services.persistence import persistence
+from app.services.cluster import cluster, BusClientManager
+from app.services.metrics import metrics
+from app.services.outbound import outbound
+from app.services.search_index import KINDS, search_index
+from app.events import register_events, expire_locks, resync_client, resend_presence
+from app.utils import PayloadJSON, broadcast_cache
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
-app = FastAPI(title="BPMN Realtime Collaboration API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(expire_locks(sio))]
+    if persistence is not None:
+        tasks.append(asyncio.create_task(persistence.run()))
+        tasks.append(asyncio.create_task(search_index.index_stored(persistence, cluster.owns if cluster is not None else None)))
+    if metrics.enabled:
+        tasks.append(asyncio.create_task(metrics.watch_loop_lag()))
+    yield
+    for task in tasks:
+        task.cancel()
+    if persistence is not None:
+        await persistence.close()
+    worker_pool.shutdown()
+    if cluster is not None:
+        await cluster.bus.close()
+
+client_manager = BusClientManager(cluster.bus, owns=cluster.owns) if cluster is not None else None
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*", client_manager=client_manager, json=PayloadJSON,
+                           max_http_buffer_size=config.MAX_REQUEST_BYTES or 1_000_000)
+app = FastAPI(title="BPMN Realtime Collaboration API", lifespan=lifespan)
+# Added first so it runs inside CORS and its 413s still carry CORS headers
+app.add_middleware(BodyLimitMiddleware, exempt=("/api/summary/bulk",))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -20,25 +58,213 @@ asgi_app = socketio.ASGIApp(sio, app)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "users_online": len(user_manager.list_users())}
+    return {
+        "status": "ok",
+        "users_online": len(user_manager.list_users()),
+        "rooms": len(room_manager.rooms),
+        "node": cluster.node_id if cluster is not None else None
+    }
+
+metrics.gauge("bpmn_rooms", "Rooms open on this node", collect=lambda: len(room_manager.rooms))
+metrics.gauge("bpmn_connections", "Socket.IO connections joined to a room", collect=lambda: len(room_manager.sid_to_room))
+metrics.gauge("bpmn_users_online", "Distinct usernames online", collect=lambda: len(user_manager.list_users()))
+metrics.gauge("bpmn_version_store_bytes", "Compressed version history held in memory",
+              collect=lambda: sum(room.state.version_store.nbytes for room in room_manager.rooms.values()))
+metrics.gauge("bpmn_broadcast_cache_entries", "Encoded broadcast payloads cached", collect=lambda: len(broadcast_cache))
+metrics.gauge("bpmn_search_documents", "Documents in the search index", collect=lambda: len(search_index))
+metrics.gauge("bpmn_worker_pool_pending", "Diagram analyses queued or running", collect=lambda: worker_pool.pending)
+metrics.gauge("bpmn_outbound_queues", "Connections with messages held back", collect=lambda: len(outbound.queues))
+metrics.gauge("bpmn_outbound_queued_bytes", "Bytes held back for slow connections", collect=outbound.queued_bytes)
+metrics.counter("bpmn_outbound_dropped_total", "Messages dropped for slow connections", ("event",),
+                collect=lambda: {(event,): count for event, count in outbound.dropped.items()})
+metrics.counter("bpmn_outbound_coalesced_total", "Queued messages replaced by a newer one", ("event",),
+                collect=lambda: {(event,): count for event, count in outbound.coalesced.items()})
+metrics.counter("bpmn_outbound_resyncs_total", "Slow connections sent a fresh snapshot instead of their backlog",
+                collect=lambda: outbound.resyncs)
+metrics.counter("bpmn_outbound_disconnects_total", "Connections closed for staying over their outbound limit",
+                collect=lambda: outbound.disconnects)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/users")
 async def list_users():
     return {"users": user_manager.list_users()}
 
+@app.get("/rooms")
+async def list_rooms():
+    return {"rooms": room_manager.list_rooms()}
+
+@app.get("/api/rooms/{room_id}/owner")
+async def get_room_owner(room_id: str):
+    if cluster is None:
+        return {"room_id": room_id, "node": None, "url": None, "local": True}
+    return {
+        "room_id": room_id,
+        "node": cluster.owner(room_id),
+        "url": cluster.owner_url(room_id),
+        "local": cluster.owns(room_id)
+    }
+
+@app.get("/api/rooms/{room_id}/versions")
+async def list_versions(room_id: str, offset: int = 0, limit: int = 20):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room.state.get_versions(offset, limit)
+
+@app.get("/api/rooms/{room_id}/versions/{version}")
+async def get_version(room_id: str, version: int):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        entry = await room.version(version)
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return entry
+
+@app.get("/api/rooms/{room_id}/versions/{version}/diff")
+async def diff_versions(room_id: str, version: int, to: Optional[int] = None):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        diff = await room.version_diff(version, to)
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    if "error" in diff:
+        raise HTTPException(status_code=422, detail=diff["error"])
+    return diff
+
+@app.get("/api/search")
+async def search(q: str, kind: Optional[str] = None, room: Optional[str] = None, prefix: bool = True,
+                 offset: int = 0, limit: int = 20):
+    if kind is not None and kind not in KINDS:
+        raise HTTPException(status_code=422, detail=f"kind must be one of {', '.join(KINDS)}")
+    return await search_index.search(q, kind, room, prefix, offset, min(limit, 100))
+
+@app.get("/api/rooms/{room_id}/chat")
+async def get_chat_history(room_id: str, after: int = 0, limit: Optional[int] = None):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room.state.chat_after(after, limit)
+
+@app.get("/api/rooms/{room_id}/activity")
+async def get_activity_log(room_id: str, after: int = 0, limit: Optional[int] = None):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room.state.logs_after(after, limit)
+
+@app.get("/api/rooms/{room_id}/elements")
+async def list_elements(room_id: str, type: Optional[str] = None, process: Optional[str] = None,
+                        lane: Optional[str] = None, offset: int = 0, limit: int = 100):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        model, revision = await room.model()
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+    ids = model.query(type, process, lane)
+    return {
+        "revision": revision,
+        "total": len(ids),
+        "elements": [model.describe(element_id) for element_id in ids[offset:offset + limit]]
+    }
+
+@app.get("/api/rooms/{room_id}/elements/{element_id}")
+async def get_element(room_id: str, element_id: str):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        model, revision = await room.model()
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+    element = model.describe(element_id)
+    if element is None:
+        raise HTTPException(status_code=404, detail="Element not found")
+    return {**element, "revision": revision, "locked_by": room.state.lock_manager.holder(element_id)}
+
+@app.get("/api/rooms/{room_id}/summary")
+async def get_room_summary(room_id: str):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        return await room.summary()
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+
+@app.get("/api/rooms/{room_id}/graph")
+async def get_room_graph(room_id: str):
+    room = room_manager.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        model, graph, revision = await room.graph()
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
+    if not model.valid:
+        raise HTTPException(status_code=422, detail=model.error)
+    return {**graph, "revision": revision}
+
 class DiagramSummaryRequest(BaseModel):
     xml: str
 
 @app.post("/api/summary")
 async def get_diagram_summary(request: DiagramSummaryRequest):
+    if config.MAX_XML_BYTES and len(request.xml) > config.MAX_XML_BYTES:
+        raise HTTPException(status_code=413, detail="Diagram XML too large")
     try:
-        analysis = analyze_bpmn_diagram(request.xml)
+        analysis = await analyze_bpmn_diagram_async(request.xml)
         return analysis
+    except WorkerPoolSaturated:
+        raise HTTPException(status_code=503, detail="Diagram analysis is busy, please retry")
     except Exception as e:
         return {"summary": f"Error generating summary: {str(e)}", "error": True}
 
+@app.post("/api/summary/stream")
+async def stream_diagram_summary(request: Request):
+    # Raw XML body, parsed chunk by chunk as it arrives and never buffered whole
+    try:
+        return await analyze_bpmn_stream(request.stream())
+    except XMLTooLarge:
+        raise HTTPException(status_code=413, detail="Diagram XML too large")
+    except ET.ParseError as e:
+        return {"summary": f"Error parsing BPMN XML: {str(e)}", "error": True}
+
+class DuplexStreamingResponse(StreamingResponse):
+    # The body iterator reads the request while responding, so it must own receive();
+    # StreamingResponse would otherwise consume it to watch for disconnects. A disconnect
+    # still surfaces as ClientDisconnect from the request stream.
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+@app.post("/api/summary/bulk")
+async def bulk_diagram_summary(request: Request, concurrency: Optional[int] = None):
+    # NDJSON body of {"id", "xml"} objects; one result line per diagram as each finishes
+    return DuplexStreamingResponse(analyze_bulk(request.stream(), concurrency), media_type="application/x-ndjson")
+
 register_events(sio)
+# Installed after the metrics hooks so those count what actually leaves the queues
+outbound.on_overflow = lambda eio_sid: resync_client(sio, eio_sid)
+outbound.on_presence_lost = lambda eio_sid: resend_presence(sio, eio_sid)
+outbound.install(sio)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:asgi_app", host="127.0.0.1", port=8000, reload=True)
+    uvicorn.run("app.main:asgi_app", host="127.0.0.1", port=8000, reload=True, ws_per_message_deflate=True)
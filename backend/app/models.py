@@ -3,6 +3,17 @@ from pydantic import BaseModel
 class DiagramUpdatePayload(BaseModel):
     xml: str
 
+class ElementPatch(BaseModel):
+    id: str
+    xml: str
+    parent_id: str | None = None
+
+class DiagramPatchPayload(BaseModel):
+    base_revision: int
+    added: list[ElementPatch] = []
+    changed: list[ElementPatch] = []
+    removed: list[str] = []
+
 class LockPayload(BaseModel):
     element_id: str
 
@@ -14,4 +25,19 @@ class CursorPositionPayload(BaseModel):
     y: float
 
 class EditingPayload(BaseModel):
-    element_id: str | None = None
\ No newline at end of file
+    element_id: str | None = None
+
+class VersionsQueryPayload(BaseModel):
+    offset: int = 0
+    limit: int = 20
+
+class VersionPayload(BaseModel):
+    version: int
+
+class VersionDiffPayload(BaseModel):
+    version: int
+    to: int | None = None
+
+class HistoryQueryPayload(BaseModel):
+    after: int = 0
+    limit: int | None = None
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app import config
+from app.services.diagram_state import DiagramState
+from app.services.metrics import metrics
+
+OFF = "off"
+COLLAPSED = "collapsed"
+ALL = "all"
+
+LEVELS = (OFF, COLLAPSED, ALL)
+
+EDIT = "edit"
+PRESENCE = "presence"
+SYNC = "sync"
+
+FlushCallback = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+class ActivityPipeline:
+    # Activity is recorded as (category, actor, action) and only formatted when a window is
+    # flushed, so the hot path is one dict update. Within a window, repeats of the same actor
+    # and action collapse into one entry ("alice updated diagram ×37") at the position of the
+    # first. A category's level decides whether it is dropped, collapsed or kept entry by entry.
+    def __init__(self, state: DiagramState, flush_ms: int = None, levels: Dict[str, str] = None):
+        self.state = state
+        self.interval = (config.ACTIVITY_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        levels = config.ACTIVITY_LEVELS if levels is None else levels
+        self.levels = {category: level for category, level in levels.items() if level in LEVELS}
+        self.on_flush: Optional[FlushCallback] = None
+        self.collapsed = 0
+        self._pending: Dict[Tuple, int] = {}
+        self._serial = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def attach(self, on_flush: FlushCallback):
+        if self.on_flush is None:
+            self.on_flush = on_flush
+
+    def record(self, category: str, actor: str, action: str):
+        level = self.levels.get(category, COLLAPSED)
+        if level == OFF:
+            return
+        if level == ALL:
+            self._serial += 1
+            key = (actor, action, self._serial)
+        else:
+            key = (actor, action)
+        count = self._pending.get(key)
+        if count is None:
+            self._pending[key] = 1
+        else:
+            self._pending[key] = count + 1
+            self.collapsed += 1
+            if metrics.enabled:
+                metrics.activity_collapsed.inc()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def drain(self) -> List[Dict[str, Any]]:
+        # Formats the window's entries and appends them to the room's activity log
+        pending, self._pending = self._pending, {}
+        entries = []
+        for key, count in pending.items():
+            message = f"{key[0]} {key[1]}" if count == 1 else f"{key[0]} {key[1]} ×{count}"
+            entries.append(self.state.add_log(message))
+        return entries
+
+    async def flush(self):
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+        entries = self.drain()
+        if entries and self.on_flush is not None:
+            await self.on_flush(entries)
+
+    def close(self):
+        # Pending entries still reach the log (and storage); only the broadcast is skipped
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.drain()
+
+    async def _flush_later(self):
+        if self.interval > 0:
+            await asyncio.sleep(self.interval)
+        await self.flush()
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from typing import AsyncIterable, AsyncIterator, Dict, Optional
+from app import config
+from app.services.diagram_summary import analyze_bpmn_diagram_async
+from app.services.workers import WorkerPoolSaturated
+
+# Backoff while other requests hold the whole worker pool
+SATURATED_RETRIES = 5
+SATURATED_BACKOFF_SECONDS = 0.05
+
+async def ndjson_lines(chunks: AsyncIterable[bytes], max_line: int) -> AsyncIterator[Optional[bytes]]:
+    # Splits a body into lines as it arrives; an over-long line yields None once and is skipped
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if skipping:
+                skipping = False
+            elif line.strip():
+                yield line
+        del buffer[:start]
+        if max_line and len(buffer) > max_line:
+            if not skipping:
+                skipping = True
+                yield None
+            buffer.clear()
+    if buffer.strip() and not skipping:
+        yield bytes(buffer)
+
+def _failure(index: int, item_id, message: str) -> Dict:
+    return {"index": index, "id": item_id, "summary": message, "error": True}
+
+async def analyze_item(index: int, line: Optional[bytes]) -> Dict:
+    if line is None:
+        return _failure(index, None, "Diagram XML too large")
+    try:
+        item = json.loads(line)
+        item_id = item.get("id")
+    except (ValueError, AttributeError):
+        return _failure(index, None, 'Expected a JSON object with an "xml" string')
+    xml = item.get("xml")
+    if not isinstance(xml, str):
+        return _failure(index, item_id, 'Expected a JSON object with an "xml" string')
+    for attempt in range(SATURATED_RETRIES):
+        try:
+            analysis = await analyze_bpmn_diagram_async(xml)
+            return {"index": index, "id": item_id, **analysis}
+        except WorkerPoolSaturated:
+            await asyncio.sleep(SATURATED_BACKOFF_SECONDS * 2 ** attempt)
+        except Exception as e:
+            return _failure(index, item_id, f"Error generating summary: {str(e)}")
+    return {**_failure(index, item_id, "Diagram analysis is busy, please retry"), "retry": True}
+
+async def analyze_bulk(chunks: AsyncIterable[bytes], concurrency: int = None) -> AsyncIterator[bytes]:
+    # NDJSON in, NDJSON out in completion order. At most `concurrency` items are in flight,
+    # and reading the body waits for a free slot, so memory is bounded by the cap rather
+    # than the batch size.
+    limit = config.BULK_CONCURRENCY
+    if concurrency:
+        limit = min(concurrency, limit)
+    slots = asyncio.Semaphore(max(1, limit))
+    results: asyncio.Queue = asyncio.Queue()
+    pending = set()
+
+    async def run(index: int, line: Optional[bytes]):
+        try:
+            results.put_nowait(await analyze_item(index, line))
+        finally:
+            slots.release()
+
+    async def read():
+        index = 0
+        try:
+            async for line in ndjson_lines(chunks, config.MAX_REQUEST_BYTES):
+                await slots.acquire()
+                task = asyncio.create_task(run(index, line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                index += 1
+        finally:
+            if pending:
+                await asyncio.wait(list(pending))
+            results.put_nowait(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield (json.dumps(result) + "\n").encode("utf-8")
+        await reader
+    finally:
+        # The client went away: stop reading and drop queued work
+        reader.cancel()
+        for task in list(pending):
+            task.cancel()
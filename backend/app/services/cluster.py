@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import hashlib
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from app import config
+from app.utils import PayloadJSON
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self._hashes: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes: Set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._hashes, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                index = bisect.bisect_left(self._hashes, point)
+                del self._hashes[index]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[index]]
+
+class MessageBus(ABC):
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncIterator[str]:
+        ...
+
+    async def close(self):
+        pass
+
+class InMemoryBus(MessageBus):
+    # Delivers to every subscriber in this process; used by tests and single-host setups
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].remove(queue)
+
+# Line protocol shared by TCPBus and run_broker:
+#   client -> broker: "SUB <channel>\n" or "PUB <channel> <json>\n"
+#   broker -> client: "MSG <channel> <json>\n"
+def _split_line(line: bytes) -> List[str]:
+    # Undecodable lines come back empty, so callers skip them like any other malformed line
+    try:
+        return line.decode("utf-8").rstrip("\n").split(" ", 2)
+    except UnicodeDecodeError:
+        return []
+
+class TCPBus(MessageBus):
+    def __init__(self, host: str, port: int, retry_seconds: float = 1.0):
+        self.host = host
+        self.port = port
+        self.retry_seconds = retry_seconds
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._publish_lock: Optional[asyncio.Lock] = None
+
+    async def publish(self, channel: str, message: str):
+        if self._publish_lock is None:
+            self._publish_lock = asyncio.Lock()
+        async with self._publish_lock:
+            if self._writer is None or self._writer.is_closing():
+                _, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._writer.write(f"PUB {channel} {message}\n".encode("utf-8"))
+            await self._writer.drain()
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            try:
+                writer.write(f"SUB {channel}\n".encode("utf-8"))
+                await writer.drain()
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    parts = _split_line(line)
+                    if len(parts) == 3 and parts[0] == "MSG" and parts[1] == channel:
+                        yield parts[2]
+            finally:
+                writer.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+async def run_broker(host: str = "127.0.0.1", port: int = 7400) -> asyncio.base_events.Server:
+    subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels: Set[str] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = _split_line(line)
+                if len(parts) == 2 and parts[0] == "SUB":
+                    channels.add(parts[1])
+                    subscribers.setdefault(parts[1], set()).add(writer)
+                elif len(parts) == 3 and parts[0] == "PUB":
+                    frame = f"MSG {parts[1]} {parts[2]}\n".encode("utf-8")
+                    for subscriber in list(subscribers.get(parts[1], ())):
+                        subscriber.write(frame)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in channels:
+                subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+class BusClientManager(AsyncPubSubManager):
+    name = "bpmnbus"
+
+    def __init__(self, bus: MessageBus, channel: str = "socketio", write_only: bool = False, logger=None,
+                 owns: Optional[Callable[[str], bool]] = None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self.owns = owns
+
+    async def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        # A room's clients are all on the node that owns it (the others refuse them), so emits to
+        # an owned room or a local client skip the bus; only the rest cross nodes
+        if self._is_local(to or room, namespace or "/"):
+            kwargs["ignore_queue"] = True
+        await super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                           callback=callback, to=to, **kwargs)
+
+    def _is_local(self, target, namespace: str) -> bool:
+        if target is None or self.owns is None:
+            return False
+        if isinstance(target, (list, tuple, set)):
+            return all(self._is_local(item, namespace) for item in target)
+        return self.is_connected(target, namespace) or self.owns(target)
+
+    async def _publish(self, data):
+        await self.bus.publish(self.channel, PayloadJSON.dumps(data))
+
+    async def _listen(self):
+        async for message in self.bus.subscribe(self.channel):
+            yield message
+
+class Cluster:
+    def __init__(self, node_id: str, nodes: Dict[str, str], bus: MessageBus):
+        if node_id not in nodes:
+            raise ValueError(f"Node '{node_id}' is not part of the cluster {sorted(nodes)}")
+        self.node_id = node_id
+        self.nodes = nodes
+        self.bus = bus
+        self.ring = HashRing(nodes)
+
+    def owner(self, room_id: str) -> str:
+        return self.ring.owner(room_id)
+
+    def owns(self, room_id: str) -> bool:
+        return self.owner(room_id) == self.node_id
+
+    def owner_url(self, room_id: str) -> str:
+        return self.nodes[self.owner(room_id)]
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    nodes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        node_id, _, url = item.partition("=")
+        nodes[node_id.strip()] = url.strip()
+    return nodes
+
+def create_bus(spec: str) -> MessageBus:
+    if spec.startswith("tcp://"):
+        host, _, port = spec[len("tcp://"):].partition(":")
+        return TCPBus(host or "127.0.0.1", int(port or 7400))
+    return InMemoryBus()
+
+def create_cluster() -> Optional[Cluster]:
+    nodes = parse_nodes(config.CLUSTER_NODES)
+    if not nodes:
+        return None
+    return Cluster(config.CLUSTER_NODE_ID, nodes, create_bus(config.CLUSTER_BUS))
+
+cluster = create_cluster()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the local cluster message broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7400)
+    args = parser.parse_args()
+
+    async def serve():
+        server = await run_broker(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
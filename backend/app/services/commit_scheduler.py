@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+from app import config
+from app.services.metrics import metrics
+
+class PendingCommit:
+    __slots__ = ("sender", "author", "xml", "count", "started", "waiters")
+
+    def __init__(self, sender: str, author: str, started: float):
+        self.sender = sender
+        self.author = author
+        self.xml = ""
+        self.count = 0
+        self.started = started
+        self.waiters: List[asyncio.Future] = []
+
+class CommitScheduler:
+    # Squashes a burst of full-document updates from one connection (e.g. every command-stack
+    # change during a drag) into one commit, one version and one broadcast. The window slides
+    # with each update but never holds the first one longer than max_latency. An update from
+    # another connection, or flush() before any other document write, commits what is pending
+    # first, and commits run one at a time in submission order. Every squashed update resolves
+    # to the result of the commit that carried it.
+    def __init__(self, window_ms: int = None, max_latency_ms: int = None):
+        self.window = (config.COMMIT_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_latency = (config.COMMIT_MAX_LATENCY_MS if max_latency_ms is None else max_latency_ms) / 1000
+        self.callback: Optional[Callable[[PendingCommit], Awaitable[Any]]] = None
+        self.squashed = 0
+        self._pending: Optional[PendingCommit] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def attach(self, callback: Callable[[PendingCommit], Awaitable[Any]]):
+        if self.callback is None:
+            self.callback = callback
+
+    def submit(self, sender: str, author: str, xml: str) -> "asyncio.Future[Any]":
+        loop = asyncio.get_running_loop()
+        pending = self._pending
+        if pending is not None and pending.sender != sender:
+            self._start_flush()
+            pending = None
+        now = loop.time()
+        if pending is None:
+            pending = self._pending = PendingCommit(sender, author, now)
+        else:
+            self.squashed += 1
+            if metrics.enabled:
+                metrics.commits_squashed.inc()
+        pending.xml = xml
+        pending.author = author
+        pending.count += 1
+        waiter = loop.create_future()
+        pending.waiters.append(waiter)
+        if self.window <= 0:
+            self._start_flush()
+        else:
+            if self._timer is not None:
+                self._timer.cancel()
+            deadline = min(now + self.window, pending.started + self.max_latency)
+            self._timer = loop.call_at(deadline, self._start_flush)
+        return waiter
+
+    async def flush(self):
+        # Commits anything pending and waits until every earlier commit has landed
+        if self._pending is not None:
+            self._start_flush()
+        if self._last is not None and not self._last.done():
+            await asyncio.shield(self._last)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, None
+        if batch is not None:
+            # Tasks start in creation order and the lock is FIFO, so commits keep submission order
+            self._last = asyncio.get_running_loop().create_task(self._commit(batch))
+
+    async def _commit(self, batch: PendingCommit):
+        async with self._lock:
+            try:
+                if self.callback is None:
+                    raise RuntimeError("No commit callback attached")
+                result = await self.callback(batch)
+            except Exception as e:
+                for waiter in batch.waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, None
+        if batch is not None:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.cancel()
@@ -0,0 +1,294 @@
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+BPMN_NS = "{http://www.omg.org/spec/BPMN/20100524/MODEL}"
+
+CONTAINER_TYPES = frozenset(['subProcess', 'transaction', 'adHocSubProcess'])
+
+FLOW_NODE_TYPES = frozenset([
+    'startEvent', 'endEvent', 'task', 'userTask', 'serviceTask',
+    'scriptTask', 'businessRuleTask', 'manualTask', 'sendTask',
+    'receiveTask', 'callActivity', 'exclusiveGateway', 'inclusiveGateway',
+    'parallelGateway', 'eventBasedGateway', 'complexGateway',
+    'intermediateThrowEvent', 'intermediateCatchEvent', 'boundaryEvent'
+]) | CONTAINER_TYPES
+
+# Graph type of a sub-process with triggeredByEvent="true"; it has no incoming flows and is
+# started by an event anywhere in its scope, so it is a root and not a dead end
+EVENT_SUB_PROCESS = "eventSubProcess"
+
+GATEWAY_TYPES = ('exclusiveGateway', 'inclusiveGateway', 'parallelGateway', 'eventBasedGateway', 'complexGateway')
+
+# Exclusive and event-based splits may legitimately end in separate end events; parallel
+# and inclusive splits without a matching join leave tokens unsynchronized
+SYNCHRONIZING_GATEWAYS = frozenset(['parallelGateway', 'inclusiveGateway'])
+
+# Longest id lists reported per check; counts are always exact
+LIST_LIMIT = 50
+
+# (id, type, container, process, attached_to) per flow node and (source, target) per sequence flow
+NodeRow = Tuple[str, str, Optional[str], Optional[str], Optional[str]]
+FlowRow = Tuple[Optional[str], Optional[str]]
+
+def _csr(n: int, sources: array, targets: array) -> Tuple[array, array]:
+    # Compressed adjacency: the neighbours of node i are adjacency[offsets[i]:offsets[i + 1]]
+    offsets = array("i", bytes(4 * (n + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    adjacency = array("i", bytes(4 * len(sources)))
+    fill = array("i", offsets)
+    for source, target in zip(sources, targets):
+        adjacency[fill[source]] = target
+        fill[source] += 1
+    return offsets, adjacency
+
+class FlowGraph:
+    # Sequence-flow graph with nodes numbered 0..n-1. Edges live in integer arrays, so the
+    # checks below touch every node and edge a constant number of times.
+    def __init__(self, nodes: Sequence[NodeRow], flows: Sequence[FlowRow]):
+        index: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.types: List[str] = []
+        process_ids: Dict[Optional[str], int] = {}
+        self.process = array("i")
+        for element_id, element_type, _, process, _ in nodes:
+            if element_id in index:
+                continue
+            index[element_id] = len(self.ids)
+            self.ids.append(element_id)
+            self.types.append(element_type)
+            self.process.append(process_ids.setdefault(process, len(process_ids)))
+        n = len(self.ids)
+
+        sources, targets = array("i"), array("i")
+        for source, target in flows:
+            if source in index and target in index:
+                sources.append(index[source])
+                targets.append(index[target])
+        self.out_offsets, self.out_edges = _csr(n, sources, targets)
+        self.in_offsets, self.in_edges = _csr(n, targets, sources)
+
+        # Activation without a sequence flow: a sub-process starts its start events and event
+        # sub-processes (which take no incoming flows), an activity arms its boundary events
+        implicit_sources, implicit_targets = array("i"), array("i")
+        for element_id, element_type, container, _, attached_to in nodes:
+            node = index[element_id]
+            if element_type == "boundaryEvent":
+                owner = attached_to
+            elif element_type in ("startEvent", EVENT_SUB_PROCESS) or (element_type in CONTAINER_TYPES and self.in_degree(node) == 0):
+                owner = container
+            else:
+                continue
+            if owner in index:
+                implicit_sources.append(index[owner])
+                implicit_targets.append(node)
+        self.implicit_offsets, self.implicit_edges = _csr(n, implicit_sources, implicit_targets)
+        self.implicit_in = array("i", bytes(4 * n))
+        for target in implicit_targets:
+            self.implicit_in[target] += 1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def flow_count(self) -> int:
+        return len(self.out_edges)
+
+    def out_degree(self, node: int) -> int:
+        return self.out_offsets[node + 1] - self.out_offsets[node]
+
+    def in_degree(self, node: int) -> int:
+        return self.in_offsets[node + 1] - self.in_offsets[node]
+
+    @classmethod
+    def from_model(cls, model) -> "FlowGraph":
+        nodes = []
+        flows = []
+        for info in model.elements.values():
+            if info.di:
+                continue
+            if info.type == "sequenceFlow":
+                flows.append((info.source, info.target))
+            elif info.type in FLOW_NODE_TYPES:
+                parent = model.elements.get(info.parent) if info.parent else None
+                container = parent.id if parent is not None and parent.type in CONTAINER_TYPES else None
+                nodes.append((info.id, EVENT_SUB_PROCESS if info.triggered else info.type, container, info.process,
+                              info.source if info.type == "boundaryEvent" else None))
+        return cls(nodes, flows)
+
+class GraphCollector:
+    # Streaming handler (see xml_ingest.StreamingParser) gathering graph rows in one pass
+    def __init__(self):
+        self.nodes: List[NodeRow] = []
+        self.flows: List[FlowRow] = []
+        self._scopes: List[Tuple[str, str]] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        if not tag.startswith(BPMN_NS):
+            return
+        local = tag[len(BPMN_NS):]
+        if local == "sequenceFlow":
+            self.flows.append((attrib.get("sourceRef"), attrib.get("targetRef")))
+        elif local in FLOW_NODE_TYPES and attrib.get("id"):
+            container = self._scopes[-1][1] if self._scopes and self._scopes[-1][0] != "process" else None
+            process = next((scope_id for kind, scope_id in self._scopes if kind == "process"), None)
+            node_type = EVENT_SUB_PROCESS if local == "subProcess" and attrib.get("triggeredByEvent") == "true" else local
+            self.nodes.append((attrib["id"], node_type, container, process, attrib.get("attachedToRef")))
+        if local == "process" or local in CONTAINER_TYPES:
+            self._scopes.append((local, attrib.get("id")))
+
+    def end(self, tag: str):
+        if self._scopes and tag == BPMN_NS + self._scopes[-1][0]:
+            self._scopes.pop()
+
+    def graph(self) -> FlowGraph:
+        return FlowGraph(self.nodes, self.flows)
+
+def _listed(graph: FlowGraph, nodes: List[int]) -> Dict:
+    return {"count": len(nodes), "ids": [graph.ids[node] for node in nodes[:LIST_LIMIT]]}
+
+def _reachable(graph: FlowGraph) -> bytearray:
+    n = len(graph)
+    roots = [node for node in range(n)
+             if graph.types[node] == "startEvent" and graph.in_degree(node) == 0 and graph.implicit_in[node] == 0]
+    # A process without start events is started at every node nothing flows into
+    started = {graph.process[node] for node in roots}
+    roots.extend(node for node in range(n)
+                 if graph.process[node] not in started and graph.in_degree(node) == 0 and graph.implicit_in[node] == 0)
+    # Event sub-processes can start at any level, whether or not their container runs
+    roots.extend(node for node in range(n) if graph.types[node] == EVENT_SUB_PROCESS)
+    seen = bytearray(n)
+    stack = roots
+    for node in roots:
+        seen[node] = 1
+    while stack:
+        node = stack.pop()
+        for offsets, edges in ((graph.out_offsets, graph.out_edges), (graph.implicit_offsets, graph.implicit_edges)):
+            for i in range(offsets[node], offsets[node + 1]):
+                target = edges[i]
+                if not seen[target]:
+                    seen[target] = 1
+                    stack.append(target)
+    return seen
+
+def _components(graph: FlowGraph) -> Tuple[List[List[int]], array]:
+    # Iterative Tarjan; components come out in reverse topological order (sinks first)
+    n = len(graph)
+    offsets, edges = graph.out_offsets, graph.out_edges
+    order = array("i", [-1]) * n
+    low = array("i", bytes(4 * n))
+    component = array("i", [-1]) * n
+    on_stack = bytearray(n)
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+    for root in range(n):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [[root, offsets[root]]]
+        while work:
+            frame = work[-1]
+            node, i = frame
+            if i < offsets[node + 1]:
+                frame[1] = i + 1
+                target = edges[i]
+                if order[target] == -1:
+                    order[target] = low[target] = counter
+                    counter += 1
+                    stack.append(target)
+                    on_stack[target] = 1
+                    work.append([target, offsets[target]])
+                elif on_stack[target] and order[target] < low[node]:
+                    low[node] = order[target]
+                continue
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == order[node]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component[member] = len(components)
+                    members.append(member)
+                    if member == node:
+                        break
+                components.append(members)
+    return components, component
+
+def _longest_path(graph: FlowGraph, components: List[List[int]], component: array) -> List[int]:
+    # Longest chain of steps with every cycle collapsed to one step. Successor components were
+    # emitted earlier, so a single pass in emission order sees them finished.
+    if not components:
+        return []
+    offsets, edges = graph.out_offsets, graph.out_edges
+    length = array("i", bytes(4 * len(components)))
+    following = array("i", [-1]) * len(components)
+    for index, members in enumerate(components):
+        best, best_next = 0, -1
+        for node in members:
+            for i in range(offsets[node], offsets[node + 1]):
+                successor = component[edges[i]]
+                if successor != index and length[successor] > best:
+                    best, best_next = length[successor], successor
+        length[index] = best + 1
+        following[index] = best_next
+    current = max(range(len(components)), key=length.__getitem__)
+    path = []
+    while current != -1:
+        # The component's root stands in for a collapsed cycle
+        path.append(components[current][-1])
+        current = following[current]
+    return path
+
+def analyze_graph(graph: FlowGraph) -> Dict:
+    n = len(graph)
+    seen = _reachable(graph)
+    unreachable = [node for node in range(n) if not seen[node]]
+    dead_ends = [node for node in range(n)
+                 if graph.out_degree(node) == 0 and graph.types[node] not in ("endEvent", EVENT_SUB_PROCESS)]
+
+    gateways = {}
+    mixed = []
+    unbalanced = {}
+    for node in range(n):
+        gateway_type = graph.types[node]
+        if gateway_type not in GATEWAY_TYPES:
+            continue
+        counts = gateways.setdefault(gateway_type, {"splits": 0, "joins": 0})
+        split, join = graph.out_degree(node) > 1, graph.in_degree(node) > 1
+        counts["splits"] += split
+        counts["joins"] += join
+        if split and join:
+            mixed.append(node)
+    for gateway_type, counts in gateways.items():
+        if gateway_type in SYNCHRONIZING_GATEWAYS and counts["splits"] != counts["joins"]:
+            unbalanced[gateway_type] = counts
+
+    components, component = _components(graph)
+    offsets, edges = graph.out_offsets, graph.out_edges
+    cycles = [members for members in components
+              if len(members) > 1 or any(edges[i] == members[0] for i in range(offsets[members[0]], offsets[members[0] + 1]))]
+    path = _longest_path(graph, components, component)
+
+    return {
+        "node_count": n,
+        "flow_count": graph.flow_count,
+        "unreachable": _listed(graph, unreachable),
+        "dead_ends": _listed(graph, dead_ends),
+        "gateways": gateways,
+        "unbalanced_gateways": unbalanced,
+        "mixed_gateways": _listed(graph, mixed),
+        "cycles": {
+            "count": len(cycles),
+            "node_count": sum(len(members) for members in cycles),
+            "ids": [[graph.ids[node] for node in reversed(members)] for members in cycles[:LIST_LIMIT]],
+        },
+        "longest_path": {"length": len(path), "ids": [graph.ids[node] for node in path[:LIST_LIMIT]]},
+    }
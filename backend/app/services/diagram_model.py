@@ -0,0 +1,273 @@
+import hashlib
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+from app.services.diagram_patch import parse_document, parse_fragment
+from app.services.diagram_summary import ELEMENT_TYPES, analysis_from_counts
+
+BPMN_MODEL = "{http://www.omg.org/spec/BPMN/20100524/MODEL}"
+BPMN_DI = "{http://www.omg.org/spec/BPMN/20100524/DI}"
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _digest(element: ET.Element) -> str:
+    # Covers the element's own attributes except its name (kept separately, so a rename alone is
+    # told apart from other edits) and text plus id-less children (bounds, waypoints,
+    # incoming/outgoing refs, conditions); children with ids are digested as elements of their own
+    parts = []
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        parts.append(node.tag)
+        parts.extend(f"{key}={value}" for key, value in sorted(node.attrib.items()) if node is not element or key != "name")
+        parts.append((node.text or "").strip())
+        parts.append("(")
+        stack.extend(child for child in reversed(node) if child.get("id") is None)
+    return hashlib.blake2b("\x00".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+class ElementInfo:
+    __slots__ = ("id", "type", "name", "process", "parent", "digest", "source", "target", "di", "triggered")
+
+    def __init__(self, element_id: str, element_type: str, name: Optional[str], process: Optional[str],
+                 parent: Optional[str], digest: str, source: Optional[str] = None, target: Optional[str] = None,
+                 di: bool = False, triggered: bool = False):
+        self.id = element_id
+        self.type = element_type
+        self.name = name
+        self.process = process
+        self.parent = parent
+        self.digest = digest
+        # sourceRef/targetRef for flows, attachedToRef for boundary events; bpmnElement for
+        # diagram-interchange shapes and edges
+        self.source = source
+        self.target = target
+        self.di = di
+        # An event sub-process (triggeredByEvent): started by an event, never by a sequence flow
+        self.triggered = triggered
+
+class DiagramModel:
+    # Parsed index of one diagram revision: elements by id, type, process and lane plus
+    # sequence-flow adjacency. Indexes are dicts used as ordered sets so lookups, counts
+    # and incremental patch updates never rescan the document.
+    def __init__(self, namespaces: Dict[str, str] = None):
+        self.namespaces = namespaces or {}
+        self.valid = True
+        self.error: Optional[str] = None
+        self.elements: Dict[str, ElementInfo] = {}
+        self.children: Dict[str, Dict[str, None]] = {}
+        self.by_type: Dict[str, Dict[str, None]] = {}
+        self.by_process: Dict[str, Dict[str, None]] = {}
+        self.by_lane: Dict[str, Dict[str, None]] = {}
+        self.lane_of: Dict[str, str] = {}
+        self.outgoing: Dict[str, Dict[str, None]] = {}
+        self.incoming: Dict[str, Dict[str, None]] = {}
+        self.shapes: Dict[str, Dict[str, None]] = {}
+        self.process_types: Counter = Counter()
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "DiagramModel":
+        try:
+            root, namespaces = parse_document(xml)
+        except ET.ParseError as e:
+            model = cls()
+            model.valid = False
+            model.error = f"Error parsing BPMN XML: {e}"
+            return model
+        model = cls(namespaces)
+        if root is not None:
+            model._index_tree(root, None, None)
+        return model
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def get(self, element_id: str) -> Optional[ElementInfo]:
+        return self.elements.get(element_id)
+
+    def counts(self) -> Dict[str, int]:
+        return {element_type: len(ids) for element_type, ids in self.by_type.items()}
+
+    def count(self, element_type: str) -> int:
+        return len(self.by_type.get(element_type, ()))
+
+    def query(self, element_type: str = None, process: str = None, lane: str = None) -> List[str]:
+        filters = []
+        if element_type:
+            filters.append(self.by_type.get(element_type, {}))
+        if process:
+            filters.append(self.by_process.get(process, {}))
+        if lane:
+            filters.append(self.by_lane.get(lane, {}))
+        if not filters:
+            return [element_id for element_id, info in self.elements.items() if not info.di]
+        # Walk the smallest index and probe the others
+        filters.sort(key=len)
+        return [element_id for element_id in filters[0] if all(element_id in other for other in filters[1:])]
+
+    def describe(self, element_id: str) -> Optional[Dict[str, Any]]:
+        info = self.elements.get(element_id)
+        if info is None:
+            return None
+        described = {
+            "id": info.id,
+            "type": info.type,
+            "name": info.name,
+            "process": info.process,
+            "lane": self.lane_of.get(info.id),
+            "parent": info.parent,
+            "incoming": list(self.incoming.get(info.id, ())),
+            "outgoing": list(self.outgoing.get(info.id, ())),
+        }
+        if info.type == "sequenceFlow":
+            described["source"] = info.source
+            described["target"] = info.target
+        if info.di:
+            described["element"] = info.target
+        return described
+
+    def fingerprint(self, element_id: str):
+        # Semantic content together with its diagram-interchange shapes, so moving a shape counts as an edit
+        info = self.elements.get(element_id)
+        if info is None:
+            return None
+        return info.name, info.digest, tuple(sorted(self.elements[shape].digest for shape in self.shapes.get(element_id, ())))
+
+    def owner(self, element_id: str) -> str:
+        # Lockable element an id belongs to: a shape or edge belongs to the element it draws
+        info = self.elements.get(element_id)
+        return info.target if info is not None and info.di and info.target else element_id
+
+    def subtree(self, element_id: str) -> List[str]:
+        ids = []
+        stack = [element_id]
+        while stack:
+            current = stack.pop()
+            if current in self.elements:
+                ids.append(current)
+                stack.extend(self.children.get(current, ()))
+        return ids
+
+    def affected(self, changed: Iterable[str], removed: Iterable[str]) -> Set[str]:
+        touched = {self.owner(element_id) for element_id in changed}
+        for element_id in removed:
+            touched.update(self.owner(descendant) for descendant in self.subtree(element_id))
+            touched.add(self.owner(element_id))
+        return touched
+
+    def changed(self, other: "DiagramModel", element_ids: Iterable[str]) -> Set[str]:
+        return {element_id for element_id in element_ids if self.fingerprint(element_id) != other.fingerprint(element_id)}
+
+    def analysis(self) -> Dict[str, Any]:
+        if not self.valid:
+            return {"summary": self.error, "error": True}
+        processes = self.by_type.get("process", {})
+        process_name = None
+        if processes:
+            process_name = self.elements[next(iter(processes))].name
+            if process_name is None:
+                process_name = "Unnamed Process"
+        return analysis_from_counts(len(processes), process_name, +self.process_types,
+                                    self.count("sequenceFlow"), self.count("messageFlow"))
+
+    def apply_patch(self, added: List[Dict], changed: List[Dict], removed: List[str]):
+        # Mirrors diagram_patch.apply_patch on the index; the patch has already been validated there
+        for element_id in removed:
+            if element_id in self.elements:
+                self._remove(element_id)
+        for item in changed:
+            current = self.elements.get(item["id"])
+            if current is None:
+                continue
+            parent, process = current.parent, current.process
+            self._remove(item["id"])
+            self._index_tree(parse_fragment(item["xml"], self.namespaces), parent, process)
+        root = next(iter(self.by_type.get("definitions", {})), None)
+        for item in added:
+            parent = item.get("parent_id") or root
+            info = self.elements.get(parent) if parent else None
+            process = parent if info is not None and info.type == "process" else (info.process if info else None)
+            self._index_tree(parse_fragment(item["xml"], self.namespaces), parent, process)
+
+    def _index_tree(self, element: ET.Element, parent: Optional[str], process: Optional[str]):
+        stack = [(element, parent, process)]
+        while stack:
+            node, parent, process = stack.pop()
+            element_id = node.get("id")
+            if element_id is not None and isinstance(node.tag, str):
+                self._add(node, element_id, parent, process)
+                parent = element_id
+                if _local(node.tag) == "process" and node.tag.startswith(BPMN_MODEL):
+                    process = element_id
+            stack.extend((child, parent, process) for child in reversed(node))
+
+    def _add(self, node: ET.Element, element_id: str, parent: Optional[str], process: Optional[str]):
+        if element_id in self.elements:
+            self._remove(element_id)
+        element_type = _local(node.tag)
+        di = node.tag.startswith(BPMN_DI)
+        own_process = None if element_type == "process" else process
+        source = node.get("attachedToRef") if element_type == "boundaryEvent" else node.get("sourceRef")
+        info = ElementInfo(element_id, element_type, node.get("name"), own_process, parent, _digest(node),
+                           source, node.get("bpmnElement") if di else node.get("targetRef"), di,
+                           node.get("triggeredByEvent") == "true")
+        self.elements[element_id] = info
+        self.by_type.setdefault(element_type, {})[element_id] = None
+        if parent is not None:
+            self.children.setdefault(parent, {})[element_id] = None
+        if own_process is not None:
+            self.by_process.setdefault(own_process, {})[element_id] = None
+            if element_type in ELEMENT_TYPES:
+                self.process_types[element_type] += 1
+        if di:
+            if info.target:
+                self.shapes.setdefault(info.target, {})[element_id] = None
+        elif element_type == "sequenceFlow":
+            if info.source:
+                self.outgoing.setdefault(info.source, {})[element_id] = None
+            if info.target:
+                self.incoming.setdefault(info.target, {})[element_id] = None
+        elif element_type == "lane":
+            lane = self.by_lane.setdefault(element_id, {})
+            for ref in node.findall(f"{BPMN_MODEL}flowNodeRef"):
+                if ref.text and ref.text.strip():
+                    node_id = ref.text.strip()
+                    # Child lanes are indexed after their parent, so the innermost lane wins
+                    previous = self.lane_of.get(node_id)
+                    if previous is not None and previous != element_id:
+                        self.by_lane.get(previous, {}).pop(node_id, None)
+                    self.lane_of[node_id] = element_id
+                    lane[node_id] = None
+
+    def _remove(self, element_id: str):
+        for child in list(self.children.get(element_id, ())):
+            self._remove(child)
+        info = self.elements.pop(element_id)
+        self.children.pop(element_id, None)
+        self._discard(self.by_type, info.type, element_id)
+        if info.parent is not None:
+            self._discard(self.children, info.parent, element_id)
+        if info.process is not None:
+            self._discard(self.by_process, info.process, element_id)
+            if info.type in ELEMENT_TYPES:
+                self.process_types[info.type] -= 1
+        if info.di:
+            if info.target:
+                self._discard(self.shapes, info.target, element_id)
+        elif info.type == "sequenceFlow":
+            if info.source:
+                self._discard(self.outgoing, info.source, element_id)
+            if info.target:
+                self._discard(self.incoming, info.target, element_id)
+        elif info.type == "lane":
+            for node_id in self.by_lane.pop(element_id, {}):
+                if self.lane_of.get(node_id) == element_id:
+                    del self.lane_of[node_id]
+
+    @staticmethod
+    def _discard(index: Dict[str, Dict[str, None]], key: str, element_id: str):
+        members = index.get(key)
+        if members is not None:
+            members.pop(element_id, None)
+            if not members:
+                del index[key]
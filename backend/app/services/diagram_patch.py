@@ -0,0 +1,132 @@
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+from app.services.xml_ingest import parse_tree
+
+BPMN_NAMESPACES = {
+    "bpmn": "http://www.omg.org/spec/BPMN/20100524/MODEL",
+    "bpmndi": "http://www.omg.org/spec/BPMN/20100524/DI",
+    "dc": "http://www.omg.org/spec/DD/20100524/DC",
+    "di": "http://www.omg.org/spec/DD/20100524/DI",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+}
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_document(xml_string: str) -> Tuple[ET.Element, Dict[str, str]]:
+    return parse_tree(xml_string)
+
+
+def serialize(root: ET.Element, namespaces: Dict[str, str]) -> str:
+    # Writes the document's own prefixes from a per-call map. ET.register_namespace would change
+    # them for every thread, so names are spelled out here and the tree is consumed.
+    prefixes: Dict[str, str] = {}
+    for prefix, uri in namespaces.items():
+        prefixes.setdefault(uri, prefix)
+    for prefix, uri in BPMN_NAMESPACES.items():
+        if prefix not in namespaces:
+            prefixes.setdefault(uri, prefix)
+    taken = set(prefixes.values())
+    declared: Dict[str, str] = {}
+
+    def qualify(name: str, attribute: bool = False) -> str:
+        if name[:1] != "{":
+            return name
+        uri, local = name[1:].split("}", 1)
+        prefix = prefixes.get(uri)
+        if prefix is None or (attribute and not prefix):
+            # Unprefixed attributes have no namespace, so those need a named prefix
+            prefix = next(f"ns{i}" for i in range(len(taken) + 1) if f"ns{i}" not in taken)
+            taken.add(prefix)
+            if uri not in prefixes or not prefixes[uri]:
+                prefixes[uri] = prefix
+        declared[prefix] = uri
+        return f"{prefix}:{local}" if prefix else local
+
+    for element in root.iter():
+        if isinstance(element.tag, str):
+            element.tag = qualify(element.tag)
+        if any(key[:1] == "{" for key in element.attrib):
+            element.attrib = {qualify(key, True): value for key, value in element.attrib.items()}
+    for prefix, uri in sorted(declared.items()):
+        root.set(f"xmlns:{prefix}" if prefix else "xmlns", uri)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="unicode")
+
+
+def parse_fragment(fragment: str, namespaces: Dict[str, str]) -> ET.Element:
+    declared = {**BPMN_NAMESPACES, **{p: u for p, u in namespaces.items() if p}}
+    attrs = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in declared.items())
+    try:
+        wrapper, _ = parse_tree(f"<patch {attrs}>{fragment}</patch>")
+    except ET.ParseError as e:
+        raise PatchError(f"Invalid element XML: {e}")
+    children = list(wrapper)
+    if len(children) != 1:
+        raise PatchError("Element XML must contain exactly one element")
+    return children[0]
+
+
+def _check_id(element: ET.Element, element_id: str):
+    if element.get("id") != element_id:
+        raise PatchError(f"Element XML has id '{element.get('id')}', expected '{element_id}'")
+
+
+def _index(root: ET.Element) -> Tuple[Dict[str, ET.Element], Dict[ET.Element, ET.Element]]:
+    by_id = {}
+    parents = {}
+    for parent in root.iter():
+        element_id = parent.get("id")
+        if element_id:
+            by_id[element_id] = parent
+        for child in parent:
+            parents[child] = parent
+    return by_id, parents
+
+
+def apply_patch(xml_string: str, added: List[Dict], changed: List[Dict], removed: List[str]) -> str:
+    try:
+        root, namespaces = parse_document(xml_string)
+    except ET.ParseError as e:
+        raise PatchError(f"Current diagram is not valid XML: {e}")
+
+    by_id, parents = _index(root)
+
+    for element_id in removed:
+        element = by_id.pop(element_id, None)
+        if element is None:
+            continue
+        parent = parents.get(element)
+        if parent is not None:
+            parent.remove(element)
+
+    for item in changed:
+        current = by_id.get(item["id"])
+        if current is None:
+            raise PatchError(f"Unknown element '{item['id']}'")
+        parent = parents.get(current)
+        if parent is None:
+            raise PatchError(f"Cannot replace root element '{item['id']}'")
+        replacement = parse_fragment(item["xml"], namespaces)
+        _check_id(replacement, item["id"])
+        position = list(parent).index(current)
+        parent.remove(current)
+        parent.insert(position, replacement)
+        by_id[item["id"]] = replacement
+        parents[replacement] = parent
+
+    for item in added:
+        if item["id"] in by_id:
+            raise PatchError(f"Element '{item['id']}' already exists")
+        parent_id = item.get("parent_id")
+        parent = by_id.get(parent_id) if parent_id else root
+        if parent is None:
+            raise PatchError(f"Unknown parent '{parent_id}'")
+        element = parse_fragment(item["xml"], namespaces)
+        _check_id(element, item["id"])
+        parent.append(element)
+        by_id[item["id"]] = element
+        parents[element] = parent
+
+    return serialize(root, namespaces)
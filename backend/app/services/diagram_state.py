@@ -1,137 +1,247 @@
-from datetime import datetime, timezone
-from threading import Lock
-from typing import Dict, List, Any
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from app.services.diagram_patch import PatchError, apply_patch
+from app.services.diagram_model import DiagramModel
+from app.services.document import Document
+from app.services.version_store import VersionStore
+from app.services.lock_manager import LockManager
+from app.services.metrics import metrics
+from app.services.history import HistoryBuffer, LogEntry, ChatEntry, as_dicts
+from app import config
 
 class DiagramState:
-    def __init__(self):
-        self._lock = Lock()
-        self._state: Dict[str, Any] = {
-            "xml": "<bpmn:definitions xmlns:bpmn='http://www.omg.org/spec/BPMN/20100524/MODEL'></bpmn:definitions>",
-            "locks": {},
-            "logs": [],
-            "versions": [],
-            "chat": [],
-            "last_updated": None
-        }
+    # One room's state, split into independent components. All of them are only touched
+    # from the event loop and no method awaits, so each call is atomic with respect to
+    # other coroutines and unrelated operations never wait on each other.
+    def __init__(self, log_capacity: int = None, chat_capacity: int = None):
+        self.document = Document()
+        self.lock_manager = LockManager()
+        self.activity = HistoryBuffer(LogEntry, config.LOG_HISTORY_SIZE if log_capacity is None else log_capacity)
+        self.chat_history = HistoryBuffer(ChatEntry, config.CHAT_HISTORY_SIZE if chat_capacity is None else chat_capacity)
+        self.version_store = VersionStore()
+        # Called with (op, data) after every durable mutation
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        # Bumped on every mutation; keys the cached join snapshot together with the lock epoch
+        self._generation = 0
+        self._initial_state: Optional[Tuple[Tuple[int, int], Dict[str, Any]]] = None
+        # Parsed element index; only valid while model_revision matches the document
+        self.model: Optional[DiagramModel] = None
+        self.model_revision = -1
+
+    def _notify(self, op: str, data: Dict[str, Any]):
+        self._generation += 1
+        for listener in self.listeners:
+            listener(op, data)
 
     @property
     def xml(self) -> str:
-        with self._lock:
-            return self._state["xml"]
+        return self.document.xml
 
     @xml.setter
     def xml(self, value: str):
-        with self._lock:
-            self._state["xml"] = value
-            self._state["last_updated"] = datetime.now(timezone.utc).isoformat()
+        self.commit(value)
+
+    @property
+    def revision(self) -> int:
+        return self.document.revision
+
+    def commit(self, xml: str, author: Optional[str] = None, expected_revision: Optional[int] = None,
+               save_version: bool = False, model: Optional[DiagramModel] = None,
+               patch: Optional[Tuple[List[Dict], List[Dict], List[str]]] = None) -> Optional[int]:
+        # The version (if any) is taken from exactly the XML committed here. A caller that already
+        # parsed the new XML passes its model; a patch is applied to the current model in place.
+        started = time.perf_counter() if metrics.enabled else None
+        previous = self.document.revision
+        revision = self.document.commit(xml, expected_revision)
+        if revision is None:
+            if started is not None:
+                metrics.commit_conflicts.inc()
+            return None
+        self._advance_model(previous, revision, model, patch)
+        self._notify("xml", {"xml": xml, "revision": revision})
+        if save_version and self.version_store.save(xml, author) is not None:
+            self._notify("version", {"author": author})
+        if started is not None:
+            metrics.commit_duration.observe(time.perf_counter() - started)
+        return revision
+
+    def _advance_model(self, previous: int, revision: int, model: Optional[DiagramModel], patch):
+        if model is not None:
+            self.model, self.model_revision = model, revision
+        elif patch is not None and self.model is not None and self.model_revision == previous:
+            try:
+                self.model.apply_patch(*patch)
+                self.model_revision = revision
+            except PatchError:
+                self.model = None
+        else:
+            self.model = None
+
+    def current_model(self) -> Optional[DiagramModel]:
+        return self.model if self.model is not None and self.model_revision == self.document.revision else None
+
+    def set_model(self, model: DiagramModel, revision: int):
+        # Models are built off the loop; one built from an older revision is simply dropped
+        if revision == self.document.revision:
+            self.model, self.model_revision = model, revision
+
+    def apply_patch(self, base_revision: int, added: List[Dict], changed: List[Dict], removed: List[str]) -> Optional[int]:
+        if base_revision != self.document.revision:
+            return None
+        xml = apply_patch(self.document.xml, added, changed, removed)
+        return self.commit(xml, expected_revision=base_revision, patch=(added, changed, removed))
+
+    def set_xml_if_revision(self, expected_revision: int, value: str) -> Optional[int]:
+        return self.commit(value, expected_revision=expected_revision)
 
     @property
     def locks(self) -> Dict[str, str]:
-        with self._lock:
-            return self._state["locks"].copy()
+        return self.lock_manager.locks
 
-    def lock_element(self, element_id: str, username: str):
-        with self._lock:
-            self._state["locks"][element_id] = username
+    def lock_element(self, element_id: str, username: str) -> bool:
+        granted, _ = self.lock_manager.acquire(element_id, username)
+        return granted
 
     def unlock_element(self, element_id: str):
-        with self._lock:
-            self._state["locks"].pop(element_id, None)
+        self.lock_manager.release(element_id)
 
     def clear_locks_by_user(self, username: str) -> List[str]:
-        with self._lock:
-            unlocked = [
-                element_id for element_id, locked_by 
-                in self._state["locks"].items() 
-                if locked_by == username
-            ]
-            for element_id in unlocked:
-                self._state["locks"].pop(element_id, None)
-            return unlocked
+        unlocked = sorted(self.lock_manager.elements_of(username))
+        self.lock_manager.release_user(username)
+        return unlocked
 
     @property
-    def logs(self) -> List[Dict[str, str]]:
-        with self._lock:
-            return self._state["logs"].copy()
-
-    def add_log(self, message: str) -> Dict[str, str]:
-        entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": message
-        }
-        with self._lock:
-            self._state["logs"].append(entry)
-            if len(self._state["logs"]) > 50:
-                self._state["logs"].pop(0)
+    def logs(self) -> List[Dict[str, Any]]:
+        return as_dicts(self.activity.after(0))
+
+    def logs_after(self, seq: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        return self._history_page(self.activity, seq, limit)
+
+    def add_log(self, message: str) -> Dict[str, Any]:
+        entry = self.activity.append(message)._asdict()
+        self._notify("log", entry)
         return entry
 
     @property
     def versions(self) -> List[Dict[str, Any]]:
-        with self._lock:
-            return self._state["versions"].copy()
+        return self.version_store.list(0, len(self.version_store))["versions"]
 
-    def save_version(self):
-        version = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "xml": self._state["xml"]
-        }
-        with self._lock:
-            self._state["versions"].append(version)
-            if len(self._state["versions"]) > 50:
-                self._state["versions"].pop(0)
+    def get_versions(self, offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        return self.version_store.list(offset, limit)
+
+    def get_version(self, version: int) -> Optional[Dict[str, Any]]:
+        return self.version_store.get(version)
+
+    def save_version(self, author: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        version = self.version_store.save(self.document.xml, author)
+        if version is not None:
+            self._notify("version", {"author": author})
+        return version
 
     @property
-    def chat(self) -> List[Dict[str, str]]:
-        with self._lock:
-            return self._state["chat"].copy()
-
-    def add_chat_message(self, username: str, message: str) -> Dict[str, str]:
-        entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "username": username,
-            "message": message
-        }
-        with self._lock:
-            self._state["chat"].append(entry)
-            if len(self._state["chat"]) > 100:
-                self._state["chat"].pop(0)
+    def chat(self) -> List[Dict[str, Any]]:
+        return as_dicts(self.chat_history.after(0))
+
+    def chat_after(self, seq: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        return self._history_page(self.chat_history, seq, limit)
+
+    def add_chat_message(self, username: str, message: str) -> Dict[str, Any]:
+        entry = self.chat_history.append(username, message)._asdict()
+        self._notify("chat", entry)
         return entry
 
-    def get_state(self) -> Dict[str, Any]:
-        with self._lock:
-            return {
-                "xml": self._state["xml"],
-                "locks": self._state["locks"].copy(),
-                "logs": self._state["logs"].copy(),
-                "versions": self._state["versions"].copy(),
-                "chat": self._state["chat"].copy(),
-                "last_updated": self._state["last_updated"]
+    def resize_history(self, log_capacity: int = None, chat_capacity: int = None):
+        if log_capacity is not None:
+            self.activity.resize(log_capacity)
+        if chat_capacity is not None:
+            self.chat_history.resize(chat_capacity)
+        self._generation += 1
+
+    @staticmethod
+    def _history_page(buffer: HistoryBuffer, seq: int, limit: Optional[int]) -> Dict[str, Any]:
+        # first_seq > after + 1 tells the client that older entries were already evicted
+        return {
+            "after": seq,
+            "first_seq": buffer.first_seq,
+            "last_seq": buffer.last_seq,
+            "entries": as_dicts(buffer.after(seq, limit))
+        }
+
+    @property
+    def snapshot_version(self) -> Tuple[int, int]:
+        # Changes whenever anything in initial_state() would
+        return (self._generation, self.lock_manager.epoch)
+
+    def initial_state(self) -> Dict[str, Any]:
+        # Shared between joiners until the next mutation; callers must not modify it
+        key = self.snapshot_version
+        if self._initial_state is None or self._initial_state[0] != key:
+            snapshot = {
+                "revision": self.document.revision,
+                "xml": self.document.xml,
+                "locks": self.lock_manager.snapshot(),
+                "chat": self.chat,
+                "logs": self.logs
             }
+            self._initial_state = (key, snapshot)
+        return self._initial_state[1]
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "xml": self.document.xml,
+            "locks": self.lock_manager.locks,
+            "logs": self.logs,
+            "versions": self.versions,
+            "chat": self.chat,
+            "revision": self.document.revision,
+            "last_updated": self.document.last_updated
+        }
+
+    def export(self) -> Dict[str, Any]:
+        return {
+            "xml": self.document.xml,
+            "revision": self.document.revision,
+            "last_updated": self.document.last_updated,
+            "logs": self.activity.export(),
+            "chat": self.chat_history.export(),
+            "versions": self.version_store.export()
+        }
+
+    def restore(self, snapshot: Dict[str, Any]):
+        self.document.load(snapshot["xml"], snapshot["revision"], snapshot.get("last_updated"))
+        self.activity.restore(snapshot.get("logs", []))
+        self.chat_history.restore(snapshot.get("chat", []))
+        self.version_store.restore(snapshot.get("versions"))
+        self.model = None
+        self._generation += 1
+
+    def apply_op(self, op: str, data: Dict[str, Any]):
+        # Replays a journaled mutation without notifying listeners
+        if op == "xml":
+            self.document.load(data["xml"], data["revision"], self.document.last_updated)
+            self.model = None
+        elif op == "version":
+            self.version_store.save(self.document.xml, data.get("author"))
+        elif op == "log":
+            self.activity.load(data)
+        elif op == "chat":
+            self.chat_history.load(data)
+        elif op == "reset":
+            self._reset()
+        self._generation += 1
 
     def get_last_updated(self) -> str:
-        with self._lock:
-            return self._state["last_updated"]
+        return self.document.last_updated
 
     def reset(self):
-        blank_xml = """<?xml version="1.0" encoding="UTF-8"?>
-<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="Definitions_1" targetNamespace="http://bpmn.io/schema/bpmn">
-  <bpmn:process id="Process_1" isExecutable="false">
-    <bpmn:startEvent id="StartEvent_1"/>
-  </bpmn:process>
-  <bpmndi:BPMNDiagram id="BPMNDiagram_1">
-    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
-      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_2" bpmnElement="StartEvent_1">
-        <dc:Bounds x="179" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-    </bpmndi:BPMNPlane>
-  </bpmndi:BPMNDiagram>
-</bpmn:definitions>"""
-        with self._lock:
-            self._state["xml"] = blank_xml
-            self._state["locks"] = {}
-            self._state["logs"] = []
-            self._state["versions"] = []
-            self._state["chat"] = []
-            self._state["last_updated"] = None
-
-diagram_state = DiagramState()
+        self._reset()
+        self._notify("reset", {})
+
+    def _reset(self):
+        self.document.reset()
+        self.model = None
+        self.lock_manager.clear()
+        self.activity.clear()
+        self.version_store.clear()
+        self.chat_history.clear()
+        self._generation += 1
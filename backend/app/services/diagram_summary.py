@@ -1,103 +1,196 @@
+import hashlib
+import time
 import xml.etree.ElementTree as ET
-from typing import Dict, List
-from collections import Counter
+from collections import Counter, OrderedDict
+from typing import AsyncIterable, Dict, Optional, Tuple
+from app import config
+from app.services.workers import worker_pool
+from app.services.metrics import metrics
+from app.services.diagram_graph import GraphCollector, analyze_graph
+from app.services.xml_ingest import FanOut, StreamingParser, check_xml
+
+BPMN_NS = "{http://www.omg.org/spec/BPMN/20100524/MODEL}"
+PROCESS_TAG = BPMN_NS + "process"
+
+ELEMENT_TYPES = frozenset([
+    'startEvent', 'endEvent', 'task', 'userTask', 'serviceTask',
+    'scriptTask', 'businessRuleTask', 'manualTask', 'sendTask',
+    'receiveTask', 'exclusiveGateway', 'inclusiveGateway',
+    'parallelGateway', 'eventBasedGateway', 'complexGateway',
+    'intermediateThrowEvent', 'intermediateCatchEvent', 'boundaryEvent'
+])
+
+TASK_TYPES = ['task', 'userTask', 'serviceTask', 'scriptTask',
+              'businessRuleTask', 'manualTask', 'sendTask', 'receiveTask']
+
+GATEWAY_TYPES = ['exclusiveGateway', 'inclusiveGateway', 'parallelGateway',
+                 'eventBasedGateway', 'complexGateway']
+
+class AnalysisCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, value: Dict):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+analysis_cache = AnalysisCache(config.SUMMARY_CACHE_SIZE)
+
+def xml_digest(xml_string: str) -> str:
+    return hashlib.sha1(xml_string.encode("utf-8")).hexdigest()
 
 def analyze_bpmn_diagram(xml_string: str) -> Dict:
-    try:
-        root = ET.fromstring(xml_string)
-        namespaces = {
-            'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-            'bpmndi': 'http://www.omg.org/spec/BPMN/20100524/DI'
-        }
-        
-        processes = root.findall('.//bpmn:process', namespaces)
-        process_count = len(processes)
-        
-        element_types = Counter()
-        element_names = []
-        
-        for process in processes:
-            process_name = process.get('name', 'Unnamed Process')
-            element_names.append(process_name)
-            
-            for elem_type in ['startEvent', 'endEvent', 'task', 'userTask', 'serviceTask', 
-                            'scriptTask', 'businessRuleTask', 'manualTask', 'sendTask', 
-                            'receiveTask', 'exclusiveGateway', 'inclusiveGateway', 
-                            'parallelGateway', 'eventBasedGateway', 'complexGateway',
-                            'intermediateThrowEvent', 'intermediateCatchEvent', 'boundaryEvent']:
-                elements = process.findall(f'.//bpmn:{elem_type}', namespaces)
-                if elements:
-                    count = len(elements)
-                    element_types[elem_type] += count
-                    
-                    for elem in elements:
-                        name = elem.get('name')
-                        if name:
-                            element_names.append(name)
-        
-        sequence_flows = root.findall('.//bpmn:sequenceFlow', namespaces)
-        flow_count = len(sequence_flows)
-        
-        message_flows = root.findall('.//bpmn:messageFlow', namespaces)
-        message_flow_count = len(message_flows)
-        
-        if process_count == 0:
-            summary_text = "This diagram appears to be empty or contains only basic structure."
+    key = xml_digest(xml_string)
+    analysis = analysis_cache.get(key)
+    if analysis is None:
+        started = time.perf_counter()
+        analysis = _analyze(xml_string)
+        if metrics.enabled:
+            metrics.analysis_duration.observe(time.perf_counter() - started)
+        analysis_cache.put(key, analysis)
+    return dict(analysis)
+
+async def analyze_bpmn_diagram_async(xml_string: str) -> Dict:
+    # Parsing runs on the worker pool so the event loop keeps serving sockets
+    key = xml_digest(xml_string)
+    analysis = analysis_cache.get(key)
+    if analysis is None:
+        started = time.perf_counter()
+        analysis = await worker_pool.run(_analyze, xml_string)
+        if metrics.enabled:
+            metrics.analysis_duration.observe(time.perf_counter() - started)
+        analysis_cache.put(key, analysis)
+    return dict(analysis)
+
+class ElementCounter:
+    # Streaming handler for one pass over the document; it keeps only counters and the
+    # current process nesting, so memory does not grow with the diagram
+    def __init__(self):
+        self.process_count = 0
+        self.process_name = None
+        self.process_depth = 0
+        self.element_types = Counter()
+        self.flow_count = 0
+        self.message_flow_count = 0
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        if not tag.startswith(BPMN_NS):
+            return
+        local = tag[len(BPMN_NS):]
+        if local == "process":
+            self.process_count += 1
+            self.process_depth += 1
+            if self.process_name is None:
+                self.process_name = attrib.get('name', 'Unnamed Process')
+        elif local == "sequenceFlow":
+            self.flow_count += 1
+        elif local == "messageFlow":
+            self.message_flow_count += 1
+        elif self.process_depth and local in ELEMENT_TYPES:
+            self.element_types[local] += 1
+
+    def end(self, tag: str):
+        if tag == PROCESS_TAG:
+            self.process_depth -= 1
+
+    def counts(self):
+        return self.process_count, self.process_name, self.element_types, self.flow_count, self.message_flow_count
+
+def _scan(xml_string: str) -> Tuple[ElementCounter, GraphCollector]:
+    # Element counts and the flow graph come out of the same streaming pass
+    check_xml(xml_string)
+    counter = ElementCounter()
+    collector = GraphCollector()
+    parser = StreamingParser(FanOut(counter, collector))
+    parser.feed(xml_string)
+    parser.close()
+    return counter, collector
+
+async def analyze_bpmn_stream(chunks: AsyncIterable[bytes]) -> Dict:
+    # Summary of an upload that is never held in memory: each chunk is parsed as it arrives
+    # and limit violations or DTDs abort before the rest is read
+    counter = ElementCounter()
+    parser = StreamingParser(counter)
+    async for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+    parser.close()
+    return analysis_from_counts(*counter.counts())
+
+def _summarize(process_count: int, process_name: Optional[str], element_types: Counter, flow_count: int) -> str:
+    if process_count == 0:
+        return "This diagram appears to be empty or contains only basic structure."
+
+    summary_parts = []
+
+    if process_name and process_name != "Unnamed Process":
+        summary_parts.append(f"This diagram shows a process called '{process_name}'.")
+    else:
+        summary_parts.append("This diagram shows a business process.")
+
+    start_events = element_types.get('startEvent', 0)
+    if start_events > 0:
+        if start_events == 1:
+            summary_parts.append("The process begins with a start event.")
         else:
-            summary_parts = []
-            
-            process_name = element_names[0] if element_names else "the process"
-            if process_name and process_name != "Unnamed Process":
-                summary_parts.append(f"This diagram shows a process called '{process_name}'.")
-            else:
-                summary_parts.append("This diagram shows a business process.")
-            
-            start_events = element_types.get('startEvent', 0)
-            if start_events > 0:
-                if start_events == 1:
-                    summary_parts.append("The process begins with a start event.")
-                else:
-                    summary_parts.append(f"The process begins with {start_events} start events.")
-            
-            total_tasks = sum(element_types.get(t, 0) for t in 
-                            ['task', 'userTask', 'serviceTask', 'scriptTask', 
-                             'businessRuleTask', 'manualTask', 'sendTask', 'receiveTask'])
-            if total_tasks > 0:
-                if total_tasks == 1:
-                    summary_parts.append("Then it performs one task.")
-                else:
-                    summary_parts.append(f"Then it performs {total_tasks} tasks.")
-            
-            total_gateways = sum(element_types.get(g, 0) for g in 
-                               ['exclusiveGateway', 'inclusiveGateway', 'parallelGateway', 
-                                'eventBasedGateway', 'complexGateway'])
-            if total_gateways > 0:
-                if total_gateways == 1:
-                    summary_parts.append("The process includes a decision point where the flow can take different paths.")
-                else:
-                    summary_parts.append(f"The process includes {total_gateways} decision points where the flow can branch.")
-            
-            end_events = element_types.get('endEvent', 0)
-            if end_events > 0:
-                if end_events == 1:
-                    summary_parts.append("Finally, the process ends with an end event.")
-                else:
-                    summary_parts.append(f"The process can end at {end_events} different end points.")
-            
-            if flow_count > 0 and flow_count > 1:
-                summary_parts.append(f"All steps are connected through {flow_count} flow connections.")
-            
-            summary_text = " ".join(summary_parts)
-        
-        return {
-            "summary": summary_text,
-            "process_count": process_count,
-            "element_counts": dict(element_types),
-            "flow_count": flow_count,
-            "message_flow_count": message_flow_count,
-            "total_elements": sum(element_types.values())
-        }
-        
+            summary_parts.append(f"The process begins with {start_events} start events.")
+
+    total_tasks = sum(element_types.get(t, 0) for t in TASK_TYPES)
+    if total_tasks > 0:
+        if total_tasks == 1:
+            summary_parts.append("Then it performs one task.")
+        else:
+            summary_parts.append(f"Then it performs {total_tasks} tasks.")
+
+    total_gateways = sum(element_types.get(g, 0) for g in GATEWAY_TYPES)
+    if total_gateways > 0:
+        if total_gateways == 1:
+            summary_parts.append("The process includes a decision point where the flow can take different paths.")
+        else:
+            summary_parts.append(f"The process includes {total_gateways} decision points where the flow can branch.")
+
+    end_events = element_types.get('endEvent', 0)
+    if end_events > 0:
+        if end_events == 1:
+            summary_parts.append("Finally, the process ends with an end event.")
+        else:
+            summary_parts.append(f"The process can end at {end_events} different end points.")
+
+    if flow_count > 1:
+        summary_parts.append(f"All steps are connected through {flow_count} flow connections.")
+
+    return " ".join(summary_parts)
+
+def analysis_from_counts(process_count: int, process_name: Optional[str], element_types: Counter,
+                         flow_count: int, message_flow_count: int) -> Dict:
+    return {
+        "summary": _summarize(process_count, process_name, element_types, flow_count),
+        "process_count": process_count,
+        "element_counts": dict(element_types),
+        "flow_count": flow_count,
+        "message_flow_count": message_flow_count,
+        "total_elements": sum(element_types.values())
+    }
+
+def _analyze(xml_string: str) -> Dict:
+    try:
+        counter, collector = _scan(xml_string)
+        return {**analysis_from_counts(*counter.counts()), "graph": analyze_graph(collector.graph())}
     except ET.ParseError as e:
         return {
             "summary": f"Error parsing BPMN XML: {str(e)}",
@@ -108,4 +201,3 @@ def analyze_bpmn_diagram(xml_string: str) -> Dict:
             "summary": f"Error analyzing diagram: {str(e)}",
             "error": True
         }
-
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+BLANK_DIAGRAM = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="Definitions_1" targetNamespace="http://bpmn.io/schema/bpmn">
+  <bpmn:process id="Process_1" isExecutable="false">
+    <bpmn:startEvent id="StartEvent_1"/>
+  </bpmn:process>
+  <bpmndi:BPMNDiagram id="BPMNDiagram_1">
+    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
+      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_2" bpmnElement="StartEvent_1">
+        <dc:Bounds x="179" y="99" width="36" height="36"/>
+      </bpmndi:BPMNShape>
+    </bpmndi:BPMNPlane>
+  </bpmndi:BPMNDiagram>
+</bpmn:definitions>"""
+
+EMPTY_DIAGRAM = "<bpmn:definitions xmlns:bpmn='http://www.omg.org/spec/BPMN/20100524/MODEL'></bpmn:definitions>"
+
+class Document:
+    # Owned by the event loop: every method runs to completion without awaiting,
+    # so a commit and its revision bump are atomic with respect to other coroutines.
+    # Writers that await between reading and writing (e.g. off-loop patching) must
+    # pass the revision they read as expected_revision.
+    __slots__ = ("xml", "revision", "last_updated")
+
+    def __init__(self, xml: str = EMPTY_DIAGRAM, revision: int = 0):
+        self.xml = xml
+        self.revision = revision
+        self.last_updated: Optional[str] = None
+
+    def snapshot(self) -> Tuple[str, int]:
+        return self.xml, self.revision
+
+    def commit(self, xml: str, expected_revision: Optional[int] = None) -> Optional[int]:
+        if expected_revision is not None and expected_revision != self.revision:
+            return None
+        self.xml = xml
+        self.revision += 1
+        self.last_updated = datetime.now(timezone.utc).isoformat()
+        return self.revision
+
+    def load(self, xml: str, revision: int, last_updated: Optional[str] = None):
+        self.xml = xml
+        self.revision = revision
+        self.last_updated = last_updated
+
+    def reset(self):
+        self.xml = BLANK_DIAGRAM
+        self.revision += 1
+        self.last_updated = None
@@ -0,0 +1,76 @@
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Type
+
+class LogEntry(NamedTuple):
+    seq: int
+    timestamp: str
+    message: str
+
+class ChatEntry(NamedTuple):
+    seq: int
+    timestamp: str
+    username: str
+    message: str
+
+class HistoryBuffer:
+    # Fixed-capacity ring of records with contiguous sequence numbers; appends and evictions are O(1)
+    def __init__(self, record: Type[NamedTuple], capacity: int):
+        self.record = record
+        self._items: Deque[NamedTuple] = deque(maxlen=max(1, capacity))
+        self.last_seq = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._items.maxlen
+
+    @property
+    def first_seq(self) -> int:
+        return self._items[0].seq if self._items else self.last_seq + 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def append(self, *fields, seq: int = None, timestamp: str = None) -> NamedTuple:
+        self.last_seq = self.last_seq + 1 if seq is None else seq
+        entry = self.record(self.last_seq, timestamp or datetime.now(timezone.utc).isoformat(), *fields)
+        self._items.append(entry)
+        return entry
+
+    def after(self, seq: int = 0, limit: Optional[int] = None) -> List[NamedTuple]:
+        # Entries with a sequence number greater than seq, oldest first
+        count = len(self._items)
+        skip = min(count, max(0, seq - self.first_seq + 1))
+        end = count if limit is None else min(count, skip + max(0, limit))
+        if skip >= end:
+            return []
+        if skip > count // 2:
+            # Tail reads (the common "what did I miss" case) walk from the right end
+            tail = list(islice(reversed(self._items), count - end, count - skip))
+            tail.reverse()
+            return tail
+        return list(islice(self._items, skip, end))
+
+    def resize(self, capacity: int):
+        self._items = deque(self._items, maxlen=max(1, capacity))
+
+    def clear(self):
+        self._items.clear()
+
+    def export(self) -> List[Dict[str, Any]]:
+        return [entry._asdict() for entry in self._items]
+
+    def restore(self, items: Iterable[Dict[str, Any]]):
+        self._items.clear()
+        self.last_seq = 0
+        for item in items:
+            self.load(item)
+
+    def load(self, item: Dict[str, Any]) -> NamedTuple:
+        # Older exports have no sequence numbers; number them on arrival
+        fields = [item[name] for name in self.record._fields[2:]]
+        return self.append(*fields, seq=item.get("seq"), timestamp=item.get("timestamp"))
+
+def as_dicts(entries: Iterable[NamedTuple]) -> List[Dict[str, Any]]:
+    return [entry._asdict() for entry in entries]
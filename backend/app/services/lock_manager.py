@@ -0,0 +1,134 @@
+import heapq
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app import config
+from app.services.metrics import metrics
+
+class LockLease:
+    __slots__ = ("element_id", "username", "expires_at")
+
+    def __init__(self, element_id: str, username: str, expires_at: float):
+        self.element_id = element_id
+        self.username = username
+        self.expires_at = expires_at
+
+class LockManager:
+    def __init__(self, lease_seconds: float = None):
+        self.lease_seconds = config.LOCK_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.epoch = 0
+        self._by_element: Dict[str, LockLease] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+        self._expiries: List[Tuple[float, str]] = []
+
+    @property
+    def locks(self) -> Dict[str, str]:
+        return {element_id: lease.username for element_id, lease in self._by_element.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"epoch": self.epoch, "locks": self.locks}
+
+    def holder(self, element_id: str, now: float = None) -> Optional[str]:
+        lease = self._by_element.get(element_id)
+        if lease is None or self._expired(lease, now):
+            return None
+        return lease.username
+
+    def held_by_others(self, username: str, now: float = None) -> Dict[str, str]:
+        now = time.monotonic() if now is None else now
+        return {
+            element_id: lease.username for element_id, lease in self._by_element.items()
+            if lease.username != username and not self._expired(lease, now)
+        }
+
+    def elements_of(self, username: str) -> Set[str]:
+        return set(self._by_user.get(username, ()))
+
+    def acquire(self, element_id: str, username: str, now: float = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        now = time.monotonic() if now is None else now
+        lease = self._by_element.get(element_id)
+        if lease is not None and not self._expired(lease, now):
+            if lease.username != username:
+                if metrics.enabled:
+                    metrics.lock_conflicts.inc()
+                return False, None
+            self._extend(lease, now)
+            return True, None
+
+        if lease is not None:
+            self._drop(lease)
+        lease = LockLease(element_id, username, 0.0)
+        self._by_element[element_id] = lease
+        self._by_user.setdefault(username, set()).add(element_id)
+        self._extend(lease, now)
+        return True, self._delta([(element_id, username)])
+
+    def release(self, element_id: str, username: str = None, now: float = None) -> Optional[Dict[str, Any]]:
+        lease = self._by_element.get(element_id)
+        if lease is None:
+            return None
+        if username is not None and lease.username != username and not self._expired(lease, now):
+            return None
+        self._drop(lease)
+        return self._delta([(element_id, None)])
+
+    def release_user(self, username: str) -> Optional[Dict[str, Any]]:
+        element_ids = self._by_user.get(username)
+        if not element_ids:
+            return None
+        changes = []
+        for element_id in list(element_ids):
+            self._drop(self._by_element[element_id])
+            changes.append((element_id, None))
+        return self._delta(changes)
+
+    def renew(self, username: str, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        element_ids = self._by_user.get(username, ())
+        for element_id in element_ids:
+            self._extend(self._by_element[element_id], now)
+        return len(element_ids)
+
+    def expire(self, now: float = None) -> Optional[Dict[str, Any]]:
+        now = time.monotonic() if now is None else now
+        changes = []
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, element_id = heapq.heappop(self._expiries)
+            lease = self._by_element.get(element_id)
+            # Heap entries are lazily invalidated by renewals and releases
+            if lease is None or lease.expires_at != expires_at:
+                continue
+            self._drop(lease)
+            changes.append((element_id, None))
+        return self._delta(changes) if changes else None
+
+    def clear(self):
+        self._by_element.clear()
+        self._by_user.clear()
+        self._expiries.clear()
+        self.epoch += 1
+
+    def _expired(self, lease: LockLease, now: float = None) -> bool:
+        if not self.lease_seconds:
+            return False
+        return lease.expires_at <= (time.monotonic() if now is None else now)
+
+    def _extend(self, lease: LockLease, now: float):
+        if not self.lease_seconds:
+            return
+        lease.expires_at = now + self.lease_seconds
+        heapq.heappush(self._expiries, (lease.expires_at, lease.element_id))
+
+    def _drop(self, lease: LockLease):
+        self._by_element.pop(lease.element_id, None)
+        owned = self._by_user.get(lease.username)
+        if owned is not None:
+            owned.discard(lease.element_id)
+            if not owned:
+                del self._by_user[lease.username]
+
+    def _delta(self, changes: List[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+        self.epoch += 1
+        return {
+            "epoch": self.epoch,
+            "changes": [{"element_id": element_id, "locked_by": username} for element_id, username in changes]
+        }
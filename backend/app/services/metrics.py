@@ -0,0 +1,160 @@
+import asyncio
+import inspect
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+from app import config
+from app.services.outbound import packet_event
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), collect: Callable[[], object] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # Optional callback read at scrape time: a number, or {label values: number}
+        self.collect = collect
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        if self.collect is not None:
+            collected = self.collect()
+            self.values = collected if isinstance(collected, dict) else {(): collected}
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in sorted(self.values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str):
+        self.values[label_values] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class Metrics:
+    # Call sites check `metrics.enabled` first, so a disabled registry costs one attribute lookup
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: List = []
+        self.events = self.counter("bpmn_events_total", "Socket.IO events handled", ("event",))
+        self.event_errors = self.counter("bpmn_event_errors_total", "Socket.IO handlers that raised", ("event",))
+        self.event_duration = self.histogram("bpmn_event_duration_seconds", "Socket.IO handler latency", ("event",))
+        self.emitted_messages = self.counter("bpmn_emitted_messages_total", "Socket.IO messages sent to clients", ("event",))
+        self.emitted_bytes = self.counter("bpmn_emitted_bytes_total", "Encoded Socket.IO bytes sent to clients", ("event",))
+        self.loop_lag = self.histogram("bpmn_event_loop_lag_seconds", "Event loop scheduling delay")
+        self.last_loop_lag = self.gauge("bpmn_event_loop_last_lag_seconds", "Most recent event loop scheduling delay")
+        self.commit_duration = self.histogram("bpmn_state_commit_seconds", "Time the event loop spends committing a diagram revision")
+        self.commit_conflicts = self.counter("bpmn_state_commit_conflicts_total", "Commits rejected because the base revision was stale")
+        self.commits_squashed = self.counter("bpmn_diagram_updates_squashed_total", "update_diagram calls folded into a later commit of the same burst")
+        self.activity_collapsed = self.counter("bpmn_activity_entries_collapsed_total", "Activity entries folded into an earlier entry of the same flush window")
+        self.lock_conflicts = self.counter("bpmn_element_lock_conflicts_total", "Element lock requests denied because another user holds the lock")
+        self.analysis_duration = self.histogram("bpmn_summary_analysis_seconds", "Uncached diagram analysis duration")
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = (), collect: Callable[[], object] = None) -> Counter:
+        return self._register(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = (), collect: Callable[[], object] = None) -> Gauge:
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help, labels))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def instrument(self, sio, namespace: str = "/"):
+        handlers = sio.handlers.get(namespace, {})
+        for event, handler in list(handlers.items()):
+            handlers[event] = self._timed(event, handler)
+        send = sio._send_eio_packet
+
+        async def counted_send(eio_sid, pkt):
+            data = pkt.data
+            event = packet_event(data)
+            self.emitted_messages.inc(event)
+            self.emitted_bytes.inc(event, amount=len(data) if data is not None else 0)
+            await send(eio_sid, pkt)
+
+        sio._send_eio_packet = counted_send
+
+    def _timed(self, event: str, handler):
+        parameters = inspect.signature(handler).parameters.values()
+        # Trim extra arguments here (e.g. the disconnect reason) rather than letting
+        # python-socketio retry on TypeError, which would be counted twice
+        accepted = None if any(p.kind == p.VAR_POSITIONAL for p in parameters) else len(parameters)
+
+        @wraps(handler)
+        async def timed(*args):
+            started = time.perf_counter()
+            try:
+                return await handler(*args[:accepted])
+            except Exception:
+                self.event_errors.inc(event)
+                raise
+            finally:
+                self.events.inc(event)
+                self.event_duration.observe(time.perf_counter() - started, event)
+        return timed
+
+    async def watch_loop_lag(self, interval: float = None):
+        interval = config.METRICS_LOOP_LAG_INTERVAL_MS / 1000 if interval is None else interval
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - started - interval)
+            self.loop_lag.observe(lag)
+            self.last_loop_lag.set(lag)
+
+metrics = Metrics(bool(config.METRICS_ENABLED))
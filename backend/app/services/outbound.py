@@ -0,0 +1,228 @@
+import asyncio
+import copy
+import json
+import re
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from app import config
+
+# Event name of an encoded Socket.IO EVENT packet on the default namespace: 2<ack id>["name",...
+_EVENT_NAME = re.compile(r'2\d*\["([^"]*)"')
+
+STATE, ACTIVITY, PRESENCE = 0, 1, 2
+PRIORITIES = {
+    "activity_log_batch": ACTIVITY,
+    "user_update": ACTIVITY,
+    "users_delta": ACTIVITY,
+    "cursor_batch": PRESENCE,
+}
+# A newer message for the same event makes a queued older one pointless
+COALESCE = frozenset(["diagram_update", "locks_update", "user_update", "cursor_batch"])
+
+def _merge_presence(older: dict, newer: dict) -> dict:
+    # Presence batches are deltas, so a newer one only replaces the users it mentions
+    merged = {}
+    for key in ("cursors", "editing"):
+        by_user = {item["username"]: item for item in older.get(key, ())}
+        by_user.update((item["username"], item) for item in newer.get(key, ()))
+        merged[key] = list(by_user.values())
+    return merged
+
+# Deltas that are folded into the queued message instead of replacing it
+MERGE = {"cursor_batch": _merge_presence}
+
+def packet_event(data) -> str:
+    match = _EVENT_NAME.match(data) if isinstance(data, str) else None
+    return match.group(1) if match else "other"
+
+class OutboundEntry:
+    __slots__ = ("event", "pkt", "size", "alive")
+
+    def __init__(self, event: str, pkt, size: int):
+        self.event = event
+        self.pkt = pkt
+        self.size = size
+        self.alive = True
+
+class OutboundQueue:
+    # Messages held back for one slow connection, one FIFO per priority class.
+    # Superseded entries are marked dead and skipped, so coalescing is O(1).
+    __slots__ = ("lanes", "latest", "count", "nbytes", "task", "resync_pending", "presence_lost")
+
+    def __init__(self):
+        self.lanes: List[Deque[OutboundEntry]] = [deque(), deque(), deque()]
+        self.latest: Dict[str, OutboundEntry] = {}
+        self.count = 0
+        self.nbytes = 0
+        self.task: Optional[asyncio.Task] = None
+        self.resync_pending = False
+        self.presence_lost = False
+
+    def push(self, entry: OutboundEntry, priority: int):
+        self.lanes[priority].append(entry)
+        self.count += 1
+        self.nbytes += entry.size
+
+    def discard(self, entry: OutboundEntry):
+        entry.alive = False
+        self.count -= 1
+        self.nbytes -= entry.size
+
+    def pop(self) -> Optional[OutboundEntry]:
+        for lane in self.lanes:
+            while lane:
+                entry = lane.popleft()
+                if entry.alive:
+                    self.discard(entry)
+                    return entry
+        return None
+
+    def shed(self, priority: int) -> List[OutboundEntry]:
+        # Drops every live entry in one priority class, oldest first
+        dropped = []
+        lane = self.lanes[priority]
+        while lane:
+            entry = lane.popleft()
+            if entry.alive:
+                self.discard(entry)
+                dropped.append(entry)
+        return dropped
+
+class OutboundQueues:
+    # Sits in front of Engine.IO's unbounded per-socket queue. Healthy connections are
+    # sent to directly; once a socket's Engine.IO backlog reaches the congestion mark,
+    # further messages wait here where they can be prioritized, coalesced and bounded.
+    def __init__(self, max_messages: int = None, max_bytes: int = None, congestion: int = None, poll_ms: int = None):
+        self.max_messages = config.OUTBOUND_MAX_MESSAGES if max_messages is None else max_messages
+        self.max_bytes = config.OUTBOUND_MAX_BYTES if max_bytes is None else max_bytes
+        self.congestion = config.OUTBOUND_CONGESTION_PACKETS if congestion is None else congestion
+        self.poll_interval = (config.OUTBOUND_POLL_MS if poll_ms is None else poll_ms) / 1000
+        self.queues: Dict[str, OutboundQueue] = {}
+        self.dropped = Counter()
+        self.coalesced = Counter()
+        self.resyncs = 0
+        self.disconnects = 0
+        # Called with the Engine.IO sid of a connection whose queue overflowed
+        self.on_overflow: Optional[Callable[[str], Awaitable[None]]] = None
+        # Called once a connection that had presence deltas shed has caught up again
+        self.on_presence_lost: Optional[Callable[[str], Awaitable[None]]] = None
+        self._sio = None
+        self._send = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages > 0
+
+    def install(self, sio):
+        if not self.enabled:
+            return
+        self._sio = sio
+        self._send = sio._send_eio_packet
+        sio._send_eio_packet = self.send
+
+    def backlog(self, eio_sid: str) -> Optional[int]:
+        # Packets Engine.IO has not handed to the transport yet; None once the socket is gone
+        socket = self._sio.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else None
+
+    def queued_bytes(self) -> int:
+        return sum(queue.nbytes for queue in self.queues.values())
+
+    async def send(self, eio_sid: str, pkt):
+        queue = self.queues.get(eio_sid)
+        if queue is None and (self.backlog(eio_sid) or 0) < self.congestion:
+            await self._send(eio_sid, pkt)
+            return
+        if queue is None:
+            queue = self.queues[eio_sid] = OutboundQueue()
+        self._enqueue(eio_sid, queue, pkt)
+        if queue.task is None and eio_sid in self.queues:
+            queue.task = asyncio.get_running_loop().create_task(self._drain(eio_sid, queue))
+
+    def _enqueue(self, eio_sid: str, queue: OutboundQueue, pkt):
+        data = pkt.data
+        event = packet_event(data)
+        if event in COALESCE:
+            previous = queue.latest.get(event)
+            if previous is not None and previous.alive:
+                queue.discard(previous)
+                self.coalesced[event] += 1
+                merge = MERGE.get(event)
+                if merge is not None:
+                    pkt = self._merged(previous.pkt, pkt, merge)
+                    data = pkt.data
+        entry = OutboundEntry(event, pkt, len(data) if data is not None else 0)
+        queue.push(entry, PRIORITIES.get(event, STATE))
+        if event in COALESCE:
+            queue.latest[event] = entry
+        if self._over_limit(queue):
+            self._relieve(eio_sid, queue)
+
+    @staticmethod
+    def _merged(older, newer, merge):
+        start = older.data.index("[")
+        event, previous = json.loads(older.data[start:])
+        _, current = json.loads(newer.data[newer.data.index("["):])
+        pkt = copy.copy(newer)
+        pkt.data = newer.data[:start] + json.dumps([event, merge(previous, current)], separators=(",", ":"))
+        return pkt
+
+    def _over_limit(self, queue: OutboundQueue) -> bool:
+        return queue.count > self.max_messages or (self.max_bytes > 0 and queue.nbytes > self.max_bytes)
+
+    def _relieve(self, eio_sid: str, queue: OutboundQueue):
+        # Presence goes first, then activity; document state is never silently dropped
+        for priority in (PRESENCE, ACTIVITY):
+            for entry in queue.shed(priority):
+                self.dropped[entry.event] += 1
+                if entry.event in MERGE:
+                    queue.presence_lost = True
+            if not self._over_limit(queue):
+                return
+        for entry in queue.shed(STATE):
+            self.dropped[entry.event] += 1
+        if queue.resync_pending or self.on_overflow is None:
+            # Still over the limit before the last resync got through: give up on this client
+            self.disconnects += 1
+            self._close(eio_sid, queue)
+            asyncio.get_running_loop().create_task(self._sio.eio.disconnect(eio_sid))
+            return
+        # Everything it missed is replaced by one fresh snapshot
+        self.resyncs += 1
+        queue.resync_pending = True
+        asyncio.get_running_loop().create_task(self._resync(eio_sid, queue))
+
+    async def _resync(self, eio_sid: str, queue: OutboundQueue):
+        try:
+            await self.on_overflow(eio_sid)
+        finally:
+            # No snapshot was queued (e.g. the room is gone), so there is nothing to wait for
+            if queue.resync_pending and not any(entry.alive and entry.event == "initial_state" for entry in queue.lanes[STATE]):
+                queue.resync_pending = False
+
+    def _close(self, eio_sid: str, queue: OutboundQueue):
+        if self.queues.get(eio_sid) is queue:
+            del self.queues[eio_sid]
+        if queue.task is not None and queue.task is not asyncio.current_task():
+            queue.task.cancel()
+
+    async def _drain(self, eio_sid: str, queue: OutboundQueue):
+        try:
+            while queue.count or queue.resync_pending:
+                backlog = self.backlog(eio_sid)
+                if backlog is None:
+                    return
+                if backlog >= self.congestion or not queue.count:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                entry = queue.pop()
+                if entry.event == "initial_state":
+                    queue.resync_pending = False
+                await self._send(eio_sid, entry.pkt)
+        finally:
+            self._close(eio_sid, queue)
+        if queue.presence_lost and self.on_presence_lost is not None and self.backlog(eio_sid) is not None:
+            # Shed deltas cannot be replayed, so the caught-up client gets the full presence state
+            await self.on_presence_lost(eio_sid)
+
+outbound = OutboundQueues()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from app import config
+from app.services.diagram_state import DiagramState
+from app.services.storage import StorageBackend, create_storage
+
+logger = logging.getLogger(__name__)
+
+class RoomJournal:
+    def __init__(self, room_id: str, state: DiagramState, seq: int):
+        self.room_id = room_id
+        self.state = state
+        self.seq = seq
+        self.pending: List[Dict[str, Any]] = []
+        self.ops_since_snapshot = 0
+
+    def record(self, op: str, data: Dict[str, Any]):
+        # Runs on the hot path: only appends to memory
+        self.seq += 1
+        self.pending.append({"seq": self.seq, "op": op, "data": data})
+
+class PersistenceManager:
+    def __init__(self, storage: StorageBackend, flush_interval_ms: int = None, snapshot_every: int = None):
+        self.storage = storage
+        self.flush_interval = (config.STORAGE_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.snapshot_every = config.STORAGE_SNAPSHOT_EVERY_OPS if snapshot_every is None else snapshot_every
+        self.journals: Dict[str, RoomJournal] = {}
+        self._unloading: Dict[str, asyncio.Task] = {}
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._closed = False
+
+    def _lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    async def hydrate(self, room_id: str, state: DiagramState):
+        unloading = self._unloading.get(room_id)
+        if unloading is not None:
+            await asyncio.shield(unloading)
+
+        seq, replayed = await self._replay(room_id, state)
+        journal = RoomJournal(room_id, state, seq)
+        journal.ops_since_snapshot = replayed
+        self.journals[room_id] = journal
+        state.listeners.append(journal.record)
+
+    async def read(self, room_id: str) -> DiagramState:
+        # A stored room's state without opening it: nothing is journaled
+        state = DiagramState()
+        await self._replay(room_id, state)
+        return state
+
+    async def room_ids(self) -> List[str]:
+        return await asyncio.to_thread(self.storage.room_ids)
+
+    async def _replay(self, room_id: str, state: DiagramState) -> Tuple[int, int]:
+        snapshot, ops = await asyncio.to_thread(self.storage.load, room_id)
+        seq = 0
+        if snapshot is not None:
+            state.restore(snapshot)
+            seq = snapshot["seq"]
+        for op in ops:
+            state.apply_op(op["op"], op["data"])
+            seq = op["seq"]
+        return seq, len(ops)
+
+    def unload(self, room_id: str) -> Optional[asyncio.Task]:
+        journal = self.journals.get(room_id)
+        if journal is None or room_id in self._unloading:
+            return self._unloading.get(room_id)
+        if journal.record in journal.state.listeners:
+            journal.state.listeners.remove(journal.record)
+        task = asyncio.get_running_loop().create_task(self._unload(journal))
+        self._unloading[room_id] = task
+        task.add_done_callback(lambda _: self._unloading.pop(room_id, None))
+        return task
+
+    async def _unload(self, journal: RoomJournal):
+        # The journal stays registered until its final snapshot is written, so a failed write
+        # is retried here (and by close) instead of dropping the room's last edits
+        while True:
+            try:
+                await self._flush_journal(journal, snapshot=True)
+                break
+            except Exception:
+                logger.exception("Failed to persist room %s, retrying", journal.room_id)
+                if self._closed:
+                    return
+                await asyncio.sleep(self.flush_interval)
+        if self.journals.get(journal.room_id) is journal:
+            del self.journals[journal.room_id]
+
+    async def flush(self, snapshot: bool = False):
+        for journal in list(self.journals.values()):
+            await self._flush_journal(journal, snapshot)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Periodic flush failed")
+
+    async def close(self):
+        self._closed = True
+        if self._unloading:
+            await asyncio.gather(*self._unloading.values(), return_exceptions=True)
+        await self.flush(snapshot=True)
+        await asyncio.to_thread(self.storage.close)
+
+    async def _flush_journal(self, journal: RoomJournal, snapshot: bool):
+        async with self._lock():
+            ops, journal.pending = journal.pending, []
+            journal.ops_since_snapshot += len(ops)
+            compacted: Optional[Tuple[int, Dict[str, Any]]] = None
+            if journal.ops_since_snapshot and (snapshot or journal.ops_since_snapshot >= self.snapshot_every):
+                compacted = (journal.seq, journal.state.export())
+            if not ops and compacted is None:
+                return
+            try:
+                await asyncio.to_thread(self._write, journal.room_id, ops, compacted)
+            except Exception:
+                journal.pending[:0] = ops
+                journal.ops_since_snapshot -= len(ops)
+                raise
+            if compacted is not None:
+                journal.ops_since_snapshot = 0
+
+    def _write(self, room_id: str, ops: List[Dict[str, Any]], compacted: Optional[Tuple[int, Dict[str, Any]]]):
+        if ops:
+            self.storage.append(room_id, ops)
+        if compacted is not None:
+            self.storage.write_snapshot(room_id, *compacted)
+
+def create_persistence() -> Optional[PersistenceManager]:
+    storage = create_storage(config.STORAGE_BACKEND, config.STORAGE_PATH)
+    return PersistenceManager(storage) if storage is not None else None
+
+persistence = create_persistence()
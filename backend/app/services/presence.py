@@ -0,0 +1,113 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app import config
+
+FlushCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_UNSET = object()
+
+class PresenceAggregator:
+    def __init__(self, tick_hz: int = None):
+        hz = config.PRESENCE_TICK_HZ if tick_hz is None else tick_hz
+        self.interval = 1.0 / max(1, hz)
+        self.on_flush: Optional[FlushCallback] = None
+        self._cursors: Dict[str, Tuple[float, float]] = {}
+        self._sent_cursors: Dict[str, Tuple[float, float]] = {}
+        self._editing: Dict[str, Optional[str]] = {}
+        self._sent_editing: Dict[str, Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_flush = 0.0
+
+    def attach(self, on_flush: FlushCallback):
+        if self.on_flush is None:
+            self.on_flush = on_flush
+
+    def update_cursor(self, username: str, x: float, y: float):
+        self._cursors[username] = (x, y)
+        self._schedule()
+
+    def update_editing(self, username: str, element_id: Optional[str]):
+        self._editing[username] = element_id
+        self._schedule()
+
+    def remove_user(self, username: str):
+        self._cursors.pop(username, None)
+        self._sent_cursors.pop(username, None)
+        self._editing.pop(username, None)
+        self._sent_editing.pop(username, None)
+
+    def drain(self) -> Optional[Dict[str, Any]]:
+        cursors = []
+        for username, position in self._cursors.items():
+            if self._sent_cursors.get(username) != position:
+                self._sent_cursors[username] = position
+                cursors.append({"username": username, "x": position[0], "y": position[1]})
+        editing = []
+        for username, element_id in self._editing.items():
+            if self._sent_editing.get(username, _UNSET) != element_id:
+                self._sent_editing[username] = element_id
+                editing.append({"username": username, "element_id": element_id})
+        self._cursors.clear()
+        self._editing.clear()
+        if not cursors and not editing:
+            return None
+        return {"cursors": cursors, "editing": editing}
+
+    def snapshot(self) -> Dict[str, Any]:
+        # Everything flushed so far, for a client that missed some of the deltas
+        return {
+            "cursors": [{"username": username, "x": x, "y": y} for username, (x, y) in self._sent_cursors.items()],
+            "editing": [{"username": username, "element_id": element_id} for username, element_id in self._sent_editing.items()],
+        }
+
+    def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+
+    def _schedule(self):
+        if self.on_flush is None:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        delay = self._last_flush + self.interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._last_flush = loop.time()
+        batch = self.drain()
+        # Updates that arrive while emitting schedule the next tick
+        self._flush_task = None
+        if batch and self.on_flush is not None:
+            await self.on_flush(batch)
+
+class Debouncer:
+    # Collapses bursts of triggers into one callback per window (e.g. user lists during join storms)
+    def __init__(self, delay_ms: int = None):
+        self.delay = (config.PRESENCE_DEBOUNCE_MS if delay_ms is None else delay_ms) / 1000
+        self.callback: Optional[Callable[[], Awaitable[None]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def attach(self, callback: Callable[[], Awaitable[None]]):
+        if self.callback is None:
+            self.callback = callback
+
+    def trigger(self):
+        if self.callback is None:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._fire_later())
+
+    def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _fire_later(self):
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        self._task = None
+        if self.callback is not None:
+            await self.callback()
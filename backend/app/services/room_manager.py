@@ -0,0 +1,228 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.diagram_state import DiagramState
+from app.services.diagram_model import DiagramModel
+from app.services.diagram_graph import FlowGraph, analyze_graph
+from app.services.version_store import materialize
+from app.services.version_diff import ElementIndex, diff_indexes, element_index, index_from_model, version_indexes
+from app.services.workers import worker_pool
+from app.services.user_manager import UserManager
+from app.services.presence import PresenceAggregator, Debouncer
+from app.services.commit_scheduler import CommitScheduler
+from app.services.activity import ActivityPipeline
+from app.services.persistence import PersistenceManager, persistence
+from app.services.search_index import SearchIndex, search_index
+from app.utils import broadcast_cache
+from app import config
+
+DEFAULT_ROOM = "default"
+
+class Room:
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        sizes = config.ROOM_HISTORY_SIZES.get(room_id, {})
+        self.state = DiagramState(log_capacity=sizes.get("logs"), chat_capacity=sizes.get("chat"))
+        self.state.version_store.attach(worker_pool.run)
+        self.users = UserManager()
+        self.presence = PresenceAggregator()
+        self.user_updates = Debouncer()
+        self.commits = CommitScheduler()
+        self.activity = ActivityPipeline(self.state)
+        self._graph: Optional[Tuple[DiagramModel, int, Dict[str, Any]]] = None
+        self._index: Optional[Tuple[DiagramModel, int, ElementIndex]] = None
+
+    async def model(self) -> Tuple[DiagramModel, int]:
+        # Full rebuilds parse on the worker pool; patches keep the model current in place
+        xml, revision = self.state.document.snapshot()
+        model = self.state.current_model()
+        if model is None:
+            model = await worker_pool.run(DiagramModel.from_xml, xml)
+            self.state.set_model(model, revision)
+        return model, revision
+
+    async def graph(self) -> Tuple[DiagramModel, Dict[str, Any], int]:
+        model, revision = await self.model()
+        return model, await self._graph_for(model, revision), revision
+
+    async def _graph_for(self, model: DiagramModel, revision: int) -> Dict[str, Any]:
+        # Structural checks cached per revision. The compact graph is copied out of the model
+        # before the first await (patches mutate the model in place); the checks run on the pool.
+        cached = self._graph
+        if cached is not None and cached[0] is model and cached[1] == revision:
+            return cached[2]
+        analysis = await worker_pool.run(analyze_graph, FlowGraph.from_model(model))
+        if self.state.current_model() is model and self.state.revision == revision:
+            self._graph = (model, revision, analysis)
+        return analysis
+
+    async def summary(self) -> Dict[str, Any]:
+        model, revision = await self.model()
+        summary = {**model.analysis(), "revision": revision}
+        if model.valid:
+            summary["graph"] = await self._graph_for(model, revision)
+        return summary
+
+    async def version(self, version: int) -> Optional[Dict[str, Any]]:
+        # Deltas are replayed on the worker pool; a version still being encoded is returned as is
+        chain = self.state.version_store.chain(version)
+        if chain is None:
+            return None
+        entry, start, deltas = chain
+        entry["xml"] = start if isinstance(start, str) and not deltas else await worker_pool.run(materialize, start, deltas)
+        return entry
+
+    async def version_diff(self, version: int, to: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        # Element-level diff from a saved version to another one, or to the live diagram when
+        # to is None. None when a version is gone; an "error" entry when one does not parse.
+        try:
+            old = await self._version_index(version)
+            if to is None:
+                new, revision = await self._current_index()
+            else:
+                new, revision = await self._version_index(to), None
+        except ValueError as e:
+            return {"from": version, "to": to, "error": str(e)}
+        if old is None or new is None:
+            return None
+        diff = {"from": version, "to": to, **diff_indexes(old, new)}
+        if to is None:
+            diff["revision"] = revision
+        return diff
+
+    async def _version_index(self, version: int) -> Optional[ElementIndex]:
+        store = self.state.version_store
+        record = store.record(version)
+        if record is None:
+            return None
+        index = version_indexes.get(record.content_hash)
+        if index is None:
+            xml = (await self.version(version))["xml"]
+            index = await worker_pool.run(element_index, xml)
+            version_indexes.put(record.content_hash, index)
+        return index
+
+    async def _current_index(self) -> Tuple[ElementIndex, int]:
+        model, revision = await self.model()
+        if not model.valid:
+            raise ValueError(model.error)
+        cached = self._index
+        if cached is None or cached[0] is not model or cached[1] != revision:
+            # Built before any other await, so in-place patches cannot interleave
+            cached = self._index = (model, revision, index_from_model(model))
+        return cached[2], revision
+
+    async def locked_by_others(self, username: str, changed: List[str], removed: List[str]) -> Dict[str, str]:
+        # Elements of a patch (including shapes and removed descendants) someone else holds a lock on
+        foreign = self.state.lock_manager.held_by_others(username)
+        if not foreign:
+            return {}
+        model, _ = await self.model()
+        return {element_id: foreign[element_id] for element_id in sorted(model.affected(changed, removed)) if element_id in foreign}
+
+    async def commit_diagram(self, xml: str, username: str) -> Tuple[Optional[int], Optional[str]]:
+        # Full-document writes may not change elements another user has locked
+        state = self.state
+        for _ in range(3):
+            foreign = state.lock_manager.held_by_others(username)
+            if not foreign:
+                return state.commit(xml, username, save_version=True), None
+            current, revision = await self.model()
+            proposed = await worker_pool.run(DiagramModel.from_xml, xml)
+            if state.revision != revision or not state.lock_manager.held_by_others(username).items() <= foreign.items():
+                # The document or the locks moved while parsing; check against the new state
+                continue
+            if not proposed.valid:
+                return None, proposed.error
+            blocked = sorted(current.changed(proposed, foreign))
+            if blocked:
+                return None, f"Element '{blocked[0]}' is locked by {foreign[blocked[0]]}"
+            return state.commit(xml, username, expected_revision=revision, save_version=True, model=proposed), None
+        return None, "Diagram is changing too fast, please retry"
+
+    def is_empty(self) -> bool:
+        return not self.users.online_users
+
+    def close(self):
+        self.presence.close()
+        self.user_updates.close()
+        self.commits.close()
+        self.activity.close()
+
+class RoomManager:
+    def __init__(self, persistence: Optional[PersistenceManager] = None, search: Optional[SearchIndex] = None):
+        self.rooms: Dict[str, Room] = {}
+        self.sid_to_room: Dict[str, str] = {}
+        self.persistence = persistence
+        self.search = search
+        self._opening: Dict[str, asyncio.Task] = {}
+
+    def get(self, room_id: str) -> Optional[Room]:
+        return self.rooms.get(room_id)
+
+    def get_or_create(self, room_id: str) -> Room:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = Room(room_id)
+            self.rooms[room_id] = room
+            if self.search is not None:
+                self.search.attach(room)
+        return room
+
+    async def open(self, room_id: str) -> Room:
+        # Rooms are rehydrated from storage lazily, on first join
+        room = self.rooms.get(room_id)
+        if room is not None or self.persistence is None:
+            return room or self.get_or_create(room_id)
+        task = self._opening.get(room_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load(room_id))
+            self._opening[room_id] = task
+            task.add_done_callback(lambda _: self._opening.pop(room_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, room_id: str) -> Room:
+        room = Room(room_id)
+        await self.persistence.hydrate(room_id, room.state)
+        self.rooms[room_id] = room
+        if self.search is not None:
+            self.search.attach(room)
+        return room
+
+    def join(self, sid: str, room_id: str, username: str) -> Room:
+        if sid in self.sid_to_room:
+            self.leave(sid)
+        room = self.get_or_create(room_id)
+        room.users.add_user(sid, username)
+        self.sid_to_room[sid] = room_id
+        return room
+
+    def leave(self, sid: str) -> Tuple[Optional[Room], str]:
+        room_id = self.sid_to_room.pop(sid, None)
+        room = self.rooms.get(room_id) if room_id else None
+        if room is None:
+            return None, f"User-{sid[:5]}"
+        return room, room.users.remove_user(sid)
+
+    def get_room(self, sid: str) -> Optional[Room]:
+        room_id = self.sid_to_room.get(sid)
+        return self.rooms.get(room_id) if room_id else None
+
+    def remove_room(self, room_id: str):
+        room = self.rooms.pop(room_id, None)
+        if room is not None:
+            room.close()
+            # Cached payloads are keyed by room id and revision, which a recreated room would reuse
+            broadcast_cache.discard_room(room_id)
+            if self.persistence is not None:
+                self.persistence.unload(room_id)
+            if self.search is not None:
+                # Persisted rooms stay searchable after they close
+                self.search.detach(room_id, keep=self.persistence is not None)
+
+    def list_rooms(self):
+        return [
+            {"room_id": room.room_id, "users": room.users.list_users()}
+            for room in self.rooms.values()
+        ]
+
+room_manager = RoomManager(persistence, search_index)
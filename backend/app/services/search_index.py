@@ -0,0 +1,319 @@
+import asyncio
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from app import config
+from app.services.diagram_model import DiagramModel
+from app.services.presence import Debouncer
+from app.services.workers import WorkerPoolSaturated, worker_pool
+
+ELEMENT = "element"
+CHAT = "chat"
+ACTIVITY = "activity"
+
+KINDS = (ELEMENT, CHAT, ACTIVITY)
+
+MAX_TOKENS = 64
+
+_WORD = re.compile(r"[^\W_]+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.casefold()) if text else []
+
+def _id_tokens(element_id: str) -> List[str]:
+    # "Activity_0x1y" is found by its whole id and by its parts
+    return [element_id.casefold(), *tokenize(element_id)]
+
+class SearchDocument:
+    __slots__ = ("room", "kind", "key", "tokens", "fields")
+
+    def __init__(self, room: str, kind: str, key: Any, tokens: Tuple[str, ...], fields: Dict[str, Any]):
+        self.room = room
+        self.kind = kind
+        self.key = key
+        self.tokens = tokens
+        self.fields = fields
+
+class SearchIndex:
+    # Inverted index over the elements, chat and activity of every open room. Postings map a
+    # token to integer document ids and a sorted vocabulary answers prefix queries with a
+    # bisect. Chat and activity are indexed as they are appended and dropped once the room's
+    # history evicts them; element names are re-read from a room's model shortly after its
+    # diagram changes, so edits never wait on indexing, and only elements whose name or type
+    # changed are re-indexed. Rooms whose state is persisted stay searchable after they close,
+    # and index_stored() adds the ones no one has opened since startup. Beyond max_documents
+    # the oldest documents are evicted.
+    def __init__(self, max_documents: int = None, refresh_ms: int = None):
+        self.max_documents = config.SEARCH_MAX_DOCUMENTS if max_documents is None else max_documents
+        self.evicted = 0
+        self._docs: "OrderedDict[int, SearchDocument]" = OrderedDict()
+        self._ids: Dict[Tuple[str, str, Any], int] = {}
+        self._room_docs: Dict[str, Set[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._next_id = 0
+        self._rooms: Dict[str, Any] = {}
+        self._listeners: Dict[str, Callable[[str, Dict[str, Any]], None]] = {}
+        self._elements: Dict[str, Dict[str, Tuple[str, Optional[str]]]] = {}
+        self._history: Dict[Tuple[str, str], Deque[int]] = {}
+        self._dirty: Dict[str, int] = {}
+        self._marks = 0
+        self._refresher = Debouncer(config.SEARCH_REFRESH_MS if refresh_ms is None else refresh_ms)
+        self._refresher.attach(self.refresh)
+        self._closing: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def attach(self, room):
+        # Called once a room's state is loaded; later history arrives through the state listener
+        room_id = room.room_id
+        self.detach(room_id)
+
+        def listener(op: str, data: Dict[str, Any]):
+            if op == "chat":
+                self._add_chat(room_id, data)
+            elif op == "log":
+                self._add_activity(room_id, data)
+            elif op == "xml":
+                self._mark(room_id)
+            elif op == "reset":
+                for doc_id in [doc_id for doc_id in self._room_docs.get(room_id, ()) if self._docs[doc_id].kind != ELEMENT]:
+                    self._remove(doc_id)
+                self._history.pop((room_id, CHAT), None)
+                self._history.pop((room_id, ACTIVITY), None)
+                self._mark(room_id)
+
+        room.state.listeners.append(listener)
+        self._rooms[room_id] = room
+        self._listeners[room_id] = listener
+        self._elements[room_id] = {}
+        for entry in room.state.chat:
+            self._add_chat(room_id, entry)
+        for entry in room.state.logs:
+            self._add_activity(room_id, entry)
+        self._mark(room_id)
+
+    def detach(self, room_id: str, keep: bool = False):
+        # With keep the room's documents outlive it (its state is persisted) and its elements are
+        # re-read from the final diagram, which a refresh still in flight would have skipped
+        room = self._rooms.pop(room_id, None)
+        if room is not None:
+            listener = self._listeners.pop(room_id)
+            if listener in room.state.listeners:
+                room.state.listeners.remove(listener)
+        self._dirty.pop(room_id, None)
+        self._history.pop((room_id, CHAT), None)
+        self._history.pop((room_id, ACTIVITY), None)
+        if not keep:
+            self._elements.pop(room_id, None)
+            for doc_id in list(self._room_docs.get(room_id, ())):
+                self._remove(doc_id)
+        elif room is not None:
+            self._track(self._index_closed(room_id, room.state.xml, self._elements.get(room_id, {}),
+                                           room.state.current_model()))
+        else:
+            self._elements.pop(room_id, None)
+
+    async def index_stored(self, persistence, owns: Callable[[str], bool] = None):
+        # Indexes persisted rooms that are not open, so they can be found without being loaded;
+        # in a cluster only the rooms this node owns
+        for room_id in await persistence.room_ids():
+            if room_id in self._rooms or room_id in self._room_docs or (owns is not None and not owns(room_id)):
+                continue
+            state = await persistence.read(room_id)
+            if room_id in self._rooms:
+                continue
+            for entry in state.chat:
+                self._add_chat(room_id, entry)
+            for entry in state.logs:
+                self._add_activity(room_id, entry)
+            await self._index_closed(room_id, state.xml, {})
+
+    async def _index_closed(self, room_id: str, xml: str, known: Dict[str, Tuple[str, Optional[str]]],
+                            model: Optional[DiagramModel] = None):
+        if model is None:
+            try:
+                model = await worker_pool.run(DiagramModel.from_xml, xml)
+            except WorkerPoolSaturated:
+                pass
+        if room_id in self._rooms:
+            # Reopened meanwhile; attach indexed it afresh
+            return
+        self._elements[room_id] = known
+        if model is not None and model.valid:
+            self._index_elements(room_id, model)
+        self._elements.pop(room_id, None)
+
+    def _track(self, coroutine):
+        try:
+            task = asyncio.get_running_loop().create_task(coroutine)
+        except RuntimeError:
+            coroutine.close()
+            return
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def refresh(self):
+        # Re-reads element names of rooms whose diagram changed since the last refresh. A room
+        # stays marked until it is indexed, so a search during a refresh still waits for it.
+        for room_id, mark in list(self._dirty.items()):
+            room = self._rooms.get(room_id)
+            if room is None:
+                self._dirty.pop(room_id, None)
+                continue
+            try:
+                model, _ = await room.model()
+            except WorkerPoolSaturated:
+                continue
+            # Indexed before any other await, so a patch cannot change the model halfway through
+            if self._rooms.get(room_id) is room and model.valid:
+                self._index_elements(room_id, model)
+            if self._dirty.get(room_id) == mark:
+                # Not marked again while the model was built
+                del self._dirty[room_id]
+
+    async def search(self, query: str, kind: str = None, room: str = None, prefix: bool = True,
+                     offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        if self._dirty:
+            await self.refresh()
+        return self.query(query, kind, room, prefix, offset, limit)
+
+    def query(self, query: str, kind: str = None, room: str = None, prefix: bool = True,
+              offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        # Every term must match a whole token, except the last one which may match as a prefix.
+        # Whole-token matches on the last term rank first, then newer documents.
+        offset = max(0, offset)
+        limit = max(0, limit)
+        page = {"query": query, "total": 0, "offset": offset, "limit": limit, "results": []}
+        terms = tokenize(query)
+        if not terms:
+            return page
+        last = terms[-1]
+        sets = []
+        for term in terms[:-1] if prefix else terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                return page
+            sets.append(postings)
+        if room is not None:
+            sets.append(self._room_docs.get(room, set()))
+        sets.sort(key=len)
+        if not prefix:
+            matched = sets[0].intersection(*sets[1:])
+        else:
+            candidates = sets[0].intersection(*sets[1:]) if sets else None
+            matched = set()
+            for token in self._prefixed(last):
+                postings = self._postings[token]
+                matched |= postings if candidates is None else postings & candidates
+        if kind is not None:
+            matched = {doc_id for doc_id in matched if self._docs[doc_id].kind == kind}
+        exact = matched & self._postings.get(last, set()) if prefix else matched
+        ranked = heapq.nlargest(offset + limit, exact)
+        if len(ranked) < offset + limit and len(exact) < len(matched):
+            ranked += heapq.nlargest(offset + limit - len(ranked), matched - exact)
+        page["total"] = len(matched)
+        page["results"] = [self._describe(self._docs[doc_id]) for doc_id in ranked[offset:]]
+        return page
+
+    def _describe(self, doc: SearchDocument) -> Dict[str, Any]:
+        return {"kind": doc.kind, "room": doc.room, **doc.fields}
+
+    def _prefixed(self, prefix: str) -> Iterator[str]:
+        vocabulary = self._vocabulary
+        index = bisect_left(vocabulary, prefix)
+        while index < len(vocabulary) and vocabulary[index].startswith(prefix):
+            yield vocabulary[index]
+            index += 1
+
+    def _mark(self, room_id: str):
+        self._marks += 1
+        self._dirty[room_id] = self._marks
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the loop (tests, startup) the next search refreshes instead
+            return
+        self._refresher.trigger()
+
+    def _add_chat(self, room_id: str, entry: Dict[str, Any]):
+        room = self._rooms.get(room_id)
+        self._add_history(room_id, CHAT, room.state.chat_history if room is not None else None, entry,
+                          tokenize(entry["username"]) + tokenize(entry["message"]))
+
+    def _add_activity(self, room_id: str, entry: Dict[str, Any]):
+        room = self._rooms.get(room_id)
+        self._add_history(room_id, ACTIVITY, room.state.activity if room is not None else None, entry,
+                          tokenize(entry["message"]))
+
+    def _add_history(self, room_id: str, kind: str, buffer, entry: Dict[str, Any], tokens: List[str]):
+        self._add(room_id, kind, entry["seq"], tokens, entry)
+        if buffer is None:
+            # A closed room's stored history no longer changes
+            return
+        seqs = self._history.setdefault((room_id, kind), deque())
+        seqs.append(entry["seq"])
+        first = buffer.first_seq
+        while seqs and seqs[0] < first:
+            doc_id = self._ids.get((room_id, kind, seqs.popleft()))
+            if doc_id is not None:
+                self._remove(doc_id)
+
+    def _index_elements(self, room_id: str, model):
+        # known only lists elements that are still indexed; _remove drops evicted ones
+        known = self._elements.setdefault(room_id, {})
+        current = set()
+        for element_id, info in model.elements.items():
+            if info.di:
+                continue
+            current.add(element_id)
+            indexed = (info.type, info.name)
+            if known.get(element_id) != indexed:
+                self._add(room_id, ELEMENT, element_id, tokenize(info.name) + _id_tokens(element_id),
+                          {"id": element_id, "type": info.type, "name": info.name})
+                if (room_id, ELEMENT, element_id) in self._ids:
+                    known[element_id] = indexed
+        for element_id in known.keys() - current:
+            self._remove(self._ids[(room_id, ELEMENT, element_id)])
+
+    def _add(self, room_id: str, kind: str, key: Any, tokens: List[str], fields: Dict[str, Any]):
+        existing = self._ids.get((room_id, kind, key))
+        if existing is not None:
+            self._remove(existing)
+        tokens = tuple(dict.fromkeys(tokens))[:MAX_TOKENS]
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = SearchDocument(room_id, kind, key, tokens, fields)
+        self._ids[(room_id, kind, key)] = doc_id
+        self._room_docs.setdefault(room_id, set()).add(doc_id)
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                insort(self._vocabulary, token)
+            postings.add(doc_id)
+        while 0 < self.max_documents < len(self._docs):
+            self._remove(next(iter(self._docs)))
+            self.evicted += 1
+
+    def _remove(self, doc_id: int):
+        doc = self._docs.pop(doc_id)
+        del self._ids[(doc.room, doc.kind, doc.key)]
+        if doc.kind == ELEMENT:
+            self._elements.get(doc.room, {}).pop(doc.key, None)
+        room_docs = self._room_docs.get(doc.room)
+        if room_docs is not None:
+            room_docs.discard(doc_id)
+            if not room_docs:
+                del self._room_docs[doc.room]
+        for token in doc.tokens:
+            postings = self._postings[token]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+search_index = SearchIndex()
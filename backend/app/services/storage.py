@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+Op = Dict[str, Any]
+Snapshot = Dict[str, Any]
+
+# Durable room state: an append-only op log plus compacted snapshots.
+# Backends are blocking and only ever called from a worker thread.
+class StorageBackend(ABC):
+    @abstractmethod
+    def load(self, room_id: str) -> Tuple[Optional[Snapshot], List[Op]]:
+        ...
+
+    @abstractmethod
+    def append(self, room_id: str, ops: List[Op]):
+        ...
+
+    @abstractmethod
+    def write_snapshot(self, room_id: str, seq: int, snapshot: Snapshot):
+        ...
+
+    @abstractmethod
+    def room_ids(self) -> List[str]:
+        ...
+
+    def close(self):
+        pass
+
+class MemoryStorage(StorageBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._ops: Dict[str, List[Op]] = {}
+
+    def load(self, room_id: str) -> Tuple[Optional[Snapshot], List[Op]]:
+        with self._lock:
+            return self._snapshots.get(room_id), list(self._ops.get(room_id, []))
+
+    def append(self, room_id: str, ops: List[Op]):
+        with self._lock:
+            self._ops.setdefault(room_id, []).extend(ops)
+
+    def write_snapshot(self, room_id: str, seq: int, snapshot: Snapshot):
+        with self._lock:
+            self._snapshots[room_id] = {**snapshot, "seq": seq}
+            self._ops[room_id] = [op for op in self._ops.get(room_id, []) if op["seq"] > seq]
+
+    def room_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(set(self._snapshots) | set(self._ops))
+
+class SQLiteStorage(StorageBackend):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ops (
+                room_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (room_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                room_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode(blob: bytes) -> Any:
+        return json.loads(zlib.decompress(blob))
+
+    def load(self, room_id: str) -> Tuple[Optional[Snapshot], List[Op]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq, data FROM snapshots WHERE room_id = ?", (room_id,)
+            ).fetchone()
+            snapshot = None
+            after = 0
+            if row is not None:
+                snapshot = {**self._decode(row[1]), "seq": row[0]}
+                after = row[0]
+            rows = self._conn.execute(
+                "SELECT seq, op, data FROM ops WHERE room_id = ? AND seq > ? ORDER BY seq",
+                (room_id, after)
+            ).fetchall()
+        return snapshot, [{"seq": seq, "op": op, "data": self._decode(data)} for seq, op, data in rows]
+
+    def append(self, room_id: str, ops: List[Op]):
+        rows = [(room_id, op["seq"], op["op"], self._encode(op["data"])) for op in ops]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO ops (room_id, seq, op, data) VALUES (?, ?, ?, ?)", rows
+                )
+
+    def write_snapshot(self, room_id: str, seq: int, snapshot: Snapshot):
+        blob = self._encode(snapshot)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (room_id, seq, data) VALUES (?, ?, ?)",
+                    (room_id, seq, blob)
+                )
+                self._conn.execute("DELETE FROM ops WHERE room_id = ? AND seq <= ?", (room_id, seq))
+
+    def room_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT room_id FROM snapshots UNION SELECT DISTINCT room_id FROM ops"
+            ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_storage(kind: str, path: str) -> Optional[StorageBackend]:
+    if kind == "sqlite":
+        return SQLiteStorage(path)
+    if kind == "memory":
+        return MemoryStorage()
+    return None
@@ -1,30 +1,78 @@
+from typing import Dict, List, Optional
+
 class UserManager:
+    # sid -> username plus username -> ordered set of sids. A username is online while it has
+    # at least one sid, so joins, leaves and lookups are O(1). The deduplicated user list is
+    # rebuilt only after a username comes or goes, and those transitions are also recorded as
+    # a netted joined/left delta for the next presence broadcast.
     def __init__(self):
-        self.online_users = {}
-        self.username_to_sid = {}
+        self.online_users: Dict[str, str] = {}
+        self.username_to_sid: Dict[str, Dict[str, None]] = {}
+        self.version = 0
+        self._users: Optional[List[str]] = None
+        self._delta: Dict[str, bool] = {}
+        self._delta_base = 0
 
-    def add_user(self, sid: str, username: str):
+    def add_user(self, sid: str, username: str) -> bool:
+        # True when the username just came online
+        if sid in self.online_users:
+            self.remove_user(sid)
         self.online_users[sid] = username
-        if username not in self.username_to_sid:
-            self.username_to_sid[username] = []
-        self.username_to_sid[username].append(sid)
+        sids = self.username_to_sid.get(username)
+        if sids is not None:
+            sids[sid] = None
+            return False
+        self.username_to_sid[username] = {sid: None}
+        self._changed(username, True)
+        return True
 
     def remove_user(self, sid: str) -> str:
-        username = self.online_users.pop(sid, f"User-{sid[:5]}")
-        if username in self.username_to_sid:
-            self.username_to_sid[username] = [s for s in self.username_to_sid[username] if s != sid]
-            if not self.username_to_sid[username]:
+        username = self.online_users.pop(sid, None)
+        if username is None:
+            return f"User-{sid[:5]}"
+        sids = self.username_to_sid.get(username)
+        if sids is not None:
+            sids.pop(sid, None)
+            if not sids:
                 del self.username_to_sid[username]
+                self._changed(username, False)
         return username
 
+    def _changed(self, username: str, joined: bool):
+        self.version += 1
+        self._users = None
+        # A leave and a rejoin inside one broadcast window cancel out
+        if self._delta.get(username) is (not joined):
+            del self._delta[username]
+        else:
+            self._delta[username] = joined
+
+    def is_online(self, username: str) -> bool:
+        return username in self.username_to_sid
+
     def get_username(self, sid: str) -> str:
         return self.online_users.get(sid, f"User-{sid[:5]}")
 
     def get_sids_by_username(self, username: str) -> list:
-        return self.username_to_sid.get(username, [])
+        return list(self.username_to_sid.get(username, ()))
+
+    def list_users(self) -> List[str]:
+        # Shared cached list; callers must not mutate it
+        if self._users is None:
+            self._users = list(self.username_to_sid)
+        return self._users
 
-    def list_users(self):
-        all_users = list(self.online_users.values())
-        return list(dict.fromkeys(all_users))
+    def drain_delta(self) -> Optional[Dict]:
+        # Changes since the previous drain; base_version lets clients detect a missed delta
+        base, self._delta_base = self._delta_base, self.version
+        delta, self._delta = self._delta, {}
+        if base == self.version:
+            return None
+        return {
+            "joined": [username for username, joined in delta.items() if joined],
+            "left": [username for username, joined in delta.items() if not joined],
+            "base_version": base,
+            "version": self.version,
+        }
 
 user_manager = UserManager()
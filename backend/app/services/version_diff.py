@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Tuple
+from app import config
+from app.services.diagram_model import DiagramModel
+from app.services.diagram_summary import AnalysisCache
+
+# Fields of an index entry: (type, name, parent, lane, digest, layout, source, target)
+TYPE, NAME, PARENT, LANE, DIGEST, LAYOUT, SOURCE, TARGET = range(8)
+
+ElementIndex = Dict[str, Tuple]
+
+# Indexes are keyed by content hash, so identical versions (and rooms) share one entry
+version_indexes = AnalysisCache(config.VERSION_INDEX_CACHE_SIZE)
+
+def index_from_model(model: DiagramModel) -> ElementIndex:
+    # Semantic elements only; each element's diagram-interchange shapes fold into its layout
+    index = {}
+    for element_id, info in model.elements.items():
+        if info.di:
+            continue
+        shapes = model.shapes.get(element_id, ())
+        layout = tuple(sorted(model.elements[shape].digest for shape in shapes))
+        index[element_id] = (info.type, info.name, info.parent, model.lane_of.get(element_id),
+                             info.digest, layout, info.source, info.target)
+    return index
+
+def element_index(xml: str) -> ElementIndex:
+    model = DiagramModel.from_xml(xml)
+    if not model.valid:
+        raise ValueError(model.error)
+    return index_from_model(model)
+
+def _entry(element_id: str, fields: Tuple) -> Dict[str, Any]:
+    entry = {"id": element_id, "type": fields[TYPE], "name": fields[NAME]}
+    if fields[SOURCE] is not None or fields[TARGET] is not None:
+        entry["source"] = fields[SOURCE]
+        entry["target"] = fields[TARGET]
+    return entry
+
+def diff_indexes(old: ElementIndex, new: ElementIndex) -> Dict[str, List[Dict[str, Any]]]:
+    # Fields that differ are reported as [old, new] pairs; one element can be both renamed and moved
+    added = [_entry(element_id, fields) for element_id, fields in new.items() if element_id not in old]
+    removed = [_entry(element_id, fields) for element_id, fields in old.items() if element_id not in new]
+    renamed, moved, changed = [], [], []
+    for element_id, after in new.items():
+        before = old.get(element_id)
+        if before is None or before == after:
+            continue
+        base = {"id": element_id, "type": after[TYPE], "name": after[NAME]}
+        if before[NAME] != after[NAME]:
+            renamed.append({**base, "name": [before[NAME], after[NAME]]})
+        move = {}
+        if before[PARENT] != after[PARENT]:
+            move["parent"] = [before[PARENT], after[PARENT]]
+        if before[LANE] != after[LANE]:
+            move["lane"] = [before[LANE], after[LANE]]
+        if before[LAYOUT] != after[LAYOUT]:
+            move["layout"] = True
+        if move:
+            moved.append({**base, **move})
+        # The digest leaves out the name, so a rename alone is not also a change
+        if before[DIGEST] != after[DIGEST]:
+            change = dict(base)
+            for field, key in ((TYPE, "type"), (SOURCE, "source"), (TARGET, "target")):
+                if before[field] != after[field]:
+                    change[key] = [before[field], after[field]]
+            changed.append(change)
+    return {"added": added, "removed": removed, "renamed": renamed, "moved": moved, "changed": changed}
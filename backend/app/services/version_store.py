@@ -0,0 +1,271 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from app import config
+from app.services.workers import WorkerPoolSaturated
+
+def content_hash(xml: str) -> str:
+    return hashlib.sha1(xml.encode("utf-8")).hexdigest()
+
+def _diff_lines(old: List[str], new: List[str]) -> List[Any]:
+    # Ops are either [start, end] (copy old[start:end]) or a string to insert
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    ops: List[Any] = []
+    if prefix:
+        ops.append([0, prefix])
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+    matcher = SequenceMatcher(None, old_mid, new_mid)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append("".join(new_mid[j1:j2]))
+    if suffix:
+        ops.append([len(old) - suffix, len(old)])
+    return ops
+
+def _apply_ops(old: List[str], ops: List[Any]) -> str:
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.append("".join(old[op[0]:op[1]]))
+    return "".join(parts)
+
+def encode_version(base: Optional[str], xml: str) -> bytes:
+    # A keyframe without a base, otherwise a line delta against it; pure, so it can run on the pool
+    if base is None:
+        return zlib.compress(xml.encode("utf-8"))
+    ops = _diff_lines(base.splitlines(keepends=True), xml.splitlines(keepends=True))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"))
+
+def materialize(start: Union[str, bytes], deltas: List[bytes]) -> str:
+    # start is a compressed keyframe or a version still held as text
+    xml = start if isinstance(start, str) else zlib.decompress(start).decode("utf-8")
+    for data in deltas:
+        xml = _apply_ops(xml.splitlines(keepends=True), json.loads(zlib.decompress(data)))
+    return xml
+
+class VersionRecord:
+    __slots__ = ("version", "timestamp", "created", "content_hash", "size", "author", "keyframe", "data", "xml")
+
+    def __init__(self, version: int, content_hash: str, size: int, author: Optional[str], keyframe: bool, data: bytes):
+        self.version = version
+        self.timestamp = datetime.now(timezone.utc).isoformat()
+        self.created = time.time()
+        self.content_hash = content_hash
+        self.size = size
+        self.author = author
+        self.keyframe = keyframe
+        self.data = data
+        # The full text until the compressed data arrives from the worker pool
+        self.xml: Optional[str] = None
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "timestamp": self.timestamp,
+            "hash": self.content_hash,
+            "size": self.size,
+            "author": self.author
+        }
+
+class VersionStore:
+    def __init__(self, max_count: int = None, max_bytes: int = None, max_age_seconds: int = None, keyframe_interval: int = None):
+        self.max_count = config.VERSION_MAX_COUNT if max_count is None else max_count
+        self.max_bytes = config.VERSION_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age_seconds = config.VERSION_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+        self.keyframe_interval = max(1, config.VERSION_KEYFRAME_INTERVAL if keyframe_interval is None else keyframe_interval)
+        self._records: deque = deque()
+        self._next_version = 1
+        self._since_keyframe = 0
+        self._last_xml: Optional[str] = None
+        self._run: Optional[Callable] = None
+        self._encoding: Set[asyncio.Task] = set()
+        self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def latest(self) -> Optional[VersionRecord]:
+        return self._records[-1] if self._records else None
+
+    def attach(self, run: Callable):
+        # run(fn, *args) encodes versions off the event loop (the worker pool)
+        self._run = run
+
+    def save(self, xml: str, author: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        # The record is numbered and readable right away; with a pool attached its compressed
+        # form is computed there and stored once it arrives
+        digest = content_hash(xml)
+        if self._records and self._records[-1].content_hash == digest:
+            return None
+
+        keyframe = self._last_xml is None or self._since_keyframe + 1 >= self.keyframe_interval
+        base = None if keyframe else self._last_xml
+        self._since_keyframe = 0 if keyframe else self._since_keyframe + 1
+        record = VersionRecord(self._next_version, digest, len(xml), author, keyframe, b"")
+        self._next_version += 1
+        self._records.append(record)
+        self._last_xml = xml
+        try:
+            loop = asyncio.get_running_loop() if self._run is not None else None
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            self._store(record, encode_version(base, xml))
+        else:
+            record.xml = xml
+            task = loop.create_task(self._encode(record, base))
+            self._encoding.add(task)
+            task.add_done_callback(self._encoding.discard)
+        return record.metadata()
+
+    async def _encode(self, record: VersionRecord, base: Optional[str]):
+        while True:
+            try:
+                data = await self._run(encode_version, base, record.xml)
+            except WorkerPoolSaturated:
+                data = encode_version(base, record.xml)
+            if self.record(record.version) is not record:
+                return
+            if base is None or not record.keyframe:
+                break
+            # Its base was evicted while encoding, so it has to become a keyframe
+            base = None
+        self._store(record, data)
+
+    def _store(self, record: VersionRecord, data: bytes):
+        record.data = data
+        record.xml = None
+        self.nbytes += len(data)
+        self._enforce_retention()
+
+    def list(self, offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        # Newest first, metadata only
+        total = len(self._records)
+        offset = max(0, offset)
+        limit = max(0, limit)
+        start = total - offset
+        end = max(0, start - limit)
+        versions = [self._records[i].metadata() for i in range(start - 1, end - 1, -1)] if start > 0 else []
+        return {"total": total, "offset": offset, "limit": limit, "versions": versions}
+
+    def record(self, version: int) -> Optional[VersionRecord]:
+        index = self._index_of(version)
+        return self._records[index] if index is not None else None
+
+    def chain(self, version: int) -> Optional[Tuple[Dict[str, Any], Union[str, bytes], List[bytes]]]:
+        # Metadata plus what materialize() needs, so callers can rebuild the XML off the loop
+        index = self._index_of(version)
+        if index is None:
+            return None
+        return (self._records[index].metadata(), *self._chain(index))
+
+    def get(self, version: int) -> Optional[Dict[str, Any]]:
+        chain = self.chain(version)
+        if chain is None:
+            return None
+        entry, start, deltas = chain
+        entry["xml"] = materialize(start, deltas)
+        return entry
+
+    def clear(self):
+        self._records.clear()
+        self._since_keyframe = 0
+        self._last_xml = None
+        self.nbytes = 0
+
+    def export(self) -> Dict[str, Any]:
+        return {
+            "next_version": self._next_version,
+            "since_keyframe": self._since_keyframe,
+            "records": [
+                {
+                    "version": r.version,
+                    "timestamp": r.timestamp,
+                    "created": r.created,
+                    "hash": r.content_hash,
+                    "size": r.size,
+                    "author": r.author,
+                    # Still encoding: exported whole, as a keyframe
+                    "keyframe": r.keyframe or r.xml is not None,
+                    "data": base64.b64encode(r.data if r.xml is None else encode_version(None, r.xml)).decode("ascii")
+                }
+                for r in self._records
+            ]
+        }
+
+    def restore(self, exported: Optional[Dict[str, Any]]):
+        self.clear()
+        if not exported:
+            return
+        for item in exported["records"]:
+            record = VersionRecord(item["version"], item["hash"], item["size"], item["author"],
+                                   item["keyframe"], base64.b64decode(item["data"]))
+            record.timestamp = item["timestamp"]
+            record.created = item["created"]
+            self._records.append(record)
+            self.nbytes += len(record.data)
+        self._next_version = exported["next_version"]
+        self._since_keyframe = exported["since_keyframe"]
+        if self._records:
+            self._last_xml = self._materialize(len(self._records) - 1)
+
+    def _index_of(self, version: int) -> Optional[int]:
+        if not self._records:
+            return None
+        # Versions are contiguous apart from evictions at the head
+        index = version - self._records[0].version
+        if 0 <= index < len(self._records) and self._records[index].version == version:
+            return index
+        return None
+
+    def _chain(self, index: int) -> Tuple[Union[str, bytes], List[bytes]]:
+        start = index
+        while self._records[start].xml is None and not self._records[start].keyframe:
+            start -= 1
+        record = self._records[start]
+        return (record.xml if record.xml is not None else record.data,
+                [self._records[i].data for i in range(start + 1, index + 1)])
+
+    def _materialize(self, index: int) -> str:
+        return materialize(*self._chain(index))
+
+    def _evict_oldest(self):
+        if len(self._records) > 1 and not self._records[1].keyframe:
+            successor = self._records[1]
+            if successor.xml is None:
+                data = encode_version(None, self._materialize(1))
+                self.nbytes += len(data) - len(successor.data)
+                successor.data = data
+            successor.keyframe = True
+        oldest = self._records.popleft()
+        self.nbytes -= len(oldest.data)
+
+    def _enforce_retention(self):
+        while self.max_count and len(self._records) > self.max_count:
+            self._evict_oldest()
+        while self.max_bytes and self.nbytes > self.max_bytes and len(self._records) > 1:
+            self._evict_oldest()
+        if self.max_age_seconds:
+            cutoff = time.time() - self.max_age_seconds
+            while len(self._records) > 1 and self._records[0].created < cutoff:
+                self._evict_oldest()
@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from app import config
+
+class WorkerPoolSaturated(Exception):
+    pass
+
+class WorkerPool:
+    def __init__(self, kind: str = None, max_workers: int = None, max_queue: int = None):
+        self.kind = kind or config.WORKER_POOL_KIND
+        self.max_workers = max(1, max_workers or config.WORKER_POOL_SIZE)
+        self.max_queue = config.WORKER_QUEUE_LIMIT if max_queue is None else max_queue
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bpmn-worker")
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self.pending >= self.capacity:
+            raise WorkerPoolSaturated(f"{self.pending} diagram jobs already queued")
+        self.pending += 1
+        try:
+            if self.kind == "inline":
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+worker_pool = WorkerPool()
@@ -0,0 +1,177 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Optional, Tuple
+from xml.parsers import expat
+from app import config
+
+# BPMN never needs a DTD; refusing them rules out entity expansion and external entities
+_DTD = re.compile(r"<!(DOCTYPE|ENTITY)", re.IGNORECASE)
+
+class XMLRejected(ET.ParseError):
+    # Input refused before or while parsing; existing ParseError handlers treat it as invalid XML
+    pass
+
+class XMLTooLarge(XMLRejected):
+    pass
+
+def _limits(max_bytes: Optional[int], max_depth: Optional[int]) -> Tuple[int, int]:
+    return (config.MAX_XML_BYTES if max_bytes is None else max_bytes,
+            config.MAX_XML_DEPTH if max_depth is None else max_depth)
+
+def check_xml(text: str, max_bytes: int = None):
+    # Cheap checks for XML that is already in memory, run before any parser sees it
+    max_bytes, _ = _limits(max_bytes, None)
+    if max_bytes and len(text) > max_bytes:
+        raise XMLTooLarge(f"XML is larger than {max_bytes} bytes")
+    if _DTD.search(text):
+        raise XMLRejected("DTDs and entity declarations are not allowed")
+
+def check_prolog(text: str, max_bytes: int = None):
+    # check_xml for the event loop: a DTD is only well-formed before the root element, so just
+    # the prolog (XML declaration, comments, processing instructions) is scanned, never the
+    # whole document. Anything parsed later still goes through check_xml on the worker pool.
+    max_bytes, _ = _limits(max_bytes, None)
+    if max_bytes and len(text) > max_bytes:
+        raise XMLTooLarge(f"XML is larger than {max_bytes} bytes")
+    position = 0
+    while True:
+        start = text.find("<", position)
+        if start < 0:
+            return
+        if text.startswith("<?", start):
+            end, skip = text.find("?>", start + 2), 2
+        elif text.startswith("<!--", start):
+            end, skip = text.find("-->", start + 4), 3
+        elif text.startswith("<!", start):
+            raise XMLRejected("DTDs and entity declarations are not allowed")
+        else:
+            return
+        if end < 0:
+            return
+        position = end + skip
+
+def parse_tree(text: str, max_bytes: int = None, max_depth: int = None) -> Tuple[Optional[ET.Element], Dict[str, str]]:
+    # Builds a full tree (for patching and indexing) after the same checks as the streaming path
+    max_bytes, max_depth = _limits(max_bytes, max_depth)
+    check_xml(text, max_bytes)
+    namespaces: Dict[str, str] = {}
+    root = None
+    depth = 0
+    for event, item in ET.iterparse(io.StringIO(text), events=("start-ns", "start", "end")):
+        if event == "start":
+            depth += 1
+            if max_depth and depth > max_depth:
+                raise XMLRejected(f"XML is nested deeper than {max_depth} levels")
+            if root is None:
+                root = item
+        elif event == "end":
+            depth -= 1
+        else:
+            prefix, uri = item
+            namespaces.setdefault(prefix, uri)
+    return root, namespaces
+
+def _qualify(name: str) -> str:
+    # expat reports "uri}local" with our separator; ElementTree spells it "{uri}local"
+    return "{" + name if "}" in name else name
+
+class StreamingParser:
+    # Incremental expat parser that never builds a tree. The handler gets start(tag, attrib)
+    # and end(tag) with ElementTree-style names, so memory stays bounded by nesting depth
+    # however large the input is. DTDs, entities and over-limit input are rejected as soon
+    # as they are seen.
+    def __init__(self, handler: Any, max_bytes: int = None, max_depth: int = None):
+        self.handler = handler
+        self.max_bytes, self.max_depth = _limits(max_bytes, max_depth)
+        self.size = 0
+        self.depth = 0
+        parser = expat.ParserCreate(namespace_separator="}")
+        parser.SetParamEntityParsing(expat.XML_PARAM_ENTITY_PARSING_NEVER)
+        parser.StartDoctypeDeclHandler = self._refuse_dtd
+        parser.EntityDeclHandler = self._refuse_dtd
+        parser.ExternalEntityRefHandler = self._refuse_dtd
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.buffer_text = True
+        self._parser = parser
+
+    def _refuse_dtd(self, *args):
+        raise XMLRejected("DTDs and entity declarations are not allowed")
+
+    def _start(self, name: str, attrib: Dict[str, str]):
+        self.depth += 1
+        if self.max_depth and self.depth > self.max_depth:
+            raise XMLRejected(f"XML is nested deeper than {self.max_depth} levels")
+        self.handler.start(_qualify(name), {_qualify(key): value for key, value in attrib.items()})
+
+    def _end(self, name: str):
+        self.depth -= 1
+        self.handler.end(_qualify(name))
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise XMLTooLarge(f"XML is larger than {self.max_bytes} bytes")
+        try:
+            self._parser.Parse(chunk, False)
+        except expat.ExpatError as e:
+            raise ET.ParseError(str(e))
+
+    def close(self):
+        try:
+            self._parser.Parse(b"", True)
+        except expat.ExpatError as e:
+            raise ET.ParseError(str(e))
+
+class FanOut:
+    # Lets several streaming handlers share one parse
+    def __init__(self, *handlers):
+        self.handlers = handlers
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        for handler in self.handlers:
+            handler.start(tag, attrib)
+
+    def end(self, tag: str):
+        for handler in self.handlers:
+            handler.end(tag)
+
+class BodyTooLarge(Exception):
+    pass
+
+class BodyLimitMiddleware:
+    # Refuses HTTP bodies over the limit before the app (or pydantic) buffers them. Exempt
+    # paths consume their body incrementally and bound each item themselves.
+    def __init__(self, app, max_bytes: int = None, exempt: Tuple[str, ...] = ()):
+        self.app = app
+        self.max_bytes = config.MAX_REQUEST_BYTES if max_bytes is None else max_bytes
+        self.exempt = exempt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes or scope["path"] in self.exempt:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            return await self._reject(send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise BodyTooLarge()
+            return message
+
+        try:
+            await self.app(scope, limited_receive, send)
+        except BodyTooLarge:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"detail":"Request body too large"}'})
@@ -1,13 +1,101 @@
-from app.services.log_event import log_event
-
-async def broadcast_event(sio, event: str, payload: dict, skip_sid=None, namespace="/"):
-    await sio.emit(event, payload, skip_sid=skip_sid, namespace=namespace)
-
-async def log_and_broadcast(sio, message: str, event=None, payload=None, skip_sid=None):
-    entry = await log_event(message)
-    # Broadcast new activity log to all clients
-    from socketio import AsyncServer
-    if isinstance(sio, AsyncServer):
-        await sio.emit("activity_log_update", entry, skip_sid=skip_sid, namespace="/")
-    if event and payload:
-        await broadcast_event(sio, event, payload, skip_sid)
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+from app import config
+
+class EncodedPayload:
+    # A payload serialized once and spliced verbatim into every packet that carries it.
+    # Kept as string parts so per-recipient fields and packet framing cost one join, not a copy each.
+    __slots__ = ("value", "parts")
+
+    def __init__(self, value: Any, parts: Tuple[str, ...] = None):
+        self.value = value
+        if parts is None:
+            text = json.dumps(value, separators=(",", ":"))
+            parts = (text[:-1], "}") if isinstance(value, dict) else (text,)
+        self.parts = parts
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def extend(self, fields: Dict[str, Any]) -> "EncodedPayload":
+        # Adds small fields to an encoded object without touching the encoded body
+        extra = json.dumps(fields, separators=(",", ":"))[1:-1]
+        if not extra:
+            return self
+        empty = self.parts == ("{", "}")
+        return EncodedPayload({**self.value, **fields}, self.parts[:-1] + (extra if empty else "," + extra, "}"))
+
+class PayloadJSON:
+    # Passed to AsyncServer(json=...); otherwise behaves like the json module
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        if isinstance(obj, EncodedPayload):
+            return obj.text
+        if isinstance(obj, list) and any(isinstance(item, EncodedPayload) for item in obj):
+            pieces = ["["]
+            for index, item in enumerate(obj):
+                if index:
+                    pieces.append(",")
+                if isinstance(item, EncodedPayload):
+                    pieces.extend(item.parts)
+                else:
+                    pieces.append(json.dumps(item, default=_default, **kwargs))
+            pieces.append("]")
+            return "".join(pieces)
+        return json.dumps(obj, default=_default, **kwargs)
+
+    @staticmethod
+    def loads(text, **kwargs):
+        return json.loads(text, **kwargs)
+
+def _default(obj):
+    if isinstance(obj, EncodedPayload):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class BroadcastCache:
+    def __init__(self, maxsize: int = None):
+        self.maxsize = config.BROADCAST_CACHE_SIZE if maxsize is None else maxsize
+        self._entries: "OrderedDict[Tuple[str, str, Hashable], EncodedPayload]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, room_id: str, event: str, revision: Hashable, build: Callable[[], Any]) -> EncodedPayload:
+        key = (room_id, event, revision)
+        encoded = self._entries.get(key)
+        if encoded is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return encoded
+        self.misses += 1
+        encoded = EncodedPayload(build())
+        if self.maxsize > 0:
+            self._entries[key] = encoded
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return encoded
+
+    def discard_room(self, room_id: str):
+        # Revisions restart when a room is recreated, so its entries must not outlive it
+        for key in [key for key in self._entries if key[0] == room_id]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+broadcast_cache = BroadcastCache()
+
+async def broadcast_event(sio, event: str, payload: Any, room=None, skip_sid=None, namespace="/", to=None):
+    await sio.emit(event, payload, room=room, to=to, skip_sid=skip_sid, namespace=namespace)
+
+async def broadcast_once(sio, room_id: str, event: str, revision: Hashable, build: Callable[[], Any],
+                         to=None, skip_sid=None, namespace="/") -> EncodedPayload:
+    # Payloads are encoded once per (room, event, revision) and reused by later joiners and resyncs
+    payload = broadcast_cache.encode(room_id, event, revision, build)
+    await sio.emit(event, payload, room=room_id if to is None else None, to=to, skip_sid=skip_sid, namespace=namespace)
+    return payload
@@ -0,0 +1,81 @@
+"""Serialization CPU per broadcast: plain emits vs. the encode-once cache.
+
+Simulates a join storm in-process: every joiner receives the room snapshot
+(``initial_state``) and the room then receives a burst of identical
+``diagram_update`` resyncs. Sends go to a no-op transport, so the numbers are
+Socket.IO packet encoding only. Run from the backend directory:
+
+    python -m benchmarks.bench_broadcast_encoding --sizes small large xlarge
+"""
+import argparse
+import asyncio
+import time
+
+import socketio
+from engineio import json as engineio_json
+from socketio import packet
+
+from app.utils import BroadcastCache, PayloadJSON
+from benchmarks.bpmn_generator import SIZES, generate_bpmn
+
+async def _noop_send(eio_sid, pkt):
+    pass
+
+async def make_server(joiners: int, cached: bool):
+    packet.Packet.json = PayloadJSON if cached else engineio_json
+    sio = socketio.AsyncServer(async_mode="asgi")
+    sio._send_eio_packet = _noop_send
+    sids = []
+    for i in range(joiners):
+        await sio.manager.connect(f"eio-{i}", "/")
+        sid = sio.manager.sid_from_eio_sid(f"eio-{i}", "/")
+        await sio.manager.enter_room(sid, "/", "bench")
+        sids.append(sid)
+    return sio, sids
+
+def room_snapshot(xml: str):
+    chat = [{"timestamp": "2025-01-01T00:00:00+00:00", "username": f"user{i}", "message": f"message {i}"} for i in range(100)]
+    logs = [{"timestamp": "2025-01-01T00:00:00+00:00", "message": f"user{i} updated diagram"} for i in range(50)]
+    return {"room": "bench", "revision": 1, "xml": xml, "locks": {"epoch": 0, "locks": {}}, "chat": chat, "logs": logs}
+
+async def run(xml: str, joiners: int, resyncs: int, cached: bool) -> float:
+    sio, sids = await make_server(joiners, cached)
+    snapshot = room_snapshot(xml)
+    users = [f"user{i}" for i in range(joiners)]
+    cache = BroadcastCache(maxsize=16)
+
+    started = time.process_time()
+    for sid in sids:
+        if cached:
+            payload = cache.encode("bench", "initial_state", 1, lambda: snapshot).extend({"users": users})
+        else:
+            payload = {**snapshot, "users": users}
+        await sio.emit("initial_state", payload, to=sid)
+    for _ in range(resyncs):
+        if cached:
+            payload = cache.encode("bench", "diagram_update", 1, lambda: {"xml": xml, "revision": 1})
+        else:
+            payload = {"xml": xml, "revision": 1}
+        await sio.emit("diagram_update", payload, room="bench")
+    return time.process_time() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium", "large", "xlarge"], choices=list(SIZES))
+    parser.add_argument("--joiners", type=int, default=500, help="clients joining the room")
+    parser.add_argument("--resyncs", type=int, default=50, help="identical room-wide diagram broadcasts")
+    args = parser.parse_args()
+
+    broadcasts = args.joiners + args.resyncs
+    print(f"{args.joiners} joiners + {args.resyncs} resyncs = {broadcasts} broadcasts per run")
+    print(f"{'size':>7} {'xml KB':>7} {'plain ms':>9} {'cached ms':>10} {'plain us/bc':>12} {'cached us/bc':>13} {'speedup':>8}")
+    for size in args.sizes:
+        xml = generate_bpmn(SIZES[size])
+        plain = await run(xml, args.joiners, args.resyncs, cached=False)
+        cached = await run(xml, args.joiners, args.resyncs, cached=True)
+        print(f"{size:>7} {len(xml) / 1024:>7.0f} {plain * 1000:>9.1f} {cached * 1000:>10.1f} "
+              f"{plain / broadcasts * 1e6:>12.1f} {cached / broadcasts * 1e6:>13.1f} {plain / max(cached, 1e-9):>7.1f}x")
+    packet.Packet.json = engineio_json
+
+if __name__ == "__main__":
+    asyncio.run(main())
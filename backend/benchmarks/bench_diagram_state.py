@@ -0,0 +1,79 @@
+"""In-process cost of DiagramState and analyze_bpmn_diagram per diagram size.
+
+For each generated size this measures a versioned commit, building the join
+snapshot, an element patch, an uncached analysis, and the memory a room holds
+once it has the diagram and its version history. No server is started, so the
+numbers are stable enough to compare between commits. Run from the backend
+directory:
+
+    python -m benchmarks.bench_diagram_state --sizes small medium large xlarge
+"""
+import argparse
+import time
+import tracemalloc
+
+from app.services.diagram_state import DiagramState
+from app.services.diagram_summary import analysis_cache, analyze_bpmn_diagram
+from benchmarks.bench_summary_latency import percentile
+from benchmarks.bpmn_generator import SIZES, generate_bpmn
+
+def timed(fn, repeat: int):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 50)
+
+def run(size: str, repeat: int, versions: int) -> dict:
+    diagrams = [generate_bpmn(SIZES[size], seed=i, process_name=f"Bench {i}") for i in range(versions)]
+    state = DiagramState()
+
+    commit_ms = timed(lambda i: state.commit(diagrams[i % versions], "bench", save_version=True), repeat)
+    snapshot_ms = timed(lambda i: (state.add_log(f"tick {i}"), state.initial_state()), repeat)
+
+    def patch(i):
+        task = {"id": f"Bench_{i}", "parent_id": "Process_1", "xml": f'<bpmn:task id="Bench_{i}"/>'}
+        state.apply_patch(state.revision, [task], [], [])
+    patch_ms = timed(patch, repeat)
+
+    def analyze(i):
+        analysis_cache.clear()
+        analyze_bpmn_diagram(diagrams[i % versions])
+    analyze_ms = timed(analyze, repeat)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    room = DiagramState()
+    for xml in diagrams:
+        room.commit(xml, "bench", save_version=True)
+    room.initial_state()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    return {
+        "size": size,
+        "xml_kb": len(diagrams[0]) / 1024,
+        "commit": commit_ms,
+        "snapshot": snapshot_ms,
+        "patch": patch_ms,
+        "analyze": analyze_ms,
+        "room_kb": held / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=20, help="timed iterations per operation")
+    parser.add_argument("--versions", type=int, default=10, help="distinct diagrams committed per room")
+    args = parser.parse_args()
+
+    print(f"p50 of {args.repeat} runs; room memory after {args.versions} versioned commits")
+    print(f"{'size':>7} {'xml KB':>7} {'commit ms':>10} {'snapshot ms':>12} {'patch ms':>9} {'analyze ms':>11} {'room KB':>9}")
+    for size in args.sizes:
+        r = run(size, args.repeat, args.versions)
+        print(f"{r['size']:>7} {r['xml_kb']:>7.0f} {r['commit']:>10.3f} {r['snapshot']:>12.3f} {r['patch']:>9.3f} "
+              f"{r['analyze']:>11.2f} {r['room_kb']:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Load test: N Socket.IO clients driving the real events against a local server.
+
+Starts ``app.main:asgi_app`` under uvicorn, connects the clients spread over a
+number of rooms and lets each of them send a weighted mix of ``cursor_move``,
+``send_chat``, ``lock_element``/``unlock_element`` and ``update_diagram``
+(a generated diagram of the chosen size) while extra clients join and leave.
+Every event carries a token, so the time until each other room member sees
+the resulting broadcast is measured end to end. Run from the backend directory:
+
+    python -m benchmarks.bench_load --clients 200 --rooms 10 --duration 15 --size medium
+
+Clients run in this process, so on large runs the client side may saturate a
+core before the server does; compare runs made with the same settings.
+Server memory is read from /proc and is only reported on Linux.
+
+Requires ``aiohttp`` (used by the Socket.IO async client; listed in
+requirements.txt).
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+import socketio
+
+from benchmarks.bench_summary_latency import free_port, percentile, wait_for_server
+from benchmarks.bpmn_generator import SIZES, generate_bpmn
+
+TOKEN_RE = re.compile(r"load-(\d+)")
+ACTIONS = {"cursor_move": 70, "send_chat": 10, "lock_element": 10, "update_diagram": 10}
+
+class LoadClient(socketio.AsyncClient):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        self.joined = asyncio.Event()
+
+    async def _handle_eio_message(self, data):
+        self.stats.bytes_received += len(data)
+        self.stats.messages_received += 1
+        await super()._handle_eio_message(data)
+
+class Stats:
+    def __init__(self):
+        self.tokens = itertools.count(1)
+        self.sent_at = {}
+        self.latency = defaultdict(list)
+        self.sent = Counter()
+        self.joins = []
+        self.bytes_received = 0
+        self.messages_received = 0
+
+    def token(self, event: str) -> str:
+        token = next(self.tokens)
+        self.sent_at[token] = time.perf_counter()
+        self.sent[event] += 1
+        return f"load-{token}"
+
+    def seen(self, event: str, text):
+        match = TOKEN_RE.search(str(text)[:4096])
+        if match:
+            started = self.sent_at.get(int(match.group(1)))
+            if started is not None:
+                self.latency[event].append((time.perf_counter() - started) * 1000)
+
+    def seen_token(self, event: str, token: float):
+        started = self.sent_at.get(int(token))
+        if started is not None:
+            self.latency[event].append((time.perf_counter() - started) * 1000)
+
+def rss_kb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def make_client(stats: Stats) -> LoadClient:
+    client = LoadClient(stats, reconnection=False)
+
+    @client.on("initial_state")
+    async def initial_state(data):
+        client.joined.set()
+
+    @client.on("diagram_update")
+    async def diagram_update(data):
+        stats.seen("update_diagram", data.get("xml", ""))
+
+    @client.on("receive_chat")
+    async def receive_chat(data):
+        stats.seen("send_chat", data.get("message", ""))
+
+    @client.on("locks_delta")
+    async def locks_delta(data):
+        for change in data.get("changes", []):
+            if change.get("locked_by"):
+                stats.seen("lock_element", change["element_id"])
+
+    @client.on("cursor_batch")
+    async def cursor_batch(data):
+        for cursor in data.get("cursors", []):
+            stats.seen_token("cursor_move", cursor["x"])
+
+    return client
+
+async def connect(url: str, stats: Stats, username: str, room: str) -> LoadClient:
+    client = make_client(stats)
+    started = time.perf_counter()
+    await client.connect(url, auth={"username": username, "room": room}, transports=["websocket"], wait_timeout=30)
+    await asyncio.wait_for(client.joined.wait(), 30)
+    stats.joins.append((time.perf_counter() - started) * 1000)
+    return client
+
+async def act(client: LoadClient, stats: Stats, template: str, rng: random.Random):
+    event = rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+    token = stats.token(event)
+    if event == "cursor_move":
+        await client.emit("cursor_move", {"x": float(token[5:]), "y": rng.random() * 1000})
+    elif event == "send_chat":
+        await client.emit("send_chat", {"message": token})
+    elif event == "lock_element":
+        await client.emit("lock_element", {"element_id": token})
+        await client.emit("unlock_element", {"element_id": token})
+    else:
+        await client.emit("update_diagram", {"xml": template.replace("__TOKEN__", token)})
+
+async def drive(client: LoadClient, stats: Stats, template: str, rate: float, stop: asyncio.Event, seed: int):
+    rng = random.Random(seed)
+    await asyncio.sleep(rng.random() / rate)
+    while not stop.is_set():
+        await act(client, stats, template, rng)
+        await asyncio.sleep(rng.expovariate(rate))
+
+async def churn(url: str, stats: Stats, rooms: int, rate: float, stop: asyncio.Event):
+    rng = random.Random(7)
+    for index in itertools.count():
+        if stop.is_set() or rate <= 0:
+            return
+        client = await connect(url, stats, f"churn-{index}", f"load-room-{rng.randrange(rooms)}")
+        await asyncio.sleep(rng.expovariate(rate))
+        await client.disconnect()
+
+async def connect_all(url: str, stats: Stats, clients: int, rooms: int, concurrency: int = 50):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            return await connect(url, stats, f"user-{index}", f"load-room-{index % rooms}")
+
+    return await asyncio.gather(*(one(i) for i in range(clients)))
+
+async def run(args) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:asgi_app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ),
+    )
+    stats = Stats()
+    template = generate_bpmn(SIZES[args.size], process_name="__TOKEN__")
+    result = {}
+    try:
+        await wait_for_server(url)
+        rss_idle = rss_kb(server.pid)
+        clients = await connect_all(url, stats, args.clients, args.rooms)
+        await asyncio.sleep(0.5)
+        rss_connected = rss_kb(server.pid)
+
+        # Load one diagram into every room so per-diagram memory can be read off before the mix starts
+        for room in range(args.rooms):
+            await clients[room].emit("update_diagram", {"xml": template.replace("__TOKEN__", f"warmup-{room}")})
+        await asyncio.sleep(1.0)
+        rss_loaded = rss_kb(server.pid)
+
+        stats.latency.clear()
+        stats.sent.clear()
+        stats.joins.clear()
+        bytes_before, messages_before = stats.bytes_received, stats.messages_received
+        stop = asyncio.Event()
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(drive(client, stats, template, args.rate, stop, seed))
+                 for seed, client in enumerate(clients)]
+        tasks.append(asyncio.create_task(churn(url, stats, args.rooms, args.churn, stop)))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        # Let in-flight broadcasts land before reading the counters
+        await asyncio.sleep(1.0)
+        rss_final = rss_kb(server.pid)
+
+        await asyncio.gather(*(client.disconnect() for client in clients))
+        result = {
+            "elapsed": elapsed,
+            "sent": sum(stats.sent.values()),
+            "messages": stats.messages_received - messages_before,
+            "bytes": stats.bytes_received - bytes_before,
+            "rss": (rss_idle, rss_connected, rss_loaded, rss_final),
+        }
+    finally:
+        server.terminate()
+        server.wait(10)
+    return {**result, "stats": stats}
+
+def report(args, result: dict):
+    stats, elapsed = result["stats"], result["elapsed"]
+    xml_kb = len(generate_bpmn(SIZES[args.size])) / 1024
+    print(f"{args.clients} clients in {args.rooms} rooms, {args.rate:g} events/s each, "
+          f"{args.size} diagram ({xml_kb:.0f} KB), {elapsed:.1f} s")
+    print(f"sent      {result['sent'] / elapsed:>10.0f} events/s")
+    print(f"received  {result['messages'] / elapsed:>10.0f} messages/s")
+    print(f"bytes     {result['bytes'] / elapsed / 1024 / 1024:>10.2f} MB/s "
+          f"({result['bytes'] / max(1, result['messages']):.0f} B/message)")
+    print()
+    print(f"{'event':>16} {'sent':>7} {'deliveries':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for event in ACTIONS:
+        samples = stats.latency.get(event, [])
+        print(f"{event:>16} {stats.sent[event]:>7} {len(samples):>11} {percentile(samples, 50):>8.2f} "
+              f"{percentile(samples, 95):>8.2f} {percentile(samples, 99):>8.2f}")
+    print(f"{'join (churn)':>16} {len(stats.joins):>7} {'':>11} {percentile(stats.joins, 50):>8.2f} "
+          f"{percentile(stats.joins, 95):>8.2f} {percentile(stats.joins, 99):>8.2f}")
+
+    rss_idle, rss_connected, rss_loaded, rss_final = result["rss"]
+    if rss_idle is not None:
+        print()
+        print(f"server RSS idle {rss_idle / 1024:.1f} MB, connected {rss_connected / 1024:.1f} MB, "
+              f"diagrams loaded {rss_loaded / 1024:.1f} MB, after run {rss_final / 1024:.1f} MB")
+        print(f"memory per connection {(rss_connected - rss_idle) / args.clients:.1f} KB, "
+              f"per diagram {(rss_loaded - rss_connected) / args.rooms:.1f} KB")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100, help="long-lived clients")
+    parser.add_argument("--rooms", type=int, default=10, help="rooms the clients are spread over")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--rate", type=float, default=2.0, help="events per second per client")
+    parser.add_argument("--churn", type=float, default=5.0, help="join/leave cycles per second (0 disables)")
+    parser.add_argument("--size", default="small", choices=list(SIZES), help="diagram sent by update_diagram")
+    args = parser.parse_args()
+    report(args, await run(args))
+
+if __name__ == "__main__":
+    asyncio.run(main())
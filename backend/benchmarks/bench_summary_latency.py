@@ -0,0 +1,132 @@
+"""Socket.IO echo latency while /api/summary requests run concurrently.
+
+Starts the server once per worker-pool mode and, while a batch of distinct
+large diagrams is being summarized, measures round trips of the ``ping``
+event. Run from the backend directory:
+
+    python -m benchmarks.bench_summary_latency --modes inline thread process
+
+Requires ``aiohttp`` (used by the Socket.IO async client; listed in
+requirements.txt).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+import socketio
+
+from benchmarks.bpmn_generator import generate_bpmn
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def wait_for_server(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+async def ping_loop(client, samples, stop: asyncio.Event, interval: float):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.call("ping", {"t": started}, timeout=30)
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+
+async def summarize_all(url: str, diagrams, concurrency: int):
+    statuses = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        async def one(xml):
+            async with semaphore:
+                async with session.post(f"{url}/api/summary", json={"xml": xml}) as response:
+                    await response.read()
+                    statuses.append(response.status)
+        await asyncio.gather(*(one(xml) for xml in diagrams))
+    return statuses
+
+async def run_mode(mode: str, args) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "BPMN_WORKER_POOL": mode}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:asgi_app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        await wait_for_server(url)
+        client = socketio.AsyncClient()
+        await client.connect(url, auth={"username": "bench", "room": "bench"}, transports=["websocket"])
+
+        baseline = []
+        stop = asyncio.Event()
+        idle = asyncio.create_task(ping_loop(client, baseline, stop, args.interval))
+        await asyncio.sleep(1.0)
+        stop.set()
+        await idle
+
+        diagrams = [generate_bpmn(args.tasks, seed=i, process_name=f"Bench {i}") for i in range(args.requests)]
+        loaded = []
+        stop = asyncio.Event()
+        pinger = asyncio.create_task(ping_loop(client, loaded, stop, args.interval))
+        started = time.perf_counter()
+        statuses = await summarize_all(url, diagrams, args.concurrency)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await pinger
+        await client.disconnect()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    return {
+        "mode": mode,
+        "idle_p50": percentile(baseline, 50),
+        "idle_p99": percentile(baseline, 99),
+        "p50": percentile(loaded, 50),
+        "p99": percentile(loaded, 99),
+        "max": max(loaded) if loaded else 0.0,
+        "pings": len(loaded),
+        "summaries_per_s": len(diagrams) / elapsed,
+        "rejected": sum(1 for status in statuses if status == 503),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread", "process"])
+    parser.add_argument("--tasks", type=int, default=2500, help="tasks per generated diagram")
+    parser.add_argument("--requests", type=int, default=24, help="distinct diagrams to summarize")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent HTTP requests")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between pings")
+    args = parser.parse_args()
+
+    print(f"{args.requests} summaries of {args.tasks}-task diagrams, {args.concurrency} concurrent")
+    print(f"{'mode':>8} {'idle p50':>9} {'idle p99':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'pings':>6} {'sum/s':>7} {'503s':>5}")
+    for mode in args.modes:
+        r = await run_mode(mode, args)
+        print(f"{r['mode']:>8} {r['idle_p50']:>9.2f} {r['idle_p99']:>9.2f} {r['p50']:>8.2f} {r['p99']:>8.2f} "
+              f"{r['max']:>8.2f} {r['pings']:>6} {r['summaries_per_s']:>7.1f} {r['rejected']:>5}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
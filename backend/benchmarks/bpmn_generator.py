@@ -0,0 +1,63 @@
+import random
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="Definitions_1" targetNamespace="http://bpmn.io/schema/bpmn">
+"""
+
+SIZES = {
+    "small": 50,
+    "medium": 500,
+    "large": 2500,
+    "xlarge": 10000,
+}
+
+TASK_TYPES = ["task", "userTask", "serviceTask", "scriptTask", "manualTask"]
+
+def generate_bpmn(task_count: int, seed: int = 0, process_name: str = "Generated Process") -> str:
+    rng = random.Random(seed)
+    nodes = [("startEvent", "StartEvent_1", "Start")]
+    for i in range(task_count):
+        if i and i % 10 == 0:
+            nodes.append(("exclusiveGateway", f"Gateway_{i}", f"Decision {i}"))
+        nodes.append((rng.choice(TASK_TYPES), f"Activity_{i}", f"Step {i}"))
+    nodes.append(("endEvent", "EndEvent_1", "Done"))
+
+    process = [f'  <bpmn:process id="Process_1" name="{process_name}" isExecutable="false">']
+    shapes = []
+    edges = []
+    for index, (kind, element_id, name) in enumerate(nodes):
+        process.append(f'    <bpmn:{kind} id="{element_id}" name="{name}"/>')
+        x, y = 150 + (index % 40) * 160, 100 + (index // 40) * 140
+        shapes.append(
+            f'      <bpmndi:BPMNShape id="{element_id}_di" bpmnElement="{element_id}">\n'
+            f'        <dc:Bounds x="{x}" y="{y}" width="100" height="80"/>\n'
+            f'      </bpmndi:BPMNShape>'
+        )
+    for index in range(len(nodes) - 1):
+        source, target = nodes[index][1], nodes[index + 1][1]
+        flow_id = f"Flow_{index}"
+        process.append(f'    <bpmn:sequenceFlow id="{flow_id}" sourceRef="{source}" targetRef="{target}"/>')
+        edges.append(
+            f'      <bpmndi:BPMNEdge id="{flow_id}_di" bpmnElement="{flow_id}">\n'
+            f'        <di:waypoint x="0" y="0"/>\n'
+            f'        <di:waypoint x="10" y="10"/>\n'
+            f'      </bpmndi:BPMNEdge>'
+        )
+    process.append("  </bpmn:process>")
+
+    diagram = [
+        '  <bpmndi:BPMNDiagram id="BPMNDiagram_1">',
+        '    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">',
+        *shapes,
+        *edges,
+        "    </bpmndi:BPMNPlane>",
+        "  </bpmndi:BPMNDiagram>",
+    ]
+    return HEADER + "\n".join(process + diagram) + "\n</bpmn:definitions>\n"
+
+def generate_sized(size: str, seed: int = 0) -> str:
+    return generate_bpmn(SIZES[size], seed=seed)
+
+if __name__ == "__main__":
+    for name, count in SIZES.items():
+        print(f"{name:>7}: {count:>6} tasks, {len(generate_bpmn(count)) / 1024:8.1f} KB")
@@ -0,0 +1,73 @@
+import asyncio
+from app.services.activity import ActivityPipeline, ALL, EDIT, OFF, PRESENCE, SYNC
+from app.services.diagram_state import DiagramState
+from app.services.outbound import packet_event
+from app.services.room_manager import room_manager
+from tests.test_concurrency import SimulatedCluster
+
+
+class TestActivityPipeline:
+    def setup_method(self):
+        self.state = DiagramState()
+        self.batches = []
+        self.pipeline = ActivityPipeline(self.state, flush_ms=20, levels={SYNC: ALL, "noise": OFF})
+        self.pipeline.attach(self._emit)
+
+    async def _emit(self, entries):
+        self.batches.append([entry["message"] for entry in entries])
+
+    async def test_repeats_collapse_in_first_seen_order(self):
+        for _ in range(37):
+            self.pipeline.record(EDIT, "alice", "updated diagram")
+        self.pipeline.record(PRESENCE, "bob", "connected")
+        self.pipeline.record(EDIT, "alice", "updated diagram")
+        assert self.state.activity.last_seq == 0
+        await asyncio.sleep(0.05)
+        assert self.batches == [["alice updated diagram ×38", "bob connected"]]
+        assert [entry["message"] for entry in self.state.logs] == self.batches[0]
+        assert self.pipeline.collapsed == 37
+
+    async def test_next_window_starts_a_new_entry(self):
+        self.pipeline.record(EDIT, "alice", "updated diagram")
+        await self.pipeline.flush()
+        self.pipeline.record(EDIT, "alice", "updated diagram")
+        await self.pipeline.flush()
+        assert self.batches == [["alice updated diagram"], ["alice updated diagram"]]
+
+    async def test_levels(self):
+        self.pipeline.record("noise", "alice", "moved cursor")
+        self.pipeline.record(SYNC, "alice", "synced diagram for all users")
+        self.pipeline.record(SYNC, "alice", "synced diagram for all users")
+        await self.pipeline.flush()
+        assert self.batches == [["alice synced diagram for all users"] * 2]
+        await self.pipeline.flush()
+        assert len(self.batches) == 1
+
+    async def test_close_keeps_pending_entries_in_the_log(self):
+        self.pipeline.record(PRESENCE, "alice", "disconnected")
+        self.pipeline.close()
+        await asyncio.sleep(0.05)
+        assert self.batches == []
+        assert self.state.logs[-1]["message"] == "alice disconnected"
+
+
+class TestRoomActivity:
+    async def test_join_storm_is_one_batch_per_member(self):
+        cluster = SimulatedCluster()
+        events = []
+
+        async def record(eio_sid, pkt):
+            events.append(packet_event(pkt.data))
+
+        cluster.sio._send_eio_packet = record
+        try:
+            for i in range(3):
+                await cluster.join(i * 200)
+            room = room_manager.get("stress-0")
+            assert "activity_log_batch" not in events
+            await room.activity.flush()
+            assert events.count("activity_log_batch") == 3
+            messages = [entry["message"] for entry in room.state.logs]
+            assert messages[-3:] == ["user-0 connected", "user-200 connected", "user-400 connected"]
+        finally:
+            await cluster.leave_all()
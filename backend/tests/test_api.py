@@ -1,6 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.services.workers import worker_pool
+from app.services.room_manager import room_manager
 
 
 @pytest.fixture
@@ -52,3 +54,50 @@ class TestSummaryEndpoint:
         )
         assert response.status_code == 422  # Validation error
 
+
+    def test_summary_endpoint_saturated(self, client, monkeypatch):
+        monkeypatch.setattr(worker_pool, "pending", worker_pool.capacity)
+        response = client.post(
+            "/api/summary",
+            json={"xml": "<bpmn:definitions xmlns:bpmn='http://www.omg.org/spec/BPMN/20100524/MODEL' id='saturated'/>"}
+        )
+        assert response.status_code == 503
+
+
+class TestRoomEndpoints:
+    def test_unknown_room_summary(self, client):
+        response = client.get("/api/rooms/does-not-exist/summary")
+        assert response.status_code == 404
+
+    def test_incremental_chat_history(self, client):
+        room = room_manager.get_or_create("history-room")
+        try:
+            for i in range(3):
+                room.state.add_chat_message("alice", f"message {i}")
+            response = client.get("/api/rooms/history-room/chat", params={"after": 1})
+            assert response.status_code == 200
+            assert [entry["seq"] for entry in response.json()["entries"]] == [2, 3]
+            assert client.get("/api/rooms/history-room/activity").json()["entries"] == []
+        finally:
+            room_manager.remove_room("history-room")
+
+    def test_element_lookup(self, client):
+        room = room_manager.get_or_create("elements-room")
+        try:
+            room.state.xml = """<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">
+                <bpmn:process id="Process_1">
+                    <bpmn:startEvent id="StartEvent_1"/>
+                    <bpmn:task id="Task_1"/>
+                    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Task_1"/>
+                </bpmn:process>
+            </bpmn:definitions>"""
+            response = client.get("/api/rooms/elements-room/elements", params={"type": "task"})
+            assert response.status_code == 200
+            assert [element["id"] for element in response.json()["elements"]] == ["Task_1"]
+            element = client.get("/api/rooms/elements-room/elements/Task_1").json()
+            assert element["incoming"] == ["Flow_1"]
+            assert element["process"] == "Process_1"
+            assert element["locked_by"] is None
+            assert client.get("/api/rooms/elements-room/elements/Nope").status_code == 404
+        finally:
+            room_manager.remove_room("elements-room")
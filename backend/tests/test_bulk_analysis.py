@@ -0,0 +1,94 @@
+import asyncio
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import bulk_analysis
+from app.services.bulk_analysis import analyze_bulk, ndjson_lines
+from app.services.diagram_summary import _analyze
+from app.services.workers import WorkerPoolSaturated
+
+def diagram(name: str) -> str:
+    return (f'<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">'
+            f'<bpmn:process id="P" name="{name}"><bpmn:task id="T"/></bpmn:process></bpmn:definitions>')
+
+
+async def chunked(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+async def collect(body: bytes, size: int = 13, concurrency: int = None):
+    return [json.loads(line) async for line in analyze_bulk(chunked(body, size), concurrency)]
+
+
+class TestNdjsonLines:
+    async def test_lines_across_chunks(self):
+        body = b'{"a": 1}\n\n{"b": 2}\n{"c": 3}'
+        assert [line async for line in ndjson_lines(chunked(body, 3), 0)] == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+
+    async def test_long_line_is_reported_once_and_skipped(self):
+        body = b'{"a": 1}\n' + b"x" * 50 + b'\n{"b": 2}\n'
+        assert [line async for line in ndjson_lines(chunked(body, 4), 16)] == [b'{"a": 1}', None, b'{"b": 2}']
+
+
+class TestAnalyzeBulk:
+    async def test_results_per_item_with_errors(self):
+        lines = [json.dumps({"id": "a", "xml": diagram("Alpha")}), "not json", json.dumps({"id": "c"}),
+                 json.dumps({"id": "d", "xml": "<broken"}), json.dumps({"xml": diagram("Epsilon")})]
+        results = {result["index"]: result for result in await collect("\n".join(lines).encode("utf-8"))}
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        assert results[0] == {"index": 0, "id": "a", **_analyze(diagram("Alpha"))}
+        assert results[1]["error"] and results[1]["id"] is None
+        assert results[2]["error"] and results[2]["id"] == "c"
+        assert results[3]["error"] and results[3]["id"] == "d"
+        assert "Epsilon" in results[4]["summary"]
+
+    async def test_concurrency_cap(self, monkeypatch):
+        running = 0
+        peak = 0
+
+        async def slow_analysis(xml):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.005)
+            running -= 1
+            return {"summary": "ok"}
+
+        monkeypatch.setattr(bulk_analysis, "analyze_bpmn_diagram_async", slow_analysis)
+        monkeypatch.setattr("app.config.BULK_CONCURRENCY", 3)
+        body = "\n".join(json.dumps({"id": i, "xml": "<x/>"}) for i in range(20)).encode("utf-8")
+        # Clients may ask for less parallelism but never more than the server cap
+        results = await collect(body, concurrency=10)
+        assert sorted(result["id"] for result in results) == list(range(20))
+        assert peak == 3
+        peak = 0
+        await collect(body, concurrency=2)
+        assert peak == 2
+
+    async def test_saturated_pool_is_retried(self, monkeypatch):
+        calls = []
+
+        async def busy_once(xml):
+            calls.append(xml)
+            if len(calls) == 1:
+                raise WorkerPoolSaturated("busy")
+            return {"summary": "ok"}
+
+        monkeypatch.setattr(bulk_analysis, "analyze_bpmn_diagram_async", busy_once)
+        monkeypatch.setattr(bulk_analysis, "SATURATED_BACKOFF_SECONDS", 0)
+        assert await collect(json.dumps({"id": 1, "xml": "<x/>"}).encode("utf-8")) == [{"index": 0, "id": 1, "summary": "ok"}]
+        assert len(calls) == 2
+
+
+class TestBulkEndpoint:
+    def test_streams_ndjson(self, monkeypatch):
+        # Bulk bodies are exempt from the request size limit; each line is bounded instead
+        monkeypatch.setattr("app.config.MAX_REQUEST_BYTES", 2048)
+        body = "".join(json.dumps({"id": i, "xml": diagram(f"Process {i}")}) + "\n" for i in range(30))
+        response = TestClient(app).post("/api/summary/bulk?concurrency=4", content=body)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(result["id"] for result in results) == list(range(30))
+        assert all(not result.get("error") for result in results)
@@ -0,0 +1,175 @@
+import asyncio
+import socketio
+import pytest
+from app.services.cluster import HashRing, InMemoryBus, MessageBus, TCPBus, BusClientManager, Cluster, parse_nodes, run_broker
+
+
+class TestHashRing:
+    def test_owner_is_stable_and_spread(self):
+        ring = HashRing(["a", "b", "c"])
+        owners = [ring.owner(f"room-{i}") for i in range(3000)]
+        assert owners == [ring.owner(f"room-{i}") for i in range(3000)]
+        for node in ("a", "b", "c"):
+            assert 600 < owners.count(node) < 1400
+
+    def test_removing_node_only_moves_its_rooms(self):
+        ring = HashRing(["a", "b", "c"])
+        before = {f"room-{i}": ring.owner(f"room-{i}") for i in range(1000)}
+        ring.remove("c")
+        for room_id, owner in before.items():
+            if owner != "c":
+                assert ring.owner(room_id) == owner
+            else:
+                assert ring.owner(room_id) in ("a", "b")
+
+    def test_empty_ring(self):
+        assert HashRing().owner("room") is None
+
+
+class TestCluster:
+    def test_parse_nodes(self):
+        nodes = parse_nodes("a=http://127.0.0.1:8001, b=http://127.0.0.1:8002,")
+        assert nodes == {"a": "http://127.0.0.1:8001", "b": "http://127.0.0.1:8002"}
+
+    def test_ownership(self):
+        nodes = {"a": "http://a", "b": "http://b"}
+        cluster_a = Cluster("a", nodes, InMemoryBus())
+        cluster_b = Cluster("b", nodes, InMemoryBus())
+        for i in range(50):
+            room_id = f"room-{i}"
+            assert cluster_a.owns(room_id) != cluster_b.owns(room_id)
+            assert cluster_a.owner_url(room_id) == nodes[cluster_a.owner(room_id)]
+
+    def test_unknown_node_rejected(self):
+        with pytest.raises(ValueError):
+            Cluster("z", {"a": "http://a"}, InMemoryBus())
+
+
+async def next_message(subscription):
+    return await asyncio.wait_for(subscription.__anext__(), 2)
+
+
+class TestBuses:
+    def test_bus_must_implement_publish_and_subscribe(self):
+        class PublishOnly(MessageBus):
+            async def publish(self, channel, message):
+                pass
+
+        with pytest.raises(TypeError):
+            PublishOnly()
+
+    async def test_in_memory_bus(self):
+        bus = InMemoryBus()
+        first = bus.subscribe("events")
+        second = bus.subscribe("events")
+        pending = [asyncio.ensure_future(next_message(first)), asyncio.ensure_future(next_message(second))]
+        await asyncio.sleep(0.01)
+        await bus.publish("events", '{"n": 1}')
+        await bus.publish("other", '{"n": 2}')
+        assert await asyncio.gather(*pending) == ['{"n": 1}', '{"n": 1}']
+        await first.aclose()
+        await second.aclose()
+
+    async def test_tcp_bus(self):
+        server = await run_broker("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        publisher = TCPBus("127.0.0.1", port, retry_seconds=0.01)
+        subscriber = TCPBus("127.0.0.1", port, retry_seconds=0.01)
+        subscription = subscriber.subscribe("events")
+        pending = asyncio.ensure_future(next_message(subscription))
+        await asyncio.sleep(0.05)
+        await publisher.publish("events", '{"n": 1}')
+        assert await pending == '{"n": 1}'
+        await subscription.aclose()
+        await publisher.close()
+        server.close()
+        await server.wait_closed()
+        await asyncio.sleep(0.01)
+
+    async def test_malformed_lines_are_skipped(self):
+        async def broker(reader, writer):
+            await reader.readline()
+            writer.write(b"MSG\nMSG events\n\xff\xfe\nMSG events {\"n\": 2}\n")
+            await writer.drain()
+
+        fake = await asyncio.start_server(broker, "127.0.0.1", 0)
+        subscription = TCPBus("127.0.0.1", fake.sockets[0].getsockname()[1], retry_seconds=0.01).subscribe("events")
+        assert await asyncio.wait_for(next_message(subscription), 1) == '{"n": 2}'
+        await subscription.aclose()
+        fake.close()
+        await fake.wait_closed()
+
+        server = await run_broker("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        subscriber = TCPBus("127.0.0.1", port, retry_seconds=0.01)
+        subscription = subscriber.subscribe("events")
+        pending = asyncio.ensure_future(next_message(subscription))
+        await asyncio.sleep(0.05)
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"PUB\n\xff\nPUB events {\"n\": 3}\n")
+        await writer.drain()
+        assert await asyncio.wait_for(pending, 1) == '{"n": 3}'
+        writer.close()
+        await subscription.aclose()
+        server.close()
+        await server.wait_closed()
+        await asyncio.sleep(0.01)
+
+
+class TestBusClientManager:
+    async def test_emit_reaches_other_server(self):
+        bus = InMemoryBus()
+        sio_a = socketio.AsyncServer(async_mode="asgi", client_manager=BusClientManager(bus))
+        sio_b = socketio.AsyncServer(async_mode="asgi", client_manager=BusClientManager(bus))
+        sio_a.manager.initialize()
+        sio_b.manager.initialize()
+
+        sent = []
+
+        async def capture(eio_sid, pkt):
+            sent.append((eio_sid, pkt.data))
+
+        sio_b._send_eio_packet = capture
+        await sio_b.manager.connect("eio-1", "/")
+        sid = sio_b.manager.sid_from_eio_sid("eio-1", "/")
+        await sio_b.manager.enter_room(sid, "/", "room-1")
+        await asyncio.sleep(0)
+
+        await sio_a.emit("diagram_update", {"revision": 3}, room="room-1")
+        for _ in range(50):
+            if sent:
+                break
+            await asyncio.sleep(0.01)
+        sio_a.manager.thread.cancel()
+        sio_b.manager.thread.cancel()
+        assert sent == [("eio-1", '2["diagram_update",{"revision":3}]')]
+
+    async def test_owned_room_emits_stay_off_the_bus(self):
+        bus = InMemoryBus()
+        published = []
+
+        async def publish(channel, message):
+            published.append(message)
+
+        bus.publish = publish
+        sio = socketio.AsyncServer(async_mode="asgi", client_manager=BusClientManager(bus, owns=lambda room: room == "room-1"))
+        sio.manager.initialize()
+        sent = []
+
+        async def capture(eio_sid, pkt):
+            sent.append(pkt.data)
+
+        sio._send_eio_packet = capture
+        await sio.manager.connect("eio-1", "/")
+        sid = sio.manager.sid_from_eio_sid("eio-1", "/")
+        await sio.manager.enter_room(sid, "/", "room-1")
+
+        await sio.emit("cursor_batch", {"cursors": []}, room="room-1")
+        await sio.emit("diagram_version", {"version": 1}, to=sid)
+        assert published == []
+        assert sent == ['2["cursor_batch",{"cursors":[]}]', '2["diagram_version",{"version":1}]']
+
+        await sio.emit("diagram_update", {"revision": 1}, room="room-2")
+        await sio.emit("nodes_changed", {})
+        assert len(published) == 2
+        sio.manager.thread.cancel()
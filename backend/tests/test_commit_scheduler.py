@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from app.services.commit_scheduler import CommitScheduler
+from app.services.outbound import packet_event
+from app.services.room_manager import room_manager
+from tests.test_concurrency import SimulatedCluster
+
+
+class TestCommitScheduler:
+    def setup_method(self):
+        self.commits = []
+        self.scheduler = CommitScheduler(window_ms=20, max_latency_ms=60)
+        self.scheduler.attach(self._commit)
+
+    async def _commit(self, batch):
+        self.commits.append((batch.sender, batch.author, batch.xml, batch.count))
+        await asyncio.sleep(0)
+        return len(self.commits)
+
+    async def test_burst_from_one_sender_is_one_commit(self):
+        waiters = [self.scheduler.submit("sid-1", "alice", f"<xml {i}/>") for i in range(5)]
+        assert await asyncio.gather(*waiters) == [1] * 5
+        assert self.commits == [("sid-1", "alice", "<xml 4/>", 5)]
+        assert self.scheduler.squashed == 4
+
+    async def test_other_sender_commits_pending_first(self):
+        first = self.scheduler.submit("sid-1", "alice", "<a/>")
+        second = self.scheduler.submit("sid-2", "bob", "<b/>")
+        third = self.scheduler.submit("sid-1", "alice", "<c/>")
+        assert await asyncio.gather(first, second, third) == [1, 2, 3]
+        assert [xml for _, _, xml, _ in self.commits] == ["<a/>", "<b/>", "<c/>"]
+
+    async def test_max_latency_bounds_a_steady_stream(self):
+        waiters = []
+        for i in range(10):
+            waiters.append(self.scheduler.submit("sid-1", "alice", f"<xml {i}/>"))
+            await asyncio.sleep(0.012)
+        await asyncio.gather(*waiters)
+        # Updates every 12 ms never let the 20 ms window close, so the 60 ms bound splits them
+        assert len(self.commits) >= 2
+        assert self.commits[-1][2] == "<xml 9/>"
+
+    async def test_flush_commits_and_waits(self):
+        waiter = self.scheduler.submit("sid-1", "alice", "<a/>")
+        await self.scheduler.flush()
+        assert waiter.done() and waiter.result() == 1
+        await self.scheduler.flush()
+        assert len(self.commits) == 1
+
+    async def test_zero_window_commits_each_update(self):
+        scheduler = CommitScheduler(window_ms=0)
+        scheduler.attach(self._commit)
+        assert await scheduler.submit("sid-1", "alice", "<a/>") == 1
+        assert await scheduler.submit("sid-1", "alice", "<b/>") == 2
+
+    async def test_commit_error_reaches_every_waiter(self):
+        async def failing(batch):
+            raise RuntimeError("boom")
+
+        scheduler = CommitScheduler(window_ms=5)
+        scheduler.attach(failing)
+        waiters = [scheduler.submit("sid-1", "alice", "<a/>") for _ in range(2)]
+        for waiter in waiters:
+            with pytest.raises(RuntimeError):
+                await waiter
+
+
+def diagram(index: int) -> str:
+    return f"<bpmn:definitions><bpmn:process id='Drag_{index}'/></bpmn:definitions>"
+
+
+class TestSquashedUpdates:
+    async def test_drag_burst_is_one_revision_and_one_version(self):
+        cluster = SimulatedCluster()
+        try:
+            for i in range(3):
+                await cluster.join(i * 200)
+            room = room_manager.get("stress-0")
+            state = room.state
+            versions = len(state.versions)
+            events = []
+
+            async def record(eio_sid, pkt):
+                events.append(packet_event(pkt.data))
+
+            cluster.sio._send_eio_packet = record
+            sid = cluster.clients[0][0]
+            acks = await asyncio.gather(*(cluster.handlers["update_diagram"](sid, {"xml": diagram(i)}) for i in range(20)))
+            assert {ack["revision"] for ack in acks} == {state.revision}
+            assert all(ack["ok"] for ack in acks)
+            assert state.xml == diagram(19)
+            assert len(state.versions) == versions + 1
+            # One broadcast to each of the two other members
+            assert events.count("diagram_update") == 2
+
+            # A patch right behind a pending update sees the update's revision
+            pending = cluster.handlers["update_diagram"](sid, {"xml": diagram(20)})
+            task = asyncio.ensure_future(pending)
+            await asyncio.sleep(0)
+            ack = await cluster.handlers["patch_diagram"](cluster.clients[1][0], {
+                "base_revision": state.revision, "added": [], "changed": [], "removed": []})
+            assert not ack["ok"] and ack["revision"] == (await task)["revision"]
+        finally:
+            await cluster.leave_all()
@@ -0,0 +1,139 @@
+import asyncio
+import socketio
+from app.events import register_events
+from app.services.room_manager import room_manager
+from app.utils import PayloadJSON
+
+CLIENTS = 2000
+ROOMS = 200
+
+
+class SimulatedCluster:
+    def __init__(self):
+        self.sio = socketio.AsyncServer(async_mode="asgi", json=PayloadJSON)
+        self.sio._send_eio_packet = self._send
+        register_events(self.sio)
+        self.handlers = self.sio.handlers["/"]
+        self.sent = 0
+        self.clients = []
+
+    async def _send(self, eio_sid, pkt):
+        self.sent += 1
+
+    async def join(self, index: int):
+        room_id = f"stress-{index % ROOMS}"
+        sid = await self.sio.manager.connect(f"eio-{index}", "/")
+        await self.handlers["connect"](sid, {"QUERY_STRING": ""}, {"username": f"user-{index}", "room": room_id})
+        self.clients.append((sid, room_id, index))
+
+    async def leave_all(self):
+        for sid, _, _ in self.clients:
+            await self.handlers["disconnect"](sid)
+            await self.sio.manager.disconnect(sid, "/")
+
+
+def diagram(index: int) -> str:
+    return f"<bpmn:definitions><bpmn:process id='P_{index}'/></bpmn:definitions>"
+
+
+class TestConcurrentClients:
+    async def test_thousands_of_clients_never_lose_updates(self):
+        cluster = SimulatedCluster()
+        try:
+            await asyncio.gather(*(cluster.join(i) for i in range(CLIENTS)))
+            assert sum(len(room_manager.get(f"stress-{r}").users.online_users) for r in range(ROOMS)) == CLIENTS
+            base = {f"stress-{r}": room_manager.get(f"stress-{r}").state.revision for r in range(ROOMS)}
+
+            async def act(sid, index):
+                ack = await cluster.handlers["update_diagram"](sid, {"xml": diagram(index)})
+                await cluster.handlers["send_chat"](sid, {"message": f"hello {index}"})
+                return ack["revision"], None
+
+            async def lock(sid, index):
+                locked = await cluster.handlers["lock_element"](sid, {"element_id": f"Task_{index}"})
+                await cluster.handlers["unlock_element"](sid, {"element_id": f"Task_{index}"})
+                return locked["ok"]
+
+            results = await asyncio.gather(*(act(sid, index) for sid, _, index in cluster.clients))
+            # Locks held by others send full updates through the lock check, so they get their own phase
+            assert all(await asyncio.gather(*(lock(sid, index) for sid, _, index in cluster.clients)))
+
+            by_room = {}
+            for (revision, _), (_, room_id, index) in zip(results, cluster.clients):
+                by_room.setdefault(room_id, []).append((revision, index))
+
+            for room_id, updates in by_room.items():
+                state = room_manager.get(room_id).state
+                revisions = sorted(revision for revision, _ in updates)
+                # Every update got its own revision and none were lost
+                assert revisions == list(range(base[room_id] + 1, base[room_id] + len(updates) + 1))
+                assert state.revision == revisions[-1]
+                last_index = max(updates)[1]
+                assert state.xml == diagram(last_index)
+                # Versions always record the XML that was committed with them
+                latest = state.get_version(state.versions[0]["version"])
+                assert latest["xml"] == state.xml
+                assert latest["author"] == f"user-{last_index}"
+                assert state.chat_history.last_seq == len(updates)
+                assert state.locks == {}
+        finally:
+            await cluster.leave_all()
+        assert all(room_manager.get(f"stress-{r}") is None for r in range(ROOMS))
+        assert cluster.sent > CLIENTS
+
+    async def test_concurrent_patches_on_one_revision_have_one_winner(self):
+        cluster = SimulatedCluster()
+        try:
+            await asyncio.gather(*(cluster.join(i) for i in range(200)))
+            room_id = "stress-0"
+            state = room_manager.get(room_id).state
+            await cluster.handlers["update_diagram"](cluster.clients[0][0], {
+                "xml": "<bpmn:definitions xmlns:bpmn='http://www.omg.org/spec/BPMN/20100524/MODEL'>"
+                       "<bpmn:process id='Process_1'/></bpmn:definitions>"
+            })
+            base_revision = state.revision
+            members = [sid for sid, room, _ in cluster.clients if room == room_id]
+
+            async def patch(sid, index):
+                return await cluster.handlers["patch_diagram"](sid, {
+                    "base_revision": base_revision,
+                    "added": [{"id": f"Task_{index}", "parent_id": "Process_1",
+                               "xml": f"<bpmn:task id='Task_{index}'/>"}],
+                    "changed": [],
+                    "removed": []
+                })
+
+            acks = await asyncio.gather(*(patch(sid, i) for i, sid in enumerate(members)))
+            assert sum(1 for ack in acks if ack["ok"]) == 1
+            assert state.revision == base_revision + 1
+            assert all(ack["revision"] >= base_revision for ack in acks)
+        finally:
+            await cluster.leave_all()
+
+
+class SlowPersistence:
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def hydrate(self, room_id, state):
+        await self.release.wait()
+
+    def unload(self, room_id):
+        return None
+
+
+class TestConnectRace:
+    async def test_disconnect_during_hydration_leaves_no_ghost(self, monkeypatch):
+        persistence = SlowPersistence()
+        monkeypatch.setattr(room_manager, "persistence", persistence)
+        cluster = SimulatedCluster()
+        sid = await cluster.sio.manager.connect("eio-ghost", "/")
+        connecting = asyncio.create_task(
+            cluster.handlers["connect"](sid, {"QUERY_STRING": ""}, {"username": "ghost", "room": "race-room"}))
+        await asyncio.sleep(0)
+        await cluster.handlers["disconnect"](sid)
+        await cluster.sio.manager.disconnect(sid, "/")
+        persistence.release.set()
+        await connecting
+        assert sid not in room_manager.sid_to_room
+        assert room_manager.get("race-room") is None
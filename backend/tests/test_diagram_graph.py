@@ -0,0 +1,122 @@
+from app.services.diagram_graph import FlowGraph, GraphCollector, analyze_graph
+from app.services.diagram_model import DiagramModel
+from app.services.diagram_summary import _analyze
+from app.services.room_manager import Room
+from app.services.xml_ingest import StreamingParser
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" id="Definitions_1">
+  <bpmn:process id="Process_1" name="Orders">
+    <bpmn:startEvent id="Start"/>
+    <bpmn:parallelGateway id="Fork"/>
+    <bpmn:task id="A"/>
+    <bpmn:task id="B"/>
+    <bpmn:task id="Retry"/>
+    <bpmn:exclusiveGateway id="Merge"/>
+    <bpmn:subProcess id="Sub">
+      <bpmn:startEvent id="SubStart"/>
+      <bpmn:task id="SubTask"/>
+      <bpmn:endEvent id="SubEnd"/>
+      <bpmn:sequenceFlow id="f_s1" sourceRef="SubStart" targetRef="SubTask"/>
+      <bpmn:sequenceFlow id="f_s2" sourceRef="SubTask" targetRef="SubEnd"/>
+    </bpmn:subProcess>
+    <bpmn:boundaryEvent id="Timeout" attachedToRef="Sub"/>
+    <bpmn:task id="Escalate"/>
+    <bpmn:endEvent id="End"/>
+    <bpmn:task id="Orphan"/>
+    <bpmn:sequenceFlow id="f1" sourceRef="Start" targetRef="Fork"/>
+    <bpmn:sequenceFlow id="f2" sourceRef="Fork" targetRef="A"/>
+    <bpmn:sequenceFlow id="f3" sourceRef="Fork" targetRef="B"/>
+    <bpmn:sequenceFlow id="f4" sourceRef="B" targetRef="Retry"/>
+    <bpmn:sequenceFlow id="f5" sourceRef="Retry" targetRef="B"/>
+    <bpmn:sequenceFlow id="f6" sourceRef="A" targetRef="Merge"/>
+    <bpmn:sequenceFlow id="f7" sourceRef="B" targetRef="Merge"/>
+    <bpmn:sequenceFlow id="f8" sourceRef="Merge" targetRef="Sub"/>
+    <bpmn:sequenceFlow id="f9" sourceRef="Sub" targetRef="End"/>
+    <bpmn:sequenceFlow id="f10" sourceRef="Timeout" targetRef="Escalate"/>
+  </bpmn:process>
+</bpmn:definitions>"""
+
+
+def streamed(xml: str) -> FlowGraph:
+    collector = GraphCollector()
+    parser = StreamingParser(collector)
+    parser.feed(xml)
+    parser.close()
+    return collector.graph()
+
+
+class TestGraphAnalysis:
+    def setup_method(self):
+        self.analysis = analyze_graph(streamed(XML))
+
+    def test_reachability_follows_containers_and_boundaries(self):
+        # Sub-process internals and the boundary path are reachable; the orphan is not
+        assert self.analysis["unreachable"] == {"count": 1, "ids": ["Orphan"]}
+        assert self.analysis["node_count"] == 14
+        assert self.analysis["flow_count"] == 12
+
+    def test_dead_ends(self):
+        assert self.analysis["dead_ends"]["ids"] == ["Escalate", "Orphan"]
+
+    def test_gateways(self):
+        assert self.analysis["gateways"]["parallelGateway"] == {"splits": 1, "joins": 0}
+        # A parallel split merged by an exclusive gateway never synchronizes
+        assert self.analysis["unbalanced_gateways"] == {"parallelGateway": {"splits": 1, "joins": 0}}
+        assert self.analysis["mixed_gateways"]["count"] == 0
+
+    def test_cycles_and_longest_path(self):
+        assert self.analysis["cycles"]["count"] == 1
+        assert sorted(self.analysis["cycles"]["ids"][0]) == ["B", "Retry"]
+        # Start, Fork, the B/Retry loop as one step, Merge, Sub, End
+        assert self.analysis["longest_path"]["length"] == 6
+        path = self.analysis["longest_path"]["ids"]
+        assert path[:2] == ["Start", "Fork"] and path[-3:] == ["Merge", "Sub", "End"]
+
+    def test_self_loop_is_a_cycle(self):
+        xml = XML.replace('targetRef="End"/>', 'targetRef="End"/><bpmn:sequenceFlow id="f11" sourceRef="A" targetRef="A"/>')
+        assert analyze_graph(streamed(xml))["cycles"]["count"] == 2
+
+    def test_event_sub_process_is_a_root(self):
+        xml = XML.replace('<bpmn:task id="Orphan"/>', '''<bpmn:subProcess id="ESP" triggeredByEvent="true">
+      <bpmn:startEvent id="ES"/>
+      <bpmn:endEvent id="EE"/>
+      <bpmn:sequenceFlow id="f_e1" sourceRef="ES" targetRef="EE"/>
+    </bpmn:subProcess>''')
+        for graph in (streamed(xml), FlowGraph.from_model(DiagramModel.from_xml(xml))):
+            analysis = analyze_graph(graph)
+            assert analysis["unreachable"]["ids"] == []
+            assert analysis["dead_ends"]["ids"] == ["Escalate"]
+
+    def test_process_without_start_event(self):
+        xml = XML.replace('<bpmn:startEvent id="Start"/>', '<bpmn:task id="Start"/>')
+        analysis = analyze_graph(streamed(xml))
+        assert analysis["unreachable"] == {"count": 0, "ids": []}
+
+    def test_model_and_stream_agree(self):
+        assert analyze_graph(FlowGraph.from_model(DiagramModel.from_xml(XML))) == self.analysis
+        assert _analyze(XML)["graph"] == self.analysis
+
+    def test_empty_graph(self):
+        analysis = analyze_graph(FlowGraph([], []))
+        assert analysis["longest_path"] == {"length": 0, "ids": []}
+        assert analysis["cycles"]["count"] == 0
+
+
+class TestRoomGraph:
+    def setup_method(self):
+        self.room = Room("graph-room")
+        self.room.state.xml = XML
+
+    async def test_cached_per_revision(self):
+        model, graph, revision = await self.room.graph()
+        assert (await self.room.graph())[1] is graph
+        summary = await self.room.summary()
+        assert summary["graph"] is graph and summary["revision"] == revision
+
+        added = [{"id": "f12", "parent_id": "Process_1",
+                  "xml": '<bpmn:sequenceFlow id="f12" sourceRef="Start" targetRef="Orphan"/>'}]
+        self.room.state.apply_patch(revision, added, [], [])
+        _, patched, new_revision = await self.room.graph()
+        assert new_revision == revision + 1
+        assert patched["unreachable"]["count"] == 0
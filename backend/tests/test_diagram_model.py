@@ -0,0 +1,129 @@
+from app.services.diagram_model import DiagramModel
+from app.services.diagram_patch import apply_patch
+from app.services.diagram_summary import _analyze
+from app.services.room_manager import Room
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" id="Definitions_1">
+  <bpmn:process id="Process_1" name="Orders">
+    <bpmn:laneSet id="LaneSet_1">
+      <bpmn:lane id="Lane_Sales" name="Sales">
+        <bpmn:flowNodeRef>StartEvent_1</bpmn:flowNodeRef>
+        <bpmn:flowNodeRef>Task_1</bpmn:flowNodeRef>
+      </bpmn:lane>
+      <bpmn:lane id="Lane_Ops" name="Ops">
+        <bpmn:flowNodeRef>EndEvent_1</bpmn:flowNodeRef>
+      </bpmn:lane>
+    </bpmn:laneSet>
+    <bpmn:startEvent id="StartEvent_1"/>
+    <bpmn:userTask id="Task_1" name="Check order"/>
+    <bpmn:subProcess id="Sub_1">
+      <bpmn:task id="Task_2"/>
+    </bpmn:subProcess>
+    <bpmn:endEvent id="EndEvent_1"/>
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Task_1"/>
+    <bpmn:sequenceFlow id="Flow_2" sourceRef="Task_1" targetRef="EndEvent_1"/>
+  </bpmn:process>
+  <bpmndi:BPMNDiagram id="BPMNDiagram_1">
+    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
+      <bpmndi:BPMNShape id="Task_1_di" bpmnElement="Task_1">
+        <dc:Bounds x="100" y="100" width="100" height="80"/>
+      </bpmndi:BPMNShape>
+    </bpmndi:BPMNPlane>
+  </bpmndi:BPMNDiagram>
+</bpmn:definitions>"""
+
+
+def snapshot(model: DiagramModel):
+    return {element_id: model.describe(element_id) for element_id in sorted(model.elements)}, model.counts(), model.analysis()
+
+
+class TestDiagramModel:
+    def setup_method(self):
+        self.model = DiagramModel.from_xml(XML)
+
+    def test_indexes(self):
+        assert self.model.query("userTask") == ["Task_1"]
+        assert set(self.model.query(process="Process_1")) >= {"StartEvent_1", "Task_1", "Sub_1", "Task_2", "Flow_1"}
+        assert self.model.query(lane="Lane_Sales") == ["StartEvent_1", "Task_1"]
+        assert self.model.query("endEvent", lane="Lane_Ops") == ["EndEvent_1"]
+        task = self.model.describe("Task_1")
+        assert task["incoming"] == ["Flow_1"]
+        assert task["outgoing"] == ["Flow_2"]
+        assert task["lane"] == "Lane_Sales"
+        assert self.model.describe("Task_2")["parent"] == "Sub_1"
+        assert self.model.describe("Flow_2")["target"] == "EndEvent_1"
+        assert "Task_1_di" not in self.model.query()
+
+    def test_analysis_matches_full_parse(self):
+        expected = _analyze(XML)
+        del expected["graph"]
+        assert self.model.analysis() == expected
+        assert self.model.count("sequenceFlow") == 2
+
+    def test_invalid_xml(self):
+        model = DiagramModel.from_xml("<bpmn:definitions")
+        assert not model.valid
+        assert model.analysis()["error"]
+
+    def test_incremental_patch_matches_rebuild(self):
+        added = [{"id": "Task_3", "parent_id": "Process_1", "xml": '<bpmn:serviceTask id="Task_3"/>'},
+                 {"id": "Flow_3", "parent_id": "Process_1",
+                  "xml": '<bpmn:sequenceFlow id="Flow_3" sourceRef="Task_1" targetRef="Task_3"/>'}]
+        changed = [{"id": "Lane_Ops", "parent_id": None,
+                    "xml": '<bpmn:lane id="Lane_Ops"><bpmn:flowNodeRef>EndEvent_1</bpmn:flowNodeRef>'
+                           '<bpmn:flowNodeRef>Task_3</bpmn:flowNodeRef></bpmn:lane>'}]
+        removed = ["Sub_1", "Flow_2"]
+        patched_xml = apply_patch(XML, added, changed, removed)
+        self.model.apply_patch(added, changed, removed)
+        assert snapshot(self.model) == snapshot(DiagramModel.from_xml(patched_xml))
+        assert "Task_2" not in self.model.elements
+        assert self.model.describe("Task_3")["lane"] == "Lane_Ops"
+        assert self.model.describe("Task_1")["outgoing"] == ["Flow_3"]
+
+    def test_fingerprint_covers_shapes(self):
+        moved = DiagramModel.from_xml(XML.replace('x="100"', 'x="300"'))
+        assert self.model.changed(moved, ["Task_1", "StartEvent_1"]) == {"Task_1"}
+        renamed = DiagramModel.from_xml(XML.replace("Check order", "Verify order"))
+        assert self.model.changed(renamed, ["Task_1", "EndEvent_1"]) == {"Task_1"}
+
+    def test_affected_maps_shapes_and_removed_children(self):
+        assert self.model.affected(["Task_1_di"], ["Sub_1"]) == {"Task_1", "Sub_1", "Task_2"}
+
+
+class TestRoomModel:
+    def setup_method(self):
+        self.room = Room("model-room")
+        self.room.state.xml = XML
+
+    async def test_model_is_cached_and_patched_in_place(self):
+        model, revision = await self.room.model()
+        assert (await self.room.model())[0] is model
+        added = [{"id": "Task_3", "parent_id": "Process_1", "xml": '<bpmn:task id="Task_3"/>'}]
+        self.room.state.apply_patch(revision, added, [], [])
+        patched, new_revision = await self.room.model()
+        assert patched is model and new_revision == revision + 1
+        assert (await self.room.summary())["element_counts"]["task"] == 2
+        self.room.state.xml = XML
+        assert self.room.state.current_model() is None
+
+    async def test_full_update_cannot_change_foreign_locks(self):
+        self.room.state.lock_manager.acquire("Task_1", "alice")
+        revision, error = await self.room.commit_diagram(XML.replace("Check order", "Verify order"), "bob")
+        assert revision is None and "locked by alice" in error
+        revision, error = await self.room.commit_diagram(XML.replace('x="100"', 'x="300"'), "bob")
+        assert revision is None
+        # Other elements and the lock holder's own edits go through
+        revision, error = await self.room.commit_diagram(XML.replace('name="Orders"', 'name="Returns"'), "bob")
+        assert revision == self.room.state.revision and error is None
+        assert self.room.state.current_model() is not None
+        revision, _ = await self.room.commit_diagram(XML.replace("Check order", "Verify order"), "alice")
+        assert revision is not None
+
+    async def test_patch_lock_check_includes_shapes_and_descendants(self):
+        self.room.state.lock_manager.acquire("Task_1", "alice")
+        self.room.state.lock_manager.acquire("Task_2", "alice")
+        assert await self.room.locked_by_others("bob", ["Task_1_di"], []) == {"Task_1": "alice"}
+        assert await self.room.locked_by_others("bob", [], ["Sub_1"]) == {"Task_2": "alice"}
+        assert await self.room.locked_by_others("alice", ["Task_1"], ["Sub_1"]) == {}
+        assert await self.room.locked_by_others("bob", ["EndEvent_1"], []) == {}
@@ -0,0 +1,79 @@
+import xml.etree.ElementTree as ET
+import pytest
+from app.services.diagram_patch import apply_patch, PatchError
+from app.services.diagram_state import DiagramState
+
+BASE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" id="Definitions_1">
+  <bpmn:process id="Process_1">
+    <bpmn:startEvent id="StartEvent_1"/>
+    <bpmn:task id="Task_1" name="Old"/>
+  </bpmn:process>
+</bpmn:definitions>"""
+
+
+class TestApplyPatch:
+    def test_add_element(self):
+        xml = apply_patch(BASE_XML, [{"id": "Task_2", "parent_id": "Process_1", "xml": '<bpmn:task id="Task_2"/>'}], [], [])
+        assert 'id="Task_2"' in xml
+        assert "bpmn:task" in xml
+
+    def test_change_element(self):
+        xml = apply_patch(BASE_XML, [], [{"id": "Task_1", "xml": '<bpmn:task id="Task_1" name="New"/>'}], [])
+        assert 'name="New"' in xml
+        assert 'name="Old"' not in xml
+
+    def test_remove_element(self):
+        xml = apply_patch(BASE_XML, [], [], ["Task_1"])
+        assert "Task_1" not in xml
+        assert "StartEvent_1" in xml
+
+    def test_unknown_element_raises(self):
+        with pytest.raises(PatchError):
+            apply_patch(BASE_XML, [], [{"id": "Missing", "xml": '<bpmn:task id="Missing"/>'}], [])
+
+    def test_duplicate_add_raises(self):
+        with pytest.raises(PatchError):
+            apply_patch(BASE_XML, [{"id": "Task_1", "parent_id": "Process_1", "xml": '<bpmn:task id="Task_1"/>'}], [], [])
+
+    def test_fragment_id_must_match(self):
+        with pytest.raises(PatchError):
+            apply_patch(BASE_XML, [], [{"id": "Task_1", "xml": '<bpmn:task id="StartEvent_1"/>'}], [])
+        with pytest.raises(PatchError):
+            apply_patch(BASE_XML, [{"id": "Task_2", "parent_id": "Process_1", "xml": '<bpmn:task/>'}], [], [])
+
+    def test_document_prefixes_are_kept_per_call(self):
+        custom = BASE_XML.replace("bpmn:", "model:").replace("xmlns:bpmn", "xmlns:model").replace(
+            'id="Definitions_1"', 'xmlns:ext="urn:ext" id="Definitions_1"').replace(
+            '<model:task id="Task_1" name="Old"/>', '<model:task id="Task_1" name="Old" ext:owner="a"/>')
+        xml = apply_patch(custom, [{"id": "Task_2", "parent_id": "Process_1", "xml": '<model:task id="Task_2"/>'}], [], [])
+        assert '<model:task id="Task_2" />' in xml and 'ext:owner="a"' in xml
+        assert 'xmlns:model="http://www.omg.org/spec/BPMN/20100524/MODEL"' in xml
+        # Other documents are not affected by this one's prefixes
+        assert "<bpmn:task" in apply_patch(BASE_XML, [], [], ["StartEvent_1"])
+        assert "urn:ext" not in ET._namespace_map
+
+    def test_output_reparses_to_the_same_tree(self):
+        xml = apply_patch(BASE_XML, [], [{"id": "Task_1", "xml": '<bpmn:task id="Task_1" name="New"/>'}], [])
+        root = ET.fromstring(xml.split("\n", 1)[1])
+        assert root.tag == "{http://www.omg.org/spec/BPMN/20100524/MODEL}definitions"
+        assert root.find(".//{http://www.omg.org/spec/BPMN/20100524/MODEL}task").get("name") == "New"
+
+
+class TestDiagramStatePatch:
+    def setup_method(self):
+        self.state = DiagramState()
+        self.state.xml = BASE_XML
+
+    def test_patch_increments_revision(self):
+        base = self.state.revision
+        revision = self.state.apply_patch(base, [], [], ["Task_1"])
+        assert revision == base + 1
+        assert self.state.revision == revision
+        assert "Task_1" not in self.state.xml
+
+    def test_stale_patch_rejected(self):
+        base = self.state.revision
+        self.state.xml = BASE_XML
+        assert self.state.apply_patch(base, [], [], ["Task_1"]) is None
+        assert "Task_1" in self.state.xml
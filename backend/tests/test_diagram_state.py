@@ -35,8 +35,15 @@ class TestDiagramState:
         self.state.save_version()
         versions = self.state.versions
         assert len(versions) == 1
-        assert versions[0]["xml"] == "<test>xml</test>"
+        assert "xml" not in versions[0]
         assert "timestamp" in versions[0]
+        assert self.state.get_version(versions[0]["version"])["xml"] == "<test>xml</test>"
+
+    def test_save_version_dedup(self):
+        self.state.xml = "<test>xml</test>"
+        self.state.save_version()
+        assert self.state.save_version() is None
+        assert len(self.state.versions) == 1
 
     def test_add_chat_message(self):
         message = self.state.add_chat_message("alice", "Hello!")
@@ -45,3 +52,26 @@ class TestDiagramState:
         assert "timestamp" in message
         assert len(self.state.chat) == 1
 
+
+    def test_initial_state_is_cached_until_mutation(self):
+        first = self.state.initial_state()
+        assert self.state.initial_state() is first
+        self.state.add_chat_message("alice", "Hello!")
+        second = self.state.initial_state()
+        assert second is not first
+        assert second["chat"][0]["message"] == "Hello!"
+        self.state.lock_element("Task_1", "alice")
+        third = self.state.initial_state()
+        assert third is not second
+        assert third["locks"]["locks"] == {"Task_1": "alice"}
+        assert third["revision"] == self.state.revision
+
+    def test_chat_after_is_incremental(self):
+        state = DiagramState(chat_capacity=3)
+        for i in range(5):
+            state.add_chat_message("alice", f"message {i}")
+        page = state.chat_after(3)
+        assert [entry["message"] for entry in page["entries"]] == ["message 3", "message 4"]
+        assert page["first_seq"] == 3
+        assert page["last_seq"] == 5
+        assert len(state.chat) == 3
@@ -0,0 +1,66 @@
+import pytest
+from app.services.diagram_summary import analyze_bpmn_diagram, analysis_cache, AnalysisCache
+from app.services.room_manager import Room
+
+XML = """<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">
+  <bpmn:collaboration id="Collab_1"><bpmn:messageFlow id="Msg_1"/></bpmn:collaboration>
+  <bpmn:process id="Process_1" name="Order">
+    <bpmn:startEvent id="Start_1"/>
+    <bpmn:userTask id="Task_1"/>
+    <bpmn:subProcess id="Sub_1"><bpmn:task id="Task_2"/></bpmn:subProcess>
+    <bpmn:exclusiveGateway id="Gateway_1"/>
+    <bpmn:endEvent id="End_1"/>
+    <bpmn:sequenceFlow id="Flow_1"/>
+    <bpmn:sequenceFlow id="Flow_2"/>
+  </bpmn:process>
+</bpmn:definitions>"""
+
+
+class TestAnalyzeBpmnDiagram:
+    def setup_method(self):
+        analysis_cache.clear()
+
+    def test_counts(self):
+        result = analyze_bpmn_diagram(XML)
+        assert result["process_count"] == 1
+        assert result["element_counts"] == {
+            "startEvent": 1, "userTask": 1, "task": 1, "exclusiveGateway": 1, "endEvent": 1
+        }
+        assert result["flow_count"] == 2
+        assert result["message_flow_count"] == 1
+        assert result["total_elements"] == 5
+        assert "'Order'" in result["summary"]
+
+    def test_result_is_cached_by_content(self):
+        analyze_bpmn_diagram(XML)
+        analyze_bpmn_diagram(XML)
+        assert len(analysis_cache) == 1
+
+    def test_invalid_xml(self):
+        result = analyze_bpmn_diagram("<broken")
+        assert result["error"] is True
+
+
+class TestAnalysisCache:
+    def test_lru_eviction(self):
+        cache = AnalysisCache(maxsize=2)
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+        cache.get("a")
+        cache.put("c", {"n": 3})
+        assert cache.get("b") is None
+        assert cache.get("a") == {"n": 1}
+
+
+class TestRoomSummary:
+    async def test_summary_follows_revision(self):
+        room = Room("room-1")
+        room.state.xml = XML
+        first = await room.summary()
+        assert first["revision"] == room.state.revision
+        assert first["process_count"] == 1
+
+        room.state.xml = "<bpmn:definitions xmlns:bpmn='http://www.omg.org/spec/BPMN/20100524/MODEL'/>"
+        second = await room.summary()
+        assert second["revision"] == first["revision"] + 1
+        assert second["process_count"] == 0
@@ -0,0 +1,58 @@
+from app.services.history import HistoryBuffer, LogEntry, ChatEntry
+
+
+class TestHistoryBuffer:
+    def setup_method(self):
+        self.buffer = HistoryBuffer(ChatEntry, capacity=5)
+
+    def fill(self, count):
+        for i in range(count):
+            self.buffer.append("alice", f"message {i}")
+
+    def test_sequence_numbers_are_contiguous(self):
+        self.fill(3)
+        assert [entry.seq for entry in self.buffer.after(0)] == [1, 2, 3]
+        assert self.buffer.last_seq == 3
+
+    def test_capacity_evicts_oldest(self):
+        self.fill(8)
+        assert len(self.buffer) == 5
+        assert self.buffer.first_seq == 4
+        assert [entry.message for entry in self.buffer.after(0)] == [f"message {i}" for i in range(3, 8)]
+
+    def test_after_cursor_and_limit(self):
+        self.fill(8)
+        assert [entry.seq for entry in self.buffer.after(6)] == [7, 8]
+        assert [entry.seq for entry in self.buffer.after(4, limit=2)] == [5, 6]
+        assert [entry.seq for entry in self.buffer.after(1, limit=2)] == [4, 5]
+        assert self.buffer.after(8) == []
+        assert self.buffer.after(100) == []
+
+    def test_tail_and_head_reads_agree(self):
+        self.fill(5)
+        for seq in range(6):
+            for limit in (None, 0, 1, 3):
+                expected = [entry for entry in self.buffer.after(0) if entry.seq > seq]
+                if limit is not None:
+                    expected = expected[:limit]
+                assert self.buffer.after(seq, limit) == expected
+
+    def test_export_restore_keeps_sequence(self):
+        self.fill(7)
+        restored = HistoryBuffer(ChatEntry, capacity=5)
+        restored.restore(self.buffer.export())
+        assert restored.after(0) == self.buffer.after(0)
+        assert restored.append("bob", "next").seq == 8
+
+    def test_load_numbers_legacy_entries(self):
+        logs = HistoryBuffer(LogEntry, capacity=10)
+        logs.restore([{"timestamp": "t1", "message": "a"}, {"timestamp": "t2", "message": "b"}])
+        assert [(entry.seq, entry.message) for entry in logs.after(0)] == [(1, "a"), (2, "b")]
+
+    def test_resize_and_clear(self):
+        self.fill(5)
+        self.buffer.resize(2)
+        assert [entry.seq for entry in self.buffer.after(0)] == [4, 5]
+        self.buffer.clear()
+        assert self.buffer.after(0) == []
+        assert self.buffer.append("bob", "after clear").seq == 6
@@ -0,0 +1,71 @@
+import pytest
+from app.services.lock_manager import LockManager
+
+
+class TestLockManager:
+    def setup_method(self):
+        self.locks = LockManager(lease_seconds=10)
+
+    def test_acquire_emits_delta_with_epoch(self):
+        granted, delta = self.locks.acquire("Task_1", "alice", now=0)
+        assert granted
+        assert delta == {"epoch": 1, "changes": [{"element_id": "Task_1", "locked_by": "alice"}]}
+        assert self.locks.locks == {"Task_1": "alice"}
+
+    def test_conflicting_acquire_is_rejected(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        granted, delta = self.locks.acquire("Task_1", "bob", now=1)
+        assert not granted
+        assert delta is None
+        assert self.locks.holder("Task_1", now=1) == "alice"
+
+    def test_reacquire_renews_without_delta(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        granted, delta = self.locks.acquire("Task_1", "alice", now=5)
+        assert granted
+        assert delta is None
+        assert self.locks.epoch == 1
+        assert self.locks.expire(now=12) is None
+
+    def test_release_only_by_holder(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        assert self.locks.release("Task_1", "bob", now=1) is None
+        delta = self.locks.release("Task_1", "alice", now=1)
+        assert delta["changes"] == [{"element_id": "Task_1", "locked_by": None}]
+        assert self.locks.locks == {}
+
+    def test_release_user_uses_index(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        self.locks.acquire("Task_2", "alice", now=0)
+        self.locks.acquire("Task_3", "bob", now=0)
+        delta = self.locks.release_user("alice")
+        assert sorted(c["element_id"] for c in delta["changes"]) == ["Task_1", "Task_2"]
+        assert self.locks.locks == {"Task_3": "bob"}
+        assert self.locks.elements_of("alice") == set()
+
+    def test_epoch_is_monotonic(self):
+        epochs = []
+        for element_id in ("a", "b", "c"):
+            epochs.append(self.locks.acquire(element_id, "alice", now=0)[1]["epoch"])
+        epochs.append(self.locks.release("b")["epoch"])
+        assert epochs == [1, 2, 3, 4]
+
+    def test_leases_expire(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        self.locks.acquire("Task_2", "bob", now=5)
+        delta = self.locks.expire(now=11)
+        assert delta["changes"] == [{"element_id": "Task_1", "locked_by": None}]
+        assert self.locks.locks == {"Task_2": "bob"}
+
+    def test_renew_extends_leases(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        assert self.locks.renew("alice", now=9) == 1
+        assert self.locks.expire(now=11) is None
+        assert self.locks.expire(now=20)["changes"][0]["element_id"] == "Task_1"
+
+    def test_expired_lock_can_be_taken(self):
+        self.locks.acquire("Task_1", "alice", now=0)
+        granted, delta = self.locks.acquire("Task_1", "bob", now=11)
+        assert granted
+        assert self.locks.elements_of("alice") == set()
+        assert self.locks.locks == {"Task_1": "bob"}
@@ -0,0 +1,82 @@
+import pytest
+import socketio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.metrics import Metrics, metrics
+from app.services.lock_manager import LockManager
+
+
+class TestMetricsRegistry:
+    def setup_method(self):
+        self.metrics = Metrics(enabled=True)
+
+    def test_counter_and_gauge_render(self):
+        self.metrics.events.inc("update_diagram")
+        self.metrics.events.inc("update_diagram")
+        self.metrics.gauge("bpmn_test_rooms", "Rooms", collect=lambda: 3)
+        text = self.metrics.render()
+        assert "# TYPE bpmn_events_total counter" in text
+        assert 'bpmn_events_total{event="update_diagram"} 2' in text
+        assert "bpmn_test_rooms 3" in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.0004, 0.003, 0.003, 20):
+            self.metrics.event_duration.observe(value, "ping")
+        text = self.metrics.render()
+        assert 'bpmn_event_duration_seconds_bucket{event="ping",le="0.0005"} 1' in text
+        assert 'bpmn_event_duration_seconds_bucket{event="ping",le="0.005"} 3' in text
+        assert 'bpmn_event_duration_seconds_bucket{event="ping",le="10.0"} 3' in text
+        assert 'bpmn_event_duration_seconds_bucket{event="ping",le="+Inf"} 4' in text
+        assert 'bpmn_event_duration_seconds_count{event="ping"} 4' in text
+
+    async def test_instrumented_handlers_and_emits(self):
+        sio = socketio.AsyncServer(async_mode="asgi")
+        sent = []
+
+        async def send(eio_sid, pkt):
+            sent.append(pkt)
+        sio._send_eio_packet = send
+
+        @sio.event
+        async def disconnect(sid):
+            return sid
+
+        @sio.event
+        async def broken(sid, data):
+            raise ValueError("boom")
+
+        self.metrics.instrument(sio)
+        # python-socketio passes a reason to disconnect; the legacy one-argument handler still works
+        assert await sio.handlers["/"]["disconnect"]("abc", "client disconnect") == "abc"
+        with pytest.raises(ValueError):
+            await sio.handlers["/"]["broken"]("abc", {})
+
+        await sio.manager.connect("eio-1", "/")
+        await sio.emit("diagram_update", {"revision": 3})
+        assert len(sent) == 1
+
+        assert self.metrics.events.values == {("disconnect",): 1, ("broken",): 1}
+        assert self.metrics.event_errors.values == {("broken",): 1}
+        assert self.metrics.emitted_messages.values == {("diagram_update",): 1}
+        assert self.metrics.emitted_bytes.values[("diagram_update",)] == len(sent[0].data)
+
+    def test_lock_conflicts_counted_when_enabled(self, monkeypatch):
+        monkeypatch.setattr(metrics, "enabled", True)
+        before = metrics.lock_conflicts.values.get((), 0)
+        locks = LockManager()
+        locks.acquire("Task_1", "alice")
+        locks.acquire("Task_1", "bob")
+        assert metrics.lock_conflicts.values[()] == before + 1
+
+
+class TestMetricsEndpoint:
+    def test_disabled_by_default(self):
+        assert TestClient(app).get("/metrics").status_code == 404
+
+    def test_prometheus_text(self, monkeypatch):
+        monkeypatch.setattr(metrics, "enabled", True)
+        response = TestClient(app).get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "bpmn_rooms " in response.text
+        assert "bpmn_version_store_bytes " in response.text
@@ -0,0 +1,146 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.services.outbound import OutboundQueues, packet_event
+
+
+def packet(event: str, body: str = "{}"):
+    return SimpleNamespace(data=f'2["{event}",{body}]')
+
+
+class FakeSocket:
+    def __init__(self):
+        self.backlog = 0
+        self.queue = SimpleNamespace(qsize=lambda: self.backlog)
+
+
+class FakeServer:
+    def __init__(self):
+        self.sent = []
+        self.disconnected = []
+        self.socket = FakeSocket()
+        self.eio = SimpleNamespace(sockets={"eio-1": self.socket}, disconnect=self._disconnect)
+
+    async def _send_eio_packet(self, eio_sid, pkt):
+        self.sent.append(packet_event(pkt.data))
+
+    async def _disconnect(self, eio_sid):
+        self.disconnected.append(eio_sid)
+        self.eio.sockets.pop(eio_sid, None)
+
+
+class TestOutboundQueues:
+    def setup_method(self):
+        self.server = FakeServer()
+        self.resyncs = []
+        self.queues = OutboundQueues(max_messages=4, max_bytes=0, congestion=2, poll_ms=1)
+        self.queues.on_overflow = self._resync
+        self.queues.install(self.server)
+
+    async def _resync(self, eio_sid):
+        self.resyncs.append(eio_sid)
+        await self.server._send_eio_packet(eio_sid, packet("initial_state"))
+
+    async def settle(self):
+        for _ in range(20):
+            await asyncio.sleep(0.002)
+
+    def test_packet_event(self):
+        assert packet_event('2["diagram_update",{"revision":1}]') == "diagram_update"
+        assert packet_event('212["ping",{}]') == "ping"
+        assert packet_event(b"\x00") == "other"
+
+    async def test_healthy_connection_is_sent_to_directly(self):
+        await self.server._send_eio_packet("eio-1", packet("receive_chat"))
+        assert self.server.sent == ["receive_chat"]
+        assert self.queues.queues == {}
+
+    async def test_congested_connection_coalesces_and_prioritizes(self):
+        self.server.socket.backlog = 5
+        for event in ("cursor_batch", "diagram_update", "cursor_batch", "diagram_update"):
+            await self.server._send_eio_packet("eio-1", packet(event))
+        assert self.server.sent == []
+        assert self.queues.queues["eio-1"].count == 2
+        assert self.queues.coalesced == {"diagram_update": 1, "cursor_batch": 1}
+
+        self.server.socket.backlog = 0
+        await self.settle()
+        # Document state goes out before presence
+        assert self.server.sent == ["diagram_update", "cursor_batch"]
+        assert self.queues.queues == {}
+
+    async def test_presence_deltas_merge_per_user(self):
+        self.server.socket.backlog = 5
+        payloads = []
+        self.queues._send = lambda eio_sid, pkt: payloads.append(json.loads(pkt.data[1:])) or asyncio.sleep(0)
+        await self.server._send_eio_packet("eio-1", packet("cursor_batch", '{"cursors":[{"username":"a","x":1,"y":1},{"username":"b","x":2,"y":2}],"editing":[{"username":"a","element_id":"Task_1"}]}'))
+        await self.server._send_eio_packet("eio-1", packet("cursor_batch", '{"cursors":[{"username":"a","x":5,"y":5}],"editing":[]}'))
+        self.server.socket.backlog = 0
+        await self.settle()
+        # b's cursor and a's editing target survive a newer delta that does not mention them
+        assert payloads == [["cursor_batch", {
+            "cursors": [{"username": "a", "x": 5, "y": 5}, {"username": "b", "x": 2, "y": 2}],
+            "editing": [{"username": "a", "element_id": "Task_1"}]}]]
+
+    async def test_shed_presence_is_resent_in_full_after_catching_up(self):
+        lost = []
+
+        async def resend(eio_sid):
+            lost.append(eio_sid)
+
+        self.queues.on_presence_lost = resend
+        self.server.socket.backlog = 5
+        await self.server._send_eio_packet("eio-1", packet("cursor_batch"))
+        for i in range(4):
+            await self.server._send_eio_packet("eio-1", packet("receive_chat", f'{{"seq":{i}}}'))
+        assert self.queues.dropped == {"cursor_batch": 1}
+        assert lost == []
+        self.server.socket.backlog = 0
+        await self.settle()
+        assert lost == ["eio-1"]
+
+    async def test_overflow_sheds_presence_then_resyncs_then_disconnects(self):
+        self.server.socket.backlog = 5
+        for i in range(3):
+            await self.server._send_eio_packet("eio-1", packet("receive_chat", f'{{"seq":{i}}}'))
+        await self.server._send_eio_packet("eio-1", packet("cursor_batch"))
+        await self.server._send_eio_packet("eio-1", packet("activity_log_batch"))
+        # Presence is dropped first and that is enough
+        assert self.queues.dropped == {"cursor_batch": 1}
+        assert self.resyncs == []
+
+        for i in range(2):
+            await self.server._send_eio_packet("eio-1", packet("receive_chat", f'{{"seq":{3 + i}}}'))
+        await self.settle()
+        assert self.queues.dropped["activity_log_batch"] == 1
+        assert self.queues.dropped["receive_chat"] == 5
+        assert self.resyncs == ["eio-1"]
+        assert self.queues.resyncs == 1
+
+        # The snapshot has not been delivered yet, so the next overflow disconnects
+        for i in range(5):
+            await self.server._send_eio_packet("eio-1", packet("receive_chat", f'{{"seq":{5 + i}}}'))
+        await self.settle()
+        assert self.server.disconnected == ["eio-1"]
+        assert self.queues.disconnects == 1
+        assert self.queues.queues == {}
+
+    async def test_resync_snapshot_delivered_clears_pending(self):
+        self.server.socket.backlog = 5
+        for i in range(5):
+            await self.server._send_eio_packet("eio-1", packet("receive_chat", f'{{"seq":{i}}}'))
+        await self.settle()
+        assert self.queues.queues["eio-1"].resync_pending
+        self.server.socket.backlog = 0
+        await self.settle()
+        assert self.server.sent == ["initial_state"]
+        assert self.queues.queues == {}
+        assert self.server.disconnected == []
+
+    async def test_closed_socket_stops_draining(self):
+        self.server.socket.backlog = 5
+        await self.server._send_eio_packet("eio-1", packet("diagram_update"))
+        del self.server.eio.sockets["eio-1"]
+        await self.settle()
+        assert self.queues.queues == {}
+        assert self.server.sent == []
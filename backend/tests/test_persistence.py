@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from app.services.diagram_state import DiagramState
+from app.services.persistence import PersistenceManager
+from app.services.room_manager import RoomManager
+from app.services.storage import MemoryStorage, SQLiteStorage, StorageBackend
+
+
+def mutate(state):
+    state.xml = "<bpmn:definitions><bpmn:process id='P1'/></bpmn:definitions>"
+    state.save_version("alice")
+    state.xml = "<bpmn:definitions><bpmn:process id='P2'/></bpmn:definitions>"
+    state.save_version("bob")
+    state.add_chat_message("alice", "hello")
+    state.add_log("alice updated diagram")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "state.db"))
+        yield backend
+        backend.close()
+    else:
+        yield MemoryStorage()
+
+
+class TestPersistenceManager:
+    def test_backend_must_implement_every_operation(self):
+        class LoadOnly(StorageBackend):
+            def load(self, room_id):
+                return None, []
+
+        with pytest.raises(TypeError):
+            LoadOnly()
+
+    async def test_ops_roundtrip(self, storage):
+        manager = PersistenceManager(storage, flush_interval_ms=10, snapshot_every=1000)
+        state = DiagramState()
+        await manager.hydrate("room-1", state)
+        mutate(state)
+        await manager.flush()
+
+        restored = DiagramState()
+        await PersistenceManager(storage).hydrate("room-1", restored)
+        assert restored.xml == state.xml
+        assert restored.revision == state.revision
+        assert restored.chat == state.chat
+        assert restored.logs == state.logs
+        assert [v["author"] for v in restored.versions] == ["bob", "alice"]
+        assert restored.get_version(1)["xml"] == "<bpmn:definitions><bpmn:process id='P1'/></bpmn:definitions>"
+
+    async def test_snapshot_compacts_log(self, storage):
+        manager = PersistenceManager(storage, snapshot_every=3)
+        state = DiagramState()
+        await manager.hydrate("room-1", state)
+        mutate(state)
+        await manager.flush()
+
+        snapshot, ops = storage.load("room-1")
+        assert snapshot is not None
+        assert ops == []
+
+        state.add_chat_message("bob", "after snapshot")
+        await manager.flush()
+        restored = DiagramState()
+        await PersistenceManager(storage).hydrate("room-1", restored)
+        assert restored.chat[-1]["message"] == "after snapshot"
+        assert restored.versions == state.versions
+
+    async def test_flush_does_not_touch_unchanged_rooms(self, storage):
+        manager = PersistenceManager(storage)
+        state = DiagramState()
+        await manager.hydrate("room-1", state)
+        await manager.flush(snapshot=True)
+        assert storage.room_ids() == []
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def write_snapshot(self, room_id, seq, snapshot):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        super().write_snapshot(room_id, seq, snapshot)
+
+
+class TestUnload:
+    async def test_failed_final_write_is_retried(self):
+        storage = FlakyStorage(failures=2)
+        manager = PersistenceManager(storage, flush_interval_ms=1)
+        state = DiagramState()
+        await manager.hydrate("room-1", state)
+        mutate(state)
+        task = manager.unload("room-1")
+        # Still registered while the write keeps failing
+        await asyncio.sleep(0)
+        assert "room-1" in manager.journals
+
+        restored = DiagramState()
+        await manager.hydrate("room-1", restored)
+        assert task.done() and storage.failures == 0
+        assert restored.xml == state.xml
+        assert restored.chat == state.chat
+        assert manager.journals["room-1"].state is restored
+
+
+class TestRoomRehydration:
+    async def test_room_survives_unload(self):
+        storage = MemoryStorage()
+        manager = RoomManager(PersistenceManager(storage))
+        room = await manager.open("diagram-a")
+        manager.join("sid1", "diagram-a", "alice")
+        room.state.xml = "<saved/>"
+        room.state.add_chat_message("alice", "persist me")
+
+        manager.leave("sid1")
+        manager.remove_room("diagram-a")
+        assert manager.get("diagram-a") is None
+
+        reopened = await manager.open("diagram-a")
+        assert reopened is not room
+        assert reopened.state.xml == "<saved/>"
+        assert reopened.state.chat[0]["message"] == "persist me"
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from app.services.presence import PresenceAggregator, Debouncer
+
+
+class TestPresenceAggregator:
+    def setup_method(self):
+        self.presence = PresenceAggregator(tick_hz=100)
+
+    def test_keeps_latest_position_only(self):
+        self.presence.update_cursor("alice", 1, 1)
+        self.presence.update_cursor("alice", 5, 6)
+        batch = self.presence.drain()
+        assert batch["cursors"] == [{"username": "alice", "x": 5, "y": 6}]
+
+    def test_unmoved_cursors_are_dropped(self):
+        self.presence.update_cursor("alice", 5, 6)
+        self.presence.drain()
+        self.presence.update_cursor("alice", 5, 6)
+        assert self.presence.drain() is None
+
+    def test_editing_is_coalesced(self):
+        self.presence.update_editing("bob", "Task_1")
+        self.presence.update_editing("bob", "Task_2")
+        batch = self.presence.drain()
+        assert batch["editing"] == [{"username": "bob", "element_id": "Task_2"}]
+        self.presence.update_editing("bob", None)
+        assert self.presence.drain()["editing"] == [{"username": "bob", "element_id": None}]
+
+    def test_snapshot_covers_everything_flushed(self):
+        self.presence.update_cursor("alice", 1, 2)
+        self.presence.update_editing("bob", "Task_1")
+        self.presence.drain()
+        self.presence.update_cursor("carol", 3, 4)
+        self.presence.drain()
+        assert self.presence.snapshot() == {
+            "cursors": [{"username": "alice", "x": 1, "y": 2}, {"username": "carol", "x": 3, "y": 4}],
+            "editing": [{"username": "bob", "element_id": "Task_1"}],
+        }
+
+    async def test_flushes_one_batch_per_tick(self):
+        batches = []
+
+        async def on_flush(batch):
+            batches.append(batch)
+
+        self.presence.attach(on_flush)
+        for i in range(50):
+            self.presence.update_cursor("alice", i, i)
+            self.presence.update_cursor("bob", -i, -i)
+        await asyncio.sleep(0.05)
+        assert len(batches) == 1
+        assert {c["username"]: c["x"] for c in batches[0]["cursors"]} == {"alice": 49, "bob": -49}
+        self.presence.close()
+
+
+class TestDebouncer:
+    async def test_burst_fires_once(self):
+        calls = []
+
+        async def callback():
+            calls.append(1)
+
+        debouncer = Debouncer(delay_ms=10)
+        debouncer.attach(callback)
+        for _ in range(500):
+            debouncer.trigger()
+        await asyncio.sleep(0.05)
+        assert calls == [1]
+        debouncer.trigger()
+        await asyncio.sleep(0.05)
+        assert calls == [1, 1]
+        debouncer.close()
+
+    def test_trigger_without_callback_is_noop(self):
+        Debouncer(delay_ms=10).trigger()
@@ -0,0 +1,54 @@
+import pytest
+from app.services.room_manager import RoomManager
+from app.utils import broadcast_cache
+
+
+class TestRoomManager:
+    def setup_method(self):
+        self.manager = RoomManager()
+
+    def test_join_creates_room(self):
+        room = self.manager.join("sid1", "diagram-a", "shweta")
+        assert room.room_id == "diagram-a"
+        assert self.manager.get("diagram-a") is room
+        assert self.manager.get_room("sid1") is room
+        assert room.users.list_users() == ["shweta"]
+
+    def test_rooms_have_independent_state(self):
+        room_a = self.manager.join("sid1", "diagram-a", "shweta")
+        room_b = self.manager.join("sid2", "diagram-b", "mohit")
+        room_a.state.xml = "<a/>"
+        room_a.state.lock_element("Task_1", "shweta")
+
+        assert room_b.state.xml != "<a/>"
+        assert room_b.state.locks == {}
+        assert room_b.users.list_users() == ["mohit"]
+
+    def test_leave(self):
+        self.manager.join("sid1", "diagram-a", "shweta")
+        room, username = self.manager.leave("sid1")
+        assert username == "shweta"
+        assert room.is_empty()
+        assert self.manager.get_room("sid1") is None
+
+    def test_leave_unknown_sid(self):
+        room, username = self.manager.leave("unknown-sid")
+        assert room is None
+        assert username.startswith("User-")
+
+    def test_rejoin_moves_sid(self):
+        room_a = self.manager.join("sid1", "diagram-a", "shweta")
+        room_b = self.manager.join("sid1", "diagram-b", "shweta")
+        assert room_a.is_empty()
+        assert self.manager.get_room("sid1") is room_b
+
+    def test_remove_room(self):
+        self.manager.join("sid1", "diagram-a", "shweta")
+        self.manager.remove_room("diagram-a")
+        assert self.manager.get("diagram-a") is None
+
+    def test_remove_room_discards_cached_broadcasts(self):
+        self.manager.join("sid1", "diagram-cached", "shweta")
+        broadcast_cache.encode("diagram-cached", "diagram_update", 1, lambda: {"xml": "<old/>"})
+        self.manager.remove_room("diagram-cached")
+        assert broadcast_cache.encode("diagram-cached", "diagram_update", 1, lambda: {"xml": "<new/>"}).value == {"xml": "<new/>"}
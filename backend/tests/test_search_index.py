@@ -0,0 +1,173 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.persistence import PersistenceManager
+from app.services.room_manager import Room, RoomManager, room_manager
+from app.services.search_index import SearchIndex, tokenize
+from app.services.storage import MemoryStorage
+
+XML = """<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">
+  <bpmn:process id="Process_1" name="Order handling">
+    <bpmn:startEvent id="StartEvent_1" name="Order received"/>
+    <bpmn:userTask id="Activity_Review" name="Review invoice"/>
+    <bpmn:task id="Activity_Ship" name="Ship order"/>
+  </bpmn:process>
+</bpmn:definitions>"""
+
+
+def ids(page):
+    return [result.get("id", result.get("seq")) for result in page["results"]]
+
+
+class TestSearchIndex:
+    def setup_method(self):
+        self.index = SearchIndex(refresh_ms=0)
+        self.room = Room("search-a")
+        self.room.state.commit(XML)
+        self.index.attach(self.room)
+
+    def test_tokenize(self):
+        assert tokenize("Review INVOICE_2, naïve!") == ["review", "invoice", "2", "naïve"]
+
+    async def test_elements_by_name_and_id(self):
+        page = await self.index.search("invoice")
+        assert page["results"] == [{"kind": "element", "room": "search-a", "id": "Activity_Review",
+                                    "type": "userTask", "name": "Review invoice"}]
+        assert ids(await self.index.search("activity_sh")) == ["Activity_Ship"]
+
+    async def test_prefix_and_token_matching(self):
+        assert set(ids(await self.index.search("ord"))) == {"Process_1", "StartEvent_1", "Activity_Ship"}
+        assert ids(await self.index.search("ord", prefix=False)) == []
+        # Earlier terms are whole tokens, the last one a prefix
+        assert ids(await self.index.search("order rec")) == ["StartEvent_1"]
+        assert ids(await self.index.search("or received")) == []
+
+    async def test_chat_and_activity_are_indexed_as_appended(self):
+        self.room.state.add_chat_message("alice", "Who owns the invoice review?")
+        self.room.state.add_log("alice updated diagram ×3")
+        assert ids(await self.index.search("invoice", kind="chat")) == [1]
+        page = await self.index.search("alice")
+        assert [result["kind"] for result in page["results"]] == ["activity", "chat"]
+        assert page["results"][1]["message"] == "Who owns the invoice review?"
+
+    async def test_diagram_changes_update_elements(self):
+        await self.index.search("ship")
+        self.room.state.commit(XML.replace("Ship order", "Dispatch order").replace('<bpmn:startEvent id="StartEvent_1" name="Order received"/>', ""))
+        page = await self.index.search("dispatch")
+        assert [result["name"] for result in page["results"]] == ["Dispatch order"]
+        # Still found by its id
+        assert ids(await self.index.search("ship")) == ["Activity_Ship"]
+        assert ids(await self.index.search("received")) == []
+
+    async def test_pagination_and_ranking(self):
+        for i in range(5):
+            self.room.state.add_chat_message("bob", f"release {i}")
+        self.room.state.add_chat_message("bob", "rel")
+        page = await self.index.search("rel", offset=1, limit=2)
+        assert page["total"] == 6
+        # The whole-token match comes first, then newest first
+        assert ids(page) == [5, 4]
+
+    async def test_room_filter_and_detach(self):
+        other = Room("search-b")
+        other.state.commit(XML)
+        self.index.attach(other)
+        assert len((await self.index.search("invoice"))["results"]) == 2
+        assert [result["room"] for result in (await self.index.search("invoice", room="search-b"))["results"]] == ["search-b"]
+        self.index.detach("search-b")
+        other.state.add_chat_message("carol", "invoice")
+        assert [result["room"] for result in (await self.index.search("invoice"))["results"]] == ["search-a"]
+
+    async def test_memory_bound_evicts_oldest(self):
+        index = SearchIndex(max_documents=3, refresh_ms=0)
+        room = Room("search-bound")
+        index.attach(room)
+        for i in range(5):
+            room.state.add_chat_message("dave", f"note {i}")
+        assert len(index) == 3 and index.evicted == 2
+        assert ids(await index.search("note")) == [5, 4, 3]
+
+    async def test_evicted_elements_are_indexed_again(self):
+        index = SearchIndex(max_documents=3, refresh_ms=0)
+        room = Room("search-evict")
+        room.state.commit(XML)
+        index.attach(room)
+        await index.search("order")
+        for i in range(3):
+            room.state.add_chat_message("dave", f"note {i}")
+        assert ids(await index.search("invoice")) == []
+        room.state.commit(XML.replace("Ship order", "Ship parcel"))
+        # Unchanged elements come back once the diagram is re-read
+        assert ids(await index.search("invoice")) == ["Activity_Review"]
+
+    async def test_history_evicted_by_the_room_is_dropped(self):
+        room = Room("search-ring")
+        room.state.resize_history(chat_capacity=2)
+        self.index.attach(room)
+        for i in range(4):
+            room.state.add_chat_message("erin", f"memo {i}")
+        assert ids(await self.index.search("memo")) == [4, 3]
+        assert len([doc for doc in self.index._docs.values() if doc.room == "search-ring"]) == 2
+
+
+class TestPersistedRooms:
+    def setup_method(self):
+        self.storage = MemoryStorage()
+        self.index = SearchIndex(refresh_ms=0)
+        self.manager = RoomManager(PersistenceManager(self.storage), self.index)
+
+    async def close(self, room_id):
+        self.manager.remove_room(room_id)
+        for _ in range(20):
+            await asyncio.sleep(0.001)
+
+    async def test_closed_room_stays_searchable(self):
+        room = await self.manager.open("stored-a")
+        room.state.commit(XML)
+        room.state.add_chat_message("frank", "invoice approved")
+        await self.index.search("invoice")
+        # Renamed just before closing, so the final diagram is re-read after close
+        room.state.commit(XML.replace("Review invoice", "Audit invoice"))
+        await self.close("stored-a")
+        page = await self.index.search("invoice")
+        assert {(result["kind"], result.get("name")) for result in page["results"]} == {
+            ("element", "Audit invoice"), ("chat", None)}
+
+        await self.manager.open("stored-a")
+        assert len((await self.index.search("invoice"))["results"]) == 2
+
+    async def test_stored_rooms_are_indexed_without_opening(self):
+        room = await self.manager.open("stored-b")
+        room.state.commit(XML)
+        room.state.add_log("frank updated diagram")
+        await self.close("stored-b")
+        await self.manager.persistence.flush()
+
+        fresh = SearchIndex(refresh_ms=0)
+        await fresh.index_stored(self.manager.persistence, owns=lambda room_id: room_id == "stored-b")
+        assert ids(await fresh.search("invoice")) == ["Activity_Review"]
+        assert [result["kind"] for result in (await fresh.search("frank"))["results"]] == ["activity"]
+        assert self.manager.get("stored-b") is None
+
+    async def test_rooms_without_storage_are_forgotten(self):
+        manager = RoomManager(None, self.index)
+        room = manager.get_or_create("ephemeral")
+        room.state.commit(XML)
+        manager.remove_room("ephemeral")
+        assert (await self.index.search("invoice"))["total"] == 0
+
+
+class TestSearchEndpoint:
+    def test_search_open_rooms(self):
+        room = room_manager.get_or_create("search-endpoint")
+        client = TestClient(app)
+        try:
+            room.state.xml = XML
+            room.state.add_chat_message("erin", "ship it")
+            response = client.get("/api/search", params={"q": "ship", "room": "search-endpoint"})
+            assert response.status_code == 200
+            assert {result["kind"] for result in response.json()["results"]} == {"element", "chat"}
+            assert client.get("/api/search", params={"q": "ship", "kind": "nope"}).status_code == 422
+        finally:
+            room_manager.remove_room("search-endpoint")
+        assert client.get("/api/search", params={"q": "ship", "room": "search-endpoint"}).json()["total"] == 0
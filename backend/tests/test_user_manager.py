@@ -44,3 +44,46 @@ class TestUserManager:
         assert "shweta" in users
         assert "mohit" in users
 
+
+    def test_second_connection_is_refcounted(self):
+        assert self.manager.add_user("sid1", "shweta")
+        assert not self.manager.add_user("sid2", "shweta")
+        version = self.manager.version
+        self.manager.remove_user("sid1")
+        # Still online through sid2, so nothing changed for the room
+        assert self.manager.is_online("shweta")
+        assert self.manager.version == version
+        self.manager.remove_user("sid2")
+        assert not self.manager.is_online("shweta")
+        assert self.manager.version == version + 1
+
+    def test_readding_a_sid_moves_it(self):
+        self.manager.add_user("sid1", "shweta")
+        self.manager.add_user("sid1", "mohit")
+        assert self.manager.list_users() == ["mohit"]
+        assert self.manager.get_sids_by_username("mohit") == ["sid1"]
+
+    def test_user_list_is_cached_until_membership_changes(self):
+        self.manager.add_user("sid1", "shweta")
+        users = self.manager.list_users()
+        self.manager.add_user("sid2", "shweta")
+        assert self.manager.list_users() is users
+        self.manager.add_user("sid3", "mohit")
+        assert self.manager.list_users() == ["shweta", "mohit"]
+
+    def test_delta_is_netted_per_window(self):
+        self.manager.add_user("sid1", "shweta")
+        assert self.manager.drain_delta() == {"joined": ["shweta"], "left": [], "base_version": 0, "version": 1}
+        assert self.manager.drain_delta() is None
+
+        self.manager.add_user("sid2", "mohit")
+        self.manager.remove_user("sid2")
+        self.manager.remove_user("sid1")
+        self.manager.add_user("sid3", "shweta")
+        self.manager.add_user("sid4", "asha")
+        # mohit came and went, shweta left and came back: only asha is news
+        assert self.manager.drain_delta() == {"joined": ["asha"], "left": [], "base_version": 1, "version": 6}
+
+    def test_remove_unknown_sid(self):
+        assert self.manager.remove_user("abcdefgh") == "User-abcde"
+        assert self.manager.version == 0
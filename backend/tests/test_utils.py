@@ -0,0 +1,62 @@
+import json
+from socketio import packet
+from app.utils import EncodedPayload, PayloadJSON, BroadcastCache
+
+
+class TestEncodedPayload:
+    def test_extend_matches_plain_encoding(self):
+        encoded = EncodedPayload({"xml": "<a/>", "revision": 3}).extend({"resync": True})
+        assert json.loads(encoded.text) == {"xml": "<a/>", "revision": 3, "resync": True}
+        assert encoded.value == {"xml": "<a/>", "revision": 3, "resync": True}
+
+    def test_extend_empty_object(self):
+        assert json.loads(EncodedPayload({}).extend({"users": ["alice"]}).text) == {"users": ["alice"]}
+
+
+class TestPayloadJSON:
+    def test_packet_splices_encoded_payload(self):
+        payload = {"xml": "<bpmn:definitions/>", "revision": 7}
+        plain = packet.Packet(packet.EVENT, data=["diagram_update", payload]).encode()
+        original = packet.Packet.json
+        packet.Packet.json = PayloadJSON
+        try:
+            spliced = packet.Packet(packet.EVENT, data=["diagram_update", EncodedPayload(payload)]).encode()
+        finally:
+            packet.Packet.json = original
+        assert spliced == plain
+
+    def test_nested_payload_falls_back_to_value(self):
+        message = {"method": "emit", "data": EncodedPayload({"revision": 1})}
+        assert json.loads(PayloadJSON.dumps(message)) == {"method": "emit", "data": {"revision": 1}}
+
+
+class TestBroadcastCache:
+    def setup_method(self):
+        self.cache = BroadcastCache(maxsize=2)
+
+    def test_encodes_once_per_revision(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {"revision": 1}
+
+        first = self.cache.encode("room", "diagram_update", 1, build)
+        assert self.cache.encode("room", "diagram_update", 1, build) is first
+        assert len(calls) == 1
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.encode("room", "diagram_update", 1, dict)
+        self.cache.encode("room", "diagram_update", 2, dict)
+        self.cache.encode("room", "diagram_update", 1, dict)
+        self.cache.encode("room", "diagram_update", 3, dict)
+        assert len(self.cache) == 2
+        self.cache.encode("room", "diagram_update", 1, dict)
+        assert self.cache.misses == 3
+
+    def test_discard_room(self):
+        self.cache.encode("a", "diagram_update", 1, dict)
+        self.cache.encode("b", "diagram_update", 1, dict)
+        self.cache.discard_room("a")
+        assert len(self.cache) == 1
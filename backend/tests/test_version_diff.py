@@ -0,0 +1,110 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.room_manager import Room, room_manager
+from app.services.version_diff import diff_indexes, element_index, version_indexes
+
+BEFORE = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL"
+                  xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI"
+                  xmlns:dc="http://www.omg.org/spec/DD/20100524/DC">
+  <bpmn:process id="Process_1">
+    <bpmn:startEvent id="Start"/>
+    <bpmn:task id="Review" name="Review order"/>
+    <bpmn:task id="Archive" name="Archive"/>
+    <bpmn:subProcess id="Sub"/>
+    <bpmn:endEvent id="End"/>
+    <bpmn:sequenceFlow id="f1" sourceRef="Start" targetRef="Review"/>
+    <bpmn:sequenceFlow id="f2" sourceRef="Review" targetRef="Archive"/>
+  </bpmn:process>
+  <bpmndi:BPMNDiagram id="Diagram_1">
+    <bpmndi:BPMNPlane id="Plane_1" bpmnElement="Process_1">
+      <bpmndi:BPMNShape id="Review_di" bpmnElement="Review"><dc:Bounds x="100" y="80" width="100" height="80"/></bpmndi:BPMNShape>
+    </bpmndi:BPMNPlane>
+  </bpmndi:BPMNDiagram>
+</bpmn:definitions>"""
+
+AFTER = (BEFORE
+         .replace('name="Review order"', 'name="Check order"')
+         .replace('x="100"', 'x="340"')
+         .replace('<bpmn:task id="Archive" name="Archive"/>', '')
+         .replace('<bpmn:subProcess id="Sub"/>', '<bpmn:subProcess id="Sub"><bpmn:task id="Ship"/></bpmn:subProcess>')
+         .replace('targetRef="Archive"', 'targetRef="End"'))
+
+
+def by_id(entries):
+    return {entry["id"]: entry for entry in entries}
+
+
+class TestDiffIndexes:
+    def setup_method(self):
+        self.diff = diff_indexes(element_index(BEFORE), element_index(AFTER))
+
+    def test_added_and_removed(self):
+        assert by_id(self.diff["added"]) == {"Ship": {"id": "Ship", "type": "task", "name": None}}
+        assert by_id(self.diff["removed"])["Archive"]["type"] == "task"
+
+    def test_renamed_and_moved(self):
+        assert self.diff["renamed"] == [{"id": "Review", "type": "task", "name": ["Review order", "Check order"]}]
+        assert self.diff["moved"] == [{"id": "Review", "type": "task", "name": "Check order", "layout": True}]
+
+    def test_reconnected_flow(self):
+        flow = by_id(self.diff["changed"])["f2"]
+        assert flow["target"] == ["Archive", "End"]
+        assert "Review" not in by_id(self.diff["changed"])
+
+    def test_rename_and_retarget_in_one_version(self):
+        xml = AFTER.replace('<bpmn:sequenceFlow id="f2" sourceRef="Review" targetRef="End"/>',
+                            '<bpmn:sequenceFlow id="f2" name="done" sourceRef="Review" targetRef="Start"/>')
+        diff = diff_indexes(element_index(AFTER), element_index(xml))
+        assert diff["renamed"] == [{"id": "f2", "type": "sequenceFlow", "name": [None, "done"]}]
+        assert diff["changed"] == [{"id": "f2", "type": "sequenceFlow", "name": "done", "target": ["End", "Start"]}]
+
+    def test_reparented_element(self):
+        xml = AFTER.replace('<bpmn:task id="Ship"/></bpmn:subProcess>', '</bpmn:subProcess><bpmn:task id="Ship"/>')
+        diff = diff_indexes(element_index(AFTER), element_index(xml))
+        assert diff["moved"] == [{"id": "Ship", "type": "task", "name": None, "parent": ["Sub", "Process_1"]}]
+
+    def test_identical_versions(self):
+        diff = diff_indexes(element_index(BEFORE), element_index(BEFORE))
+        assert not any(diff.values())
+
+
+class TestRoomVersionDiff:
+    def setup_method(self):
+        version_indexes.clear()
+        self.room = Room("diff-room")
+        self.room.state.commit(BEFORE, "alice", save_version=True)
+        self.room.state.commit(AFTER, "bob", save_version=True)
+
+    async def test_indexes_are_cached_by_content(self):
+        diff = await self.room.version_diff(1, 2)
+        assert (diff["from"], diff["to"]) == (1, 2)
+        assert len(version_indexes) == 2
+        assert (await self.room.version_diff(2, 1))["added"] == diff["removed"]
+        assert len(version_indexes) == 2
+
+    async def test_against_live_diagram(self):
+        diff = await self.room.version_diff(2)
+        assert diff["to"] is None and diff["revision"] == self.room.state.revision
+        assert not any(diff[key] for key in ("added", "removed", "renamed", "moved", "changed"))
+        assert (await self.room.version_diff(1))["renamed"][0]["id"] == "Review"
+
+    async def test_missing_and_invalid(self):
+        assert await self.room.version_diff(1, 99) is None
+        self.room.state.commit("<bpmn:definitions", "carol", save_version=True)
+        assert "error" in await self.room.version_diff(1, 3)
+
+
+class TestVersionDiffEndpoint:
+    def test_diff_endpoint(self):
+        room = room_manager.get_or_create("diff-endpoint")
+        client = TestClient(app)
+        try:
+            room.state.commit(BEFORE, "alice", save_version=True)
+            room.state.commit(AFTER, "bob", save_version=True)
+            response = client.get("/api/rooms/diff-endpoint/versions/1/diff", params={"to": 2})
+            assert response.status_code == 200
+            assert [entry["id"] for entry in response.json()["renamed"]] == ["Review"]
+            assert client.get("/api/rooms/diff-endpoint/versions/7/diff").status_code == 404
+        finally:
+            room_manager.remove_room("diff-endpoint")
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from app.services.version_store import VersionStore
+
+
+def make_xml(n, label="Task"):
+    tasks = "\n".join(f'    <bpmn:task id="Task_{i}" name="{label} {i}"/>' for i in range(n))
+    return f"<bpmn:definitions>\n  <bpmn:process id=\"Process_1\">\n{tasks}\n  </bpmn:process>\n</bpmn:definitions>\n"
+
+
+class TestVersionStore:
+    def setup_method(self):
+        self.store = VersionStore(max_count=50, max_bytes=0, max_age_seconds=0, keyframe_interval=4)
+
+    def test_materialize_every_version(self):
+        snapshots = []
+        for i in range(10):
+            xml = make_xml(20 + i, label=f"Rev{i % 3}")
+            snapshots.append(xml)
+            self.store.save(xml)
+        versions = self.store.list(0, 10)["versions"]
+        assert [v["version"] for v in versions] == list(range(10, 0, -1))
+        for number, xml in enumerate(snapshots, start=1):
+            assert self.store.get(number)["xml"] == xml
+
+    def test_identical_save_is_deduplicated(self):
+        xml = make_xml(5)
+        assert self.store.save(xml) is not None
+        assert self.store.save(xml) is None
+        assert len(self.store) == 1
+
+    def test_list_is_paginated_metadata(self):
+        for i in range(5):
+            self.store.save(make_xml(i + 1))
+        page = self.store.list(offset=1, limit=2)
+        assert page["total"] == 5
+        assert [v["version"] for v in page["versions"]] == [4, 3]
+        assert all("xml" not in v for v in page["versions"])
+
+    def test_deltas_are_smaller_than_snapshots(self):
+        self.store.save(make_xml(500))
+        keyframe_bytes = self.store.nbytes
+        self.store.save(make_xml(501))
+        assert self.store.nbytes - keyframe_bytes < keyframe_bytes / 10
+
+    def test_count_retention_keeps_materializable_head(self):
+        store = VersionStore(max_count=3, max_bytes=0, max_age_seconds=0, keyframe_interval=10)
+        snapshots = [make_xml(i + 1) for i in range(6)]
+        for xml in snapshots:
+            store.save(xml)
+        assert len(store) == 3
+        assert store.get(1) is None
+        for number in (4, 5, 6):
+            assert store.get(number)["xml"] == snapshots[number - 1]
+
+    def test_byte_retention(self):
+        store = VersionStore(max_count=0, max_bytes=2000, max_age_seconds=0, keyframe_interval=1)
+        for i in range(20):
+            store.save(make_xml(50 + i))
+        assert store.nbytes <= 2000 or len(store) == 1
+        assert store.get(20)["xml"] == make_xml(69)
+
+    def test_missing_version(self):
+        assert self.store.get(42) is None
+
+
+class TestPooledEncoding:
+    def setup_method(self):
+        self.calls = []
+        self.store = VersionStore(max_count=3, max_bytes=0, max_age_seconds=0, keyframe_interval=10)
+        self.store.attach(self.run)
+
+    async def run(self, fn, *args):
+        self.calls.append(fn.__name__)
+        await asyncio.sleep(0)
+        return fn(*args)
+
+    async def settle(self):
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def test_versions_are_readable_while_encoding(self):
+        snapshots = [make_xml(10 + i) for i in range(3)]
+        for xml in snapshots:
+            assert self.store.save(xml) is not None
+        assert self.store.save(snapshots[-1]) is None
+        assert self.store.nbytes == 0
+        assert [self.store.get(n)["xml"] for n in (1, 2, 3)] == snapshots
+        await self.settle()
+        assert self.calls == ["encode_version"] * 3
+        assert self.store.nbytes > 0
+        assert [self.store.get(n)["xml"] for n in (1, 2, 3)] == snapshots
+
+    async def test_delta_whose_base_is_evicted_becomes_a_keyframe(self):
+        snapshots = [make_xml(10 + i) for i in range(5)]
+        for xml in snapshots:
+            self.store.save(xml)
+        exported = self.store.export()
+        await self.settle()
+        assert len(self.store) == 3
+        assert self.store.chain(3)[1:] == (self.store.record(3).data, [])
+        assert [self.store.get(n)["xml"] for n in (3, 4, 5)] == snapshots[2:]
+
+        restored = VersionStore(max_count=5, max_bytes=0, max_age_seconds=0)
+        restored.restore(exported)
+        assert [restored.get(n)["xml"] for n in (1, 2, 3, 4, 5)] == snapshots
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import pytest
+from app.services.workers import WorkerPool, WorkerPoolSaturated
+
+
+def blocking_job(event, value):
+    event.wait(5)
+    return value
+
+
+class TestWorkerPool:
+    async def test_runs_off_the_event_loop(self):
+        pool = WorkerPool(kind="thread", max_workers=2, max_queue=0)
+        try:
+            caller = threading.get_ident()
+            worker = await pool.run(threading.get_ident)
+            assert worker != caller
+        finally:
+            pool.shutdown()
+
+    async def test_inline_mode(self):
+        pool = WorkerPool(kind="inline", max_workers=1, max_queue=0)
+        assert await pool.run(sum, [1, 2, 3]) == 6
+
+    async def test_rejects_when_saturated(self):
+        pool = WorkerPool(kind="thread", max_workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            jobs = [asyncio.create_task(pool.run(blocking_job, release, i)) for i in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(WorkerPoolSaturated):
+                await pool.run(blocking_job, release, 99)
+            release.set()
+            assert await asyncio.gather(*jobs) == [0, 1]
+            assert pool.pending == 0
+        finally:
+            release.set()
+            pool.shutdown()
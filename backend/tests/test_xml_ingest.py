@@ -0,0 +1,145 @@
+import pytest
+import xml.etree.ElementTree as ET
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.diagram_model import DiagramModel
+from app.services.diagram_patch import PatchError, parse_fragment
+from app.services.diagram_summary import ElementCounter, _analyze
+from app.services.xml_ingest import BodyLimitMiddleware, StreamingParser, XMLRejected, XMLTooLarge, check_prolog, parse_tree
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">
+  <bpmn:process id="Process_1" name="Orders">
+    <bpmn:startEvent id="StartEvent_1"/>
+    <bpmn:subProcess id="Sub_1"><bpmn:task id="Task_1" name="Pick élément"/></bpmn:subProcess>
+    <bpmn:endEvent id="EndEvent_1"/>
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Sub_1"/>
+  </bpmn:process>
+</bpmn:definitions>"""
+
+LAUGHS = """<?xml version="1.0"?>
+<!DOCTYPE lolz [<!ENTITY lol "lol"><!ENTITY lol2 "&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;">]>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">&lol2;</bpmn:definitions>"""
+
+
+def nested(depth: int) -> str:
+    return "<a>" * depth + "</a>" * depth
+
+
+def stream(xml: bytes, size: int):
+    counter = ElementCounter()
+    parser = StreamingParser(counter)
+    for i in range(0, len(xml), size):
+        parser.feed(xml[i:i + size])
+    parser.close()
+    return counter.counts()
+
+
+class TestStreamingParser:
+    def test_chunked_bytes_match_whole_document(self):
+        whole = stream(XML.encode("utf-8"), len(XML) * 4)
+        # Chunk boundaries fall inside tags and multi-byte characters
+        assert stream(XML.encode("utf-8"), 7) == whole
+        assert whole[0] == 1 and whole[1] == "Orders"
+        assert whole[2] == {"startEvent": 1, "task": 1, "endEvent": 1}
+        assert whole[3] == 1
+
+    def test_dtd_and_entities_are_refused(self):
+        with pytest.raises(XMLRejected):
+            StreamingParser(ElementCounter()).feed(LAUGHS)
+        with pytest.raises(XMLRejected):
+            parse_tree(LAUGHS)
+        assert _analyze(LAUGHS)["error"]
+
+    def test_depth_limit(self):
+        with pytest.raises(XMLRejected):
+            StreamingParser(ElementCounter(), max_depth=10).feed(nested(11))
+        with pytest.raises(XMLRejected):
+            parse_tree(nested(11), max_depth=10)
+        root, _ = parse_tree(nested(10), max_depth=10)
+        assert root.tag == "a"
+
+    def test_size_limit_stops_before_parsing(self):
+        parser = StreamingParser(ElementCounter(), max_bytes=100)
+        parser.feed(b"<a>" + b" " * 90)
+        with pytest.raises(XMLTooLarge):
+            parser.feed(b" " * 20)
+        with pytest.raises(XMLTooLarge):
+            parse_tree(XML, max_bytes=100)
+
+    def test_malformed_input(self):
+        parser = StreamingParser(ElementCounter())
+        parser.feed("<a><b></a>"[:6])
+        with pytest.raises(ET.ParseError):
+            parser.feed("</a>")
+            parser.close()
+
+    def test_tree_paths_are_guarded(self):
+        assert not DiagramModel.from_xml(LAUGHS).valid
+        with pytest.raises(PatchError):
+            parse_fragment(nested(300), {})
+
+    def test_prolog_check(self):
+        check_prolog(XML)
+        check_prolog("")
+        with pytest.raises(XMLRejected):
+            check_prolog(LAUGHS)
+        # Comments and processing instructions in the prolog are skipped, even with markup inside
+        with pytest.raises(XMLRejected):
+            check_prolog('<?xml version="1.0"?><!-- <a> --><?pi x?>\n<!doctype x><x/>')
+        # The body is never scanned
+        check_prolog(XML.replace("</bpmn:process>", "</bpmn:process><!DOCTYPE late>"))
+        with pytest.raises(XMLTooLarge):
+            check_prolog(XML, max_bytes=16)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+class TestStreamingSummaryEndpoint:
+    def test_summary_from_raw_body(self, client):
+        chunks = (XML.encode("utf-8")[i:i + 16] for i in range(0, len(XML.encode("utf-8")), 16))
+        response = client.post("/api/summary/stream", content=chunks, headers={"content-type": "application/xml"})
+        assert response.status_code == 200
+        # Counts only: the graph checks need every node, which this path does not keep
+        expected = _analyze(XML)
+        del expected["graph"]
+        assert response.json() == expected
+
+    def test_rejections(self, client, monkeypatch):
+        response = client.post("/api/summary/stream", content=LAUGHS)
+        assert response.json()["error"]
+        monkeypatch.setattr("app.config.MAX_XML_BYTES", 64)
+        assert client.post("/api/summary/stream", content=XML).status_code == 413
+        assert client.post("/api/summary", json={"xml": XML}).status_code == 413
+
+    def test_rejection_carries_cors_headers(self, client, monkeypatch):
+        monkeypatch.setattr("app.config.MAX_REQUEST_BYTES", 64)
+        # Rebuilt with the lower limit; restored after the test
+        monkeypatch.setattr(app, "middleware_stack", None)
+        response = client.post("/api/summary", json={"xml": XML}, headers={"origin": "http://localhost:5173"})
+        assert response.status_code == 413
+        assert response.headers["access-control-allow-origin"]
+
+
+class TestBodyLimitMiddleware:
+    def setup_method(self):
+        inner = FastAPI()
+
+        @inner.post("/echo")
+        async def echo(request: Request):
+            return {"size": len(await request.body())}
+
+        inner.add_middleware(BodyLimitMiddleware, max_bytes=32)
+        self.client = TestClient(inner)
+
+    def test_declared_length_over_limit(self):
+        assert self.client.post("/echo", content=b"x" * 33).status_code == 413
+        assert self.client.post("/echo", content=b"x" * 32).json() == {"size": 32}
+
+    def test_chunked_body_over_limit(self):
+        response = self.client.post("/echo", content=(b"x" * 8 for _ in range(5)))
+        assert response.status_code == 413
@@ -56,12 +56,16 @@ const DiagramCanvas: React.FC = () => {
       setTimeout(() => updateEditingMarkers(), 100);
     };
 
+    const onCursorBatch = (data: SocketEvents["cursor_batch"]) => {
+      data?.editing?.forEach(onEditingUpdate);
+    };
+
     const attachListeners = () => {
       if (socket) {
         socket.off(SOCKET_EVENTS.DIAGRAM_UPDATE, onDiagramUpdate);
-        socket.off(SOCKET_EVENTS.EDITING_UPDATE, onEditingUpdate);
+        socket.off(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
         socket.on(SOCKET_EVENTS.DIAGRAM_UPDATE, onDiagramUpdate);
-        socket.on(SOCKET_EVENTS.EDITING_UPDATE, onEditingUpdate);
+        socket.on(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
       }
     };
 
@@ -73,7 +77,7 @@ const DiagramCanvas: React.FC = () => {
     return () => {
       if (socket) {
         socket.off(SOCKET_EVENTS.DIAGRAM_UPDATE, onDiagramUpdate);
-        socket.off(SOCKET_EVENTS.EDITING_UPDATE, onEditingUpdate);
+        socket.off(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
       }
       window.removeEventListener("socket-ready", handleSocketReady);
     };
@@ -20,8 +20,10 @@ export const SOCKET_EVENTS = {
   CONNECT: "connect",
   DISCONNECT: "disconnect",
   USER_UPDATE: "user_update",
+  USERS_DELTA: "users_delta",
   GET_USERS: "get_users",
   CURSOR_UPDATE: "cursor_update",
+  CURSOR_BATCH: "cursor_batch",
   CURSOR_MOVE: "cursor_move",
   DIAGRAM_UPDATE: "diagram_update",
   UPDATE_DIAGRAM: "update_diagram",
@@ -33,6 +35,9 @@ export const SOCKET_EVENTS = {
   USER_EDITING: "user_editing",
   LOCKS_UPDATE: "locks_update",
   ACTIVITY_LOG: "activity_log",
+  ACTIVITY_LOG_BATCH: "activity_log_batch",
+  INITIAL_STATE: "initial_state",
+  DIFF_VERSIONS: "diff_versions",
 } as const;
 
 // Breakpoints
@@ -104,8 +104,8 @@ export const useRemoteCursors = ({ containerRef }: UseRemoteCursorsOptions) => {
   useEffect(() => {
     if (!containerRef.current || !socket || !username) return;
 
-    const onCursorUpdate = (data: SocketEvents["cursor_update"]) => {
-      updateRemoteCursor(data);
+    const onCursorBatch = (data: SocketEvents["cursor_batch"]) => {
+      data?.cursors?.forEach(updateRemoteCursor);
     };
 
     const sendInitialStatus = () => {
@@ -130,9 +130,9 @@ export const useRemoteCursors = ({ containerRef }: UseRemoteCursorsOptions) => {
 
     const attachListeners = () => {
       if (socket) {
-        socket.off(SOCKET_EVENTS.CURSOR_UPDATE, onCursorUpdate);
+        socket.off(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
         socket.off(SOCKET_EVENTS.USER_UPDATE, onUserUpdate);
-        socket.on(SOCKET_EVENTS.CURSOR_UPDATE, onCursorUpdate);
+        socket.on(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
         socket.on(SOCKET_EVENTS.USER_UPDATE, onUserUpdate);
       }
     };
@@ -154,7 +154,7 @@ export const useRemoteCursors = ({ containerRef }: UseRemoteCursorsOptions) => {
       window.removeEventListener("socket-ready", handleSocketReady);
       
       if (socket) {
-        socket.off(SOCKET_EVENTS.CURSOR_UPDATE, onCursorUpdate);
+        socket.off(SOCKET_EVENTS.CURSOR_BATCH, onCursorBatch);
         socket.off(SOCKET_EVENTS.USER_UPDATE, onUserUpdate);
       }
       
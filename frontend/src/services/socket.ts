@@ -1,29 +1,99 @@
 import io from "socket.io-client";
+import { SOCKET_EVENTS } from "@/constants";
+import type { SocketEvents } from "@/types/socket";
 
 export let socket: ReturnType<typeof io> | null = null;
 
-export function initSocket(username: string) {
+let pendingInitialState: SocketEvents["initial_state"] | null = null;
+let listenersReady = false;
+
+// Room members as of usersVersion; users_delta events are applied on top of it
+let users: string[] = [];
+let usersVersion = -1;
+
+const dispatch = (event: string, payload: unknown) => {
+  socket?.listeners(event).forEach((listener) => listener(payload));
+};
+
+function setUsers(list: string[], version: number) {
+  users = list;
+  usersVersion = version;
+  dispatch(SOCKET_EVENTS.USER_UPDATE, users);
+}
+
+function applyUsersDelta(delta: SocketEvents["users_delta"]) {
+  if (delta.version <= usersVersion) return;
+  if (delta.base_version !== usersVersion) {
+    // A delta was missed (e.g. shed while this client lagged); fetch the whole list once
+    socket?.emit(SOCKET_EVENTS.GET_USERS, (reply: { users: string[]; version: number }) => {
+      if (reply && reply.version > usersVersion) setUsers(reply.users, reply.version);
+    });
+    return;
+  }
+  const left = new Set(delta.left);
+  setUsers([...users.filter((name) => !left.has(name)), ...delta.joined], delta.version);
+}
+
+// The join snapshot arrives as one event; fan it out to the per-feature listeners
+function applyInitialState(state: SocketEvents["initial_state"]) {
+  setUsers(state.users, state.users_version);
+  dispatch(SOCKET_EVENTS.DIAGRAM_UPDATE, { xml: state.xml, revision: state.revision });
+  dispatch(SOCKET_EVENTS.LOCKS_UPDATE, state.locks);
+  dispatch(SOCKET_EVENTS.CHAT_HISTORY, state.chat);
+  dispatch(SOCKET_EVENTS.ACTIVITY_LOG, state.logs);
+}
+
+const DEFAULT_SERVER_URL = "http://127.0.0.1:8000";
+
+export function initSocket(username: string, serverUrl: string = DEFAULT_SERVER_URL) {
   if (socket?.connected) {
     socket.disconnect();
     socket = null;
   }
   
-  socket = io("http://127.0.0.1:8000", {
+  listenersReady = false;
+  pendingInitialState = null;
+  users = [];
+  usersVersion = -1;
+  socket = io(serverUrl, {
     transports: ["websocket"],
     auth: { username },
     query: { username },
   });
 
+  // Sent during the handshake, so it is delivered before the "connect" listeners attach
+  socket.on(SOCKET_EVENTS.INITIAL_STATE, (state: SocketEvents["initial_state"]) => {
+    if (listenersReady) {
+      applyInitialState(state);
+    } else {
+      pendingInitialState = state;
+    }
+  });
+
+  socket.on(SOCKET_EVENTS.USERS_DELTA, (delta: SocketEvents["users_delta"]) => {
+    if (listenersReady) applyUsersDelta(delta);
+  });
+
   socket.on("connect", () => {
     window.dispatchEvent(new CustomEvent("socket-ready"));
-    setTimeout(() => {
-      if (socket?.connected) {
-        socket.emit("get_users");
-      }
-    }, 200);
+    listenersReady = true;
+    if (pendingInitialState) {
+      applyInitialState(pendingInitialState);
+      pendingInitialState = null;
+    }
+  });
+
+  // In cluster mode a node refuses rooms it does not own and names the owner
+  socket.on("connect_error", (err: Error & { data?: { redirect?: string } }) => {
+    const redirect = err.data?.redirect;
+    if (redirect && redirect !== serverUrl) {
+      socket?.close();
+      initSocket(username, redirect);
+    }
   });
 
   socket.on("disconnect", () => {
+    listenersReady = false;
     socket = null;
   });
 
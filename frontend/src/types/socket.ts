@@ -2,42 +2,110 @@
 export interface SocketEvents {
   // Client -> Server
   update_diagram: { xml: string };
+  patch_diagram: DiagramPatch & { base_revision: number };
   sync_diagram: void;
   cursor_move: { x: number; y: number };
   user_editing: { element_id: string | null };
   send_chat: { message: string };
   get_users: void;
-  get_activity_log: void;
+  get_activity_log: void | HistoryQuery;
+  get_chat_history: HistoryQuery;
   get_versions: void;
+  diff_versions: { version: number; to?: number | null };
   lock_element: { element_id: string };
   unlock_element: { element_id: string };
 
   // Server -> Client
-  diagram_update: { xml: string };
+  diagram_update: { xml: string; revision?: number; resync?: boolean };
+  diagram_patch: DiagramPatch & { username: string; base_revision: number; revision: number };
   cursor_update: { username: string; x: number; y: number };
   editing_update: { username: string; element_id: string | null };
+  cursor_batch: {
+    cursors: SocketEvents["cursor_update"][];
+    editing: SocketEvents["editing_update"][];
+  };
   receive_chat: ChatMessage;
   chat_history: ChatMessage[];
   user_update: User[] | string[];
-  locks_update: Record<string, string>;
+  users_delta: { joined: string[]; left: string[]; base_version: number; version: number };
+  locks_update: { epoch: number; locks: Record<string, string> };
   element_locked: { element_id: string; locked_by: string };
   element_unlocked: { element_id: string };
   activity_log: ActivityLog[];
-  activity_log_update: ActivityLog;
+  activity_log_batch: ActivityLog[];
   diagram_versions: unknown;
+  initial_state: {
+    room: string;
+    revision: number;
+    xml: string;
+    locks: SocketEvents["locks_update"];
+    chat: ChatMessage[];
+    logs: ActivityLog[];
+    users: string[];
+    users_version: number;
+  };
+}
+
+export interface ElementPatch {
+  id: string;
+  xml: string;
+  parent_id?: string | null;
+}
+
+export interface DiagramPatch {
+  added: ElementPatch[];
+  changed: ElementPatch[];
+  removed: string[];
+}
+
+export interface HistoryQuery {
+  after?: number;
+  limit?: number;
+}
+
+export interface HistoryPage<T> {
+  after: number;
+  first_seq: number;
+  last_seq: number;
+  entries: T[];
 }
 
 export interface ChatMessage {
+  seq?: number;
   username: string;
   message: string;
   timestamp?: string;
 }
 
 export interface ActivityLog {
+  seq?: number;
   timestamp: string;
   message: string;
 }
 
+export interface ElementDiffEntry {
+  id: string;
+  type: string | [string, string];
+  name: string | null | [string | null, string | null];
+  source?: string | null | [string | null, string | null];
+  target?: string | null | [string | null, string | null];
+  parent?: [string | null, string | null];
+  lane?: [string | null, string | null];
+  layout?: boolean;
+}
+
+export interface VersionDiff {
+  from: number;
+  to: number | null;
+  revision?: number;
+  added: ElementDiffEntry[];
+  removed: ElementDiffEntry[];
+  renamed: ElementDiffEntry[];
+  moved: ElementDiffEntry[];
+  changed: ElementDiffEntry[];
+  error?: string;
+}
+
 export interface User {
   username: string;
 }